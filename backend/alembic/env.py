@@ -1,4 +1,3 @@
-import sys
 import os
 from logging.config import fileConfig
 
@@ -7,24 +6,11 @@ from sqlalchemy import pool
 
 from alembic import context
 
-# ===== КРИТИЧЕСКИ ВАЖНО: Добавляем пути к модулям =====
-# Эта часть исправляет ошибку "No module named 'app.database'"
-sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))  # добавляем /app/alembic
-sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))  # добавляем /app
-
-# ===== ИМПОРТ МОДЕЛЕЙ =====
-# Теперь импорт должен работать
-try:
-    from app.database import Base
-    # ВНИМАНИЕ: Здесь нужно импортировать ВСЕ модели вашего приложения,
-    # чтобы Alembic их "увидел". Пример:
-    # from app.models.user import User
-    # from app.models.plant import Plant
-    # from app.models.farm import Farm
-except ImportError as e:
-    print(f"ОШИБКА ИМПОРТА: {e}")
-    print(f"Текущий sys.path: {sys.path}")
-    raise
+# Каталог backend попадает в sys.path через prepend_sys_path в alembic.ini.
+# Модели нужны только ради metadata для автогенерации; приложение этот
+# файл не импортирует, и на старт сервиса он не влияет
+from app.database import Base, get_database_url
+from app import models  # noqa: F401 - регистрируем модели в metadata
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -44,15 +30,15 @@ target_metadata = Base.metadata
 def get_url():
     """Получаем URL базы данных из переменных окружения или alembic.ini"""
 
-    # ПРИОРИТЕТ 1: Переменная окружения DATABASE_URL (используется на Render)
-    database_url = os.getenv("DATABASE_URL")
+    # ПРИОРИТЕТ 0: -x url=... (python -m app.shards upgrade обходит так все шарды)
+    url = context.get_x_argument(as_dictionary=True).get("url")
+    if url:
+        return url
 
-    if database_url:
-        # Важно для PostgreSQL на Render: заменяем postgres:// на postgresql://
-        if database_url.startswith("postgres://"):
-            database_url = database_url.replace("postgres://", "postgresql://", 1)
-        print(f"Используется DATABASE_URL из переменных окружения")
-        return database_url
+    # ПРИОРИТЕТ 1: Переменная окружения DATABASE_URL (используется на Render),
+    # postgres:// заменяется на postgresql:// так же, как в приложении
+    if os.getenv("DATABASE_URL"):
+        return get_database_url()
 
     # ПРИОРИТЕТ 2: Чтение из alembic.ini
     return config.get_main_option("sqlalchemy.url")
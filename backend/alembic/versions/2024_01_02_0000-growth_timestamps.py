@@ -0,0 +1,26 @@
+"""growth timestamps
+
+Revision ID: growth_timestamps
+Revises: initial
+Create Date: 2024-01-02 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = 'growth_timestamps'
+down_revision = 'initial'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Стадия теперь вычисляется из временных меток при чтении
+    op.add_column('farm_cells', sa.Column('watered_at', sa.Float(), nullable=True))
+    op.add_column('farm_cells', sa.Column('fertilized_at', sa.Float(), nullable=True))
+    op.add_column('farm_cells', sa.Column('growth_bonus', sa.Float(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    op.drop_column('farm_cells', 'growth_bonus')
+    op.drop_column('farm_cells', 'fertilized_at')
+    op.drop_column('farm_cells', 'watered_at')
@@ -0,0 +1,22 @@
+"""state revision
+
+Revision ID: state_revision
+Revises: growth_timestamps
+Create Date: 2024-01-03 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = 'state_revision'
+down_revision = 'growth_timestamps'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Монотонная ревизия состояния игрока для ответов-дельт
+    op.add_column('players', sa.Column('revision', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    op.drop_column('players', 'revision')
@@ -0,0 +1,22 @@
+"""farm grid blob
+
+Revision ID: farm_grid
+Revises: state_revision
+Create Date: 2024-01-04 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = 'farm_grid'
+down_revision = 'state_revision'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Ферма целиком в одном blob; farm_cells остаются для игроков без него
+    op.add_column('players', sa.Column('farm_grid', sa.LargeBinary(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('players', 'farm_grid')
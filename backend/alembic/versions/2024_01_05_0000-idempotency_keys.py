@@ -0,0 +1,36 @@
+"""idempotency keys
+
+Revision ID: idempotency_keys
+Revises: farm_grid
+Create Date: 2024-01-05 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = 'idempotency_keys'
+down_revision = 'farm_grid'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Ответы на запросы с Idempotency-Key: повтор не применяет действие второй раз
+    op.create_table(
+        'idempotency_keys',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('player_id', sa.Integer(), nullable=False),
+        sa.Column('key', sa.String(), nullable=False),
+        sa.Column('response', sa.JSON(), nullable=True),
+        sa.Column('created_at', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['player_id'], ['players.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('player_id', 'key', name='uq_player_idempotency_key'),
+    )
+    op.create_index(op.f('ix_idempotency_keys_id'), 'idempotency_keys', ['id'], unique=False)
+    op.create_index(op.f('ix_idempotency_keys_player_id'), 'idempotency_keys', ['player_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_idempotency_keys_player_id'), table_name='idempotency_keys')
+    op.drop_index(op.f('ix_idempotency_keys_id'), table_name='idempotency_keys')
+    op.drop_table('idempotency_keys')
@@ -0,0 +1,27 @@
+"""achievement stats
+
+Revision ID: achievement_stats
+Revises: idempotency_keys
+Create Date: 2024-01-06 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = 'achievement_stats'
+down_revision = 'idempotency_keys'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Счетчики событий для достижений; NULL - посчитать по инвентарю и уровню при загрузке
+    op.add_column('players', sa.Column('stats', sa.JSON(), nullable=True))
+    # Достижение открывается один раз: повторная пакетная запись его пропускает
+    with op.batch_alter_table('achievements') as batch_op:
+        batch_op.create_unique_constraint('uq_player_achievement', ['player_level_id', 'name'])
+
+
+def downgrade():
+    with op.batch_alter_table('achievements') as batch_op:
+        batch_op.drop_constraint('uq_player_achievement', type_='unique')
+    op.drop_column('players', 'stats')
@@ -0,0 +1,21 @@
+"""idempotency keys created_at index
+
+Revision ID: idempotency_keys_created_at
+Revises: achievement_stats
+Create Date: 2024-01-07 00:00:00.000000
+"""
+from alembic import op
+
+revision = 'idempotency_keys_created_at'
+down_revision = 'achievement_stats'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Ночная задача удаляет ключи старше суток по created_at
+    op.create_index(op.f('ix_idempotency_keys_created_at'), 'idempotency_keys', ['created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_idempotency_keys_created_at'), table_name='idempotency_keys')
@@ -0,0 +1,261 @@
+"""Достижения по событиям игры.
+
+Действия сообщают о событиях (посадка, сбор, выручка, новый уровень), и
+каждое событие увеличивает счетчики игрока в GameState.stats. Правила при
+импорте раскладываются по счетчикам и сортируются по порогу, поэтому
+событие проверяет только правила своих счетчиков, бинарным поиском по
+порогу. Открытое достижение сразу начисляет награду в состоянии; строки
+achievements пишутся вместе с состоянием одной транзакцией (app/crud/bulk.py).
+
+Для игроков, которые не заходят, и после добавления правил:
+
+    python -m app.achievements --workers 4
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from app.schemas import GameState
+from app.state_cache import write_behind
+
+logger = logging.getLogger(__name__)
+
+EVENTS = ("plant", "harvest", "coins_earned", "level")
+# Для этих событий счетчик - достигнутое значение, а не сумма
+GAUGES = frozenset({"level"})
+
+
+class Rule(NamedTuple):
+    name: str
+    description: str
+    event: str
+    threshold: int
+    # Культура для счетчика по одной культуре, None - по всем
+    key: Optional[str] = None
+    reward: Dict[str, int] = {}
+
+    @property
+    def counter(self) -> str:
+        return counter_name(self.event, self.key)
+
+
+def counter_name(event: str, key: Optional[str] = None) -> str:
+    return event if key is None else f"{event}:{key}"
+
+
+RULES: Tuple[Rule, ...] = (
+    Rule("first_seed", "Посадить первое растение", "plant", 1, reward={"coins": 20}),
+    Rule("planter_100", "Посадить 100 растений", "plant", 100, reward={"coins": 300}),
+    Rule("first_harvest", "Собрать первый урожай", "harvest", 1, reward={"coins": 50}),
+    Rule("harvest_100", "Собрать 100 растений", "harvest", 100, reward={"coins": 500}),
+    Rule("harvest_1000", "Собрать 1000 растений", "harvest", 1000, reward={"diamonds": 5}),
+    Rule("carrot_lover", "Собрать 50 морковок", "harvest", 50, key="carrot", reward={"coins": 200}),
+    Rule("tomato_master", "Собрать 50 помидоров", "harvest", 50, key="tomato", reward={"coins": 300}),
+    Rule("strawberry_fields", "Собрать 50 клубник", "harvest", 50, key="strawberry", reward={"diamonds": 1}),
+    Rule("pumpkin_king", "Собрать 25 тыкв", "harvest", 25, key="pumpkin", reward={"diamonds": 2}),
+    Rule("merchant", "Заработать на продажах 1000 монет", "coins_earned", 1000, reward={"coins": 100}),
+    Rule("tycoon", "Заработать на продажах 100000 монет", "coins_earned", 100000, reward={"diamonds": 10}),
+    Rule("level_5", "Достичь 5 уровня", "level", 5, reward={"coins": 250}),
+    Rule("level_10", "Достичь 10 уровня", "level", 10, reward={"diamonds": 2}),
+    Rule("level_25", "Достичь 25 уровня", "level", 25, reward={"diamonds": 5}),
+    Rule("level_50", "Достичь 50 уровня", "level", 50, reward={"diamonds": 10}),
+)
+
+
+class AchievementEngine:
+    """Правила, разложенные по счетчикам: счетчик -> (пороги, правила) по возрастанию порога"""
+
+    def __init__(self, rules: Iterable[Rule]):
+        self.rules: Dict[str, Rule] = {}
+        by_counter: Dict[str, List[Rule]] = {}
+        for rule in rules:
+            if rule.event not in EVENTS:
+                raise ValueError(f"Unknown event {rule.event} in achievement {rule.name}")
+            if rule.name in self.rules:
+                raise ValueError(f"Duplicate achievement {rule.name}")
+            self.rules[rule.name] = rule
+            by_counter.setdefault(rule.counter, []).append(rule)
+        self._index: Dict[str, Tuple[List[int], List[Rule]]] = {}
+        for counter, group in by_counter.items():
+            group.sort(key=lambda rule: rule.threshold)
+            self._index[counter] = ([rule.threshold for rule in group], group)
+
+    def _reached(self, counter: str, value: int, unlocked) -> List[Rule]:
+        entry = self._index.get(counter)
+        if entry is None:
+            return []
+        thresholds, group = entry
+        return [rule for rule in group[:bisect_right(thresholds, value)] if rule.name not in unlocked]
+
+    def pending(self, stats: Dict[str, int], unlocked) -> List[Rule]:
+        """Правила, условия которых выполнены по счетчикам stats, но еще не открытые"""
+        return [rule for counter in self._index for rule in self._reached(counter, stats.get(counter, 0), unlocked)]
+
+    def unlock(self, state: GameState, rules: Sequence[Rule], now: Optional[float] = None) -> List[Rule]:
+        """Открыть достижения и начислить награды"""
+        if now is None:
+            now = time.time()
+        for rule in rules:
+            state.achievements[rule.name] = now
+            state.money += rule.reward.get("coins", 0)
+            state.diamonds += rule.reward.get("diamonds", 0)
+        return list(rules)
+
+    def record(self, state: GameState, event: str, amount: int = 1, key: Optional[str] = None,
+               now: Optional[float] = None) -> List[Rule]:
+        """Учесть событие и открыть достижения, порог которых оно перешло"""
+        if amount <= 0:
+            return []
+        stats = state.stats
+        reached = []
+        for counter in (event,) if key is None else (event, counter_name(event, key)):
+            if event in GAUGES:
+                if amount <= stats.get(counter, 0):
+                    continue
+                stats[counter] = amount
+            else:
+                stats[counter] = stats.get(counter, 0) + amount
+            reached.extend(self._reached(counter, stats[counter], state.achievements))
+        return self.unlock(state, reached, now) if reached else []
+
+
+engine = AchievementEngine(RULES)
+
+
+def record(state: GameState, event: str, amount: int = 1, key: Optional[str] = None,
+           now: Optional[float] = None) -> List[Rule]:
+    return engine.record(state, event, amount, key, now)
+
+
+def initial_stats(state: GameState) -> Dict[str, int]:
+    """Счетчики игрока, у которого их еще нет: оценка снизу по урожаю в инвентаре и уровню"""
+    stats = {"level": state.level}
+    harvest_items = state.inventory.harvest
+    if harvest_items:
+        stats["harvest"] = sum(harvest_items.values())
+        stats.update({counter_name("harvest", name): count for name, count in harvest_items.items()})
+    return stats
+
+
+# ===== Пересчет по всем игрокам =====
+
+def _pending_chunk(items: List[Tuple[int, Dict[str, int], List[str]]]) -> List[Tuple[int, List[str]]]:
+    """Работа процесса: (id, счетчики, открытые) -> (id, какие открыть)"""
+    result = []
+    for player_id, stats, unlocked in items:
+        rules = engine.pending(stats, set(unlocked))
+        if rules:
+            result.append((player_id, [rule.name for rule in rules]))
+    return result
+
+
+async def backfill(chunk_size: int = 2000, workers: int = 0, idle: float = 3600.0,
+                   now: Optional[float] = None) -> int:
+    """Открыть выполненные достижения всем игрокам, неактивным дольше idle секунд.
+
+    Шарды обходятся по очереди, игроки - пачками по chunk_size по
+    возрастанию id. Правила пачки проверяют workers процессов (0 - в этом
+    процессе), награды и строки achievements пачки пишутся одной
+    транзакцией, каждый игрок - условно по прочитанной ревизии: игрок,
+    которого сервер изменил за это время, пропускается. При отложенной
+    записи сервер ревизию не проверяет (см. state_cache.write_behind),
+    тогда запускать только при остановленном сервисе. Возвращает число
+    открытых достижений.
+    """
+    from sqlalchemy import select
+
+    from app import revisions
+    from app.crud import bulk
+    from app.crud.player import load_game_states
+    from app.models import Player
+    from app.shards import shard_map
+
+    if now is None:
+        now = time.time()
+    loop = asyncio.get_running_loop()
+    pool = ProcessPoolExecutor(workers) if workers > 0 else None
+    unlocked_total = 0
+    try:
+        for shard in shard_map:
+            last_id = 0
+            while True:
+                async with shard.session() as db:
+                    rows = (await db.execute(
+                        select(Player.id, Player.last_active)
+                        .where(Player.id > last_id, Player.last_active < now - idle)
+                        .order_by(Player.id)
+                        .limit(chunk_size)
+                    )).all()
+                    if not rows:
+                        break
+                    last_id = rows[-1][0]
+                    states = await load_game_states(db, [player_id for player_id, _ in rows])
+
+                items = [(player_id, state.stats, list(state.achievements)) for player_id, state in states.items()]
+                if pool is None:
+                    found = _pending_chunk(items)
+                else:
+                    step = -(-len(items) // workers)
+                    parts = await asyncio.gather(*(
+                        loop.run_in_executor(pool, _pending_chunk, items[start:start + step])
+                        for start in range(0, len(items), step)
+                    ))
+                    found = [entry for part in parts for entry in part]
+
+                written = skipped = 0
+                # Пересчет не делает игрока активным
+                last_active = dict(rows)
+                async with shard.engine.begin() as conn:
+                    for player_id, names in found:
+                        state = states[player_id]
+                        revisions.track(state)
+                        loaded = state.revision
+                        engine.unlock(state, [engine.rules[name] for name in names], now)
+                        revisions.commit(state)
+                        # Игрока изменили после чтения: пропускаем, его достижения откроет следующий запуск
+                        if await bulk.cas_write_state(conn, state, loaded, now=now,
+                                                      last_active=last_active[player_id]):
+                            written += 1
+                            unlocked_total += len(names)
+                        else:
+                            skipped += 1
+                logger.info(f"Achievements: shard {shard.index}, {len(states)} players up to id {last_id}, "
+                            f"{written} with new achievements, {skipped} changed meanwhile")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return unlocked_total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Открыть выполненные достижения всем игрокам")
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="процессов для проверки правил")
+    parser.add_argument("--idle", type=float, default=3600.0, help="пропускать игроков, активных за это время (сек)")
+    parser.add_argument("--service-stopped", action="store_true",
+                        help="сервис остановлен (обязательно при STATE_WRITE_MODE=behind)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if write_behind() and not args.service_stopped:
+        parser.error("STATE_WRITE_MODE=behind: the server cache would overwrite this job's writes; "
+                     "stop the service and pass --service-stopped")
+
+    async def run():
+        from app.shards import shard_map
+
+        try:
+            unlocked = await backfill(args.chunk_size, args.workers, args.idle)
+            logger.info(f"Backfill finished: {unlocked} achievements unlocked")
+        finally:
+            await shard_map.dispose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
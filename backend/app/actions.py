@@ -0,0 +1,274 @@
+"""Игровые действия над GameState.
+
+Каждое действие меняет переданное состояние или бросает ActionError,
+не трогая кэш и базу. Маршруты одиночных действий и пакетный маршрут
+вызывают одни и те же функции, а пакет применяется к копии состояния в
+кэше (app/state_cache.py), так что при ошибке в любом действии не
+меняется ничего.
+"""
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app import achievements, growth, levels
+from app.crops import Crop, crops
+from app.farm_grid import FarmGrid
+from app.schemas import GameAction, GameState, Plant
+
+HARVEST_XP = 10
+SELL_XP = 2
+
+# Награда в семенах за уровень выдается стартовой культурой
+REWARD_SEED = "carrot"
+
+
+class ActionError(Exception):
+    """Действие невозможно; status_code - HTTP-код для ответа"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def find_cell(farm: FarmGrid, plant_id: int) -> int:
+    """Индекс клетки растения: id - это номер клетки, поиск не нужен"""
+    index = plant_id - 1
+    if not 0 <= index < len(farm) or farm.is_empty(index):
+        raise ActionError("Plant not found", status_code=404)
+    return index
+
+
+def plant_view(state: GameState, index: int, now: Optional[float] = None) -> Plant:
+    return Plant(**state.farm.plant_view(index, now))
+
+
+def _crop(name: str) -> Crop:
+    crop = crops.get(name)
+    if crop is None:
+        raise ActionError(f"Unknown crop {name}")
+    return crop
+
+
+def _check_unlocked(state: GameState, crop: Crop) -> None:
+    if state.level < crop.required_level:
+        raise ActionError(f"{crop.name} unlocks at level {crop.required_level}", status_code=403)
+
+
+def grant_xp(state: GameState, xp: int) -> levels.XpGain:
+    """Начислить опыт и награды за все пройденные уровни"""
+    gain = levels.add_xp(state.total_xp, xp)
+    state.total_xp = gain.total_xp
+    state.level = gain.new_level
+    if gain.level_up:
+        achievements.record(state, "level", gain.new_level)
+    state.money += gain.rewards.get("coins", 0)
+    state.diamonds += gain.rewards.get("diamonds", 0)
+    if gain.rewards.get("seeds"):
+        seeds = state.inventory.seeds
+        seeds[REWARD_SEED] = seeds.get(REWARD_SEED, 0) + gain.rewards["seeds"]
+    return gain
+
+
+def plant(state: GameState, plant_name: str, x: Optional[int] = None, y: Optional[int] = None,
+          now: Optional[float] = None) -> Plant:
+    """Посадить растение: семя из инвентаря или покупка семени по цене каталога"""
+    if now is None:
+        now = time.time()
+    crop = _crop(plant_name)
+
+    farm = state.farm
+    if x is None or y is None:
+        index = next(farm.free(), None)
+        if index is None:
+            raise ActionError("No free cells")
+    else:
+        try:
+            index = farm.index(x, y)
+        except IndexError:
+            raise ActionError("Cell is out of farm") from None
+        if not farm.is_empty(index):
+            raise ActionError("Cell is occupied")
+
+    seeds = state.inventory.seeds
+    if seeds.get(crop.name, 0) > 0:
+        seeds[crop.name] -= 1
+        if not seeds[crop.name]:
+            del seeds[crop.name]
+    else:
+        _check_unlocked(state, crop)
+        if state.money < crop.seed_price:
+            raise ActionError("Not enough money")
+        state.money -= crop.seed_price
+
+    farm.plant(index, crop.name, now)
+    achievements.record(state, "plant", 1, crop.name, now)
+    return plant_view(state, index, now)
+
+
+def water(state: GameState, plant_id: int, now: Optional[float] = None) -> Plant:
+    """Полить растение: только метка времени, стадия считается лениво"""
+    if now is None:
+        now = time.time()
+    index = find_cell(state.farm, plant_id)
+    state.farm.water(index, now)
+    return plant_view(state, index, now)
+
+
+def fertilize(state: GameState, plant_id: int, now: Optional[float] = None) -> Plant:
+    """Удобрить растение; повторное удобрение ничего не меняет"""
+    if now is None:
+        now = time.time()
+    index = find_cell(state.farm, plant_id)
+    state.farm.fertilize(index, now)
+    return plant_view(state, index, now)
+
+
+def harvest(state: GameState, plant_id: int, now: Optional[float] = None) -> Tuple[Plant, levels.XpGain]:
+    """Собрать созревшее растение в инвентарь; завядшее только убирается"""
+    index = find_cell(state.farm, plant_id)
+    target = plant_view(state, index, now)
+    if target.is_withered:
+        state.farm.clear(index)
+        return target, grant_xp(state, 0)
+    if target.growth_stage < growth.MAX_STAGE:
+        raise ActionError("Plant is not ripe yet")
+    state.farm.clear(index)
+    harvest_items = state.inventory.harvest
+    harvest_items[target.name] = harvest_items.get(target.name, 0) + 1
+    achievements.record(state, "harvest", 1, target.name, now)
+    return target, grant_xp(state, HARVEST_XP)
+
+
+def water_all(state: GameState, now: Optional[float] = None) -> List[int]:
+    """Полить все несозревшие растения, вернуть их id"""
+    return [index + 1 for index in state.farm.water_all(now)]
+
+
+def harvest_all(state: GameState, now: Optional[float] = None) -> Tuple[Dict[str, int], levels.XpGain]:
+    """Собрать все созревшие растения, вернуть {культура: количество}"""
+    harvested = state.farm.harvest_ripe(now)
+    harvest_items = state.inventory.harvest
+    for name, count in harvested.items():
+        harvest_items[name] = harvest_items.get(name, 0) + count
+        achievements.record(state, "harvest", count, name, now)
+    return harvested, grant_xp(state, HARVEST_XP * sum(harvested.values()))
+
+
+def buy(state: GameState, plant_name: str, quantity: int = 1) -> int:
+    """Купить семена, вернуть потраченные монеты"""
+    if quantity <= 0:
+        raise ActionError("Quantity must be positive")
+    crop = _crop(plant_name)
+    _check_unlocked(state, crop)
+    cost = crop.seed_price * quantity
+    if state.money < cost:
+        raise ActionError("Not enough money")
+    state.money -= cost
+    seeds = state.inventory.seeds
+    seeds[crop.name] = seeds.get(crop.name, 0) + quantity
+    return cost
+
+
+def sell(state: GameState, plant_name: str, quantity: int = 1) -> Tuple[int, levels.XpGain]:
+    """Продать урожай, вернуть выручку"""
+    if quantity <= 0:
+        raise ActionError("Quantity must be positive")
+    crop = _crop(plant_name)
+    harvest_items = state.inventory.harvest
+    if harvest_items.get(crop.name, 0) < quantity:
+        raise ActionError("Not enough harvest")
+    harvest_items[crop.name] -= quantity
+    if not harvest_items[crop.name]:
+        del harvest_items[crop.name]
+    income = crop.sell_price * quantity
+    state.money += income
+    achievements.record(state, "coins_earned", income)
+    return income, grant_xp(state, SELL_XP * quantity)
+
+
+def apply_action(state: GameState, action: GameAction, now: float) -> Dict[str, Any]:
+    """Применить одно действие пакета, вернуть его краткий результат"""
+    if action.type in ("water", "fertilize", "harvest") and action.plant_id is None:
+        raise ActionError("plant_id is required")
+    if action.type in ("plant", "buy", "sell") and not action.plant_name:
+        raise ActionError("plant_name is required")
+
+    if action.type == "plant":
+        new_plant = plant(state, action.plant_name, action.x, action.y, now)
+        return {"type": "plant", "plant_id": new_plant.id}
+    if action.type == "water":
+        return {"type": "water", "plant_id": water(state, action.plant_id, now).id}
+    if action.type == "fertilize":
+        return {"type": "fertilize", "plant_id": fertilize(state, action.plant_id, now).id}
+    if action.type == "harvest":
+        target, gain = harvest(state, action.plant_id, now)
+        return {"type": "harvest", "plant_id": action.plant_id, "xp": 0 if target.is_withered else HARVEST_XP,
+                "level_up": gain.level_up}
+    if action.type == "water_all":
+        return {"type": "water_all", "plant_ids": water_all(state, now)}
+    if action.type == "harvest_all":
+        harvested, gain = harvest_all(state, now)
+        return {"type": "harvest_all", "harvested": harvested,
+                "xp": HARVEST_XP * sum(harvested.values()), "level_up": gain.level_up}
+    if action.type == "buy":
+        return {"type": "buy", "cost": buy(state, action.plant_name, action.quantity)}
+    income, gain = sell(state, action.plant_name, action.quantity)
+    return {"type": "sell", "income": income, "xp": SELL_XP * action.quantity, "level_up": gain.level_up}
+
+
+def run_actions(state: GameState, actions: List[GameAction], now: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Применить действия по порядку прямо к state.
+
+    Ошибка любого действия поднимается как ActionError с его индексом;
+    state при этом уже мог измениться, атомарность обеспечивает вызывающий.
+    """
+    if now is None:
+        now = time.time()
+    results = []
+    for index, action in enumerate(actions):
+        try:
+            results.append(apply_action(state, action, now))
+        except ActionError as e:
+            raise ActionError(f"Action {index} ({action.type}): {e.message}", e.status_code) from e
+    return results
+
+
+def state_diff(before: GameState, after: GameState, now: Optional[float] = None) -> Dict[str, Any]:
+    """Что изменилось между двумя состояниями игрока.
+
+    cells - растения по id на момент now (None - клетка освободилась),
+    inventory - только изменившиеся ключи (0 - ключ удален), остальные
+    поля - если изменились.
+    """
+    if now is None:
+        now = time.time()
+    diff: Dict[str, Any] = {}
+    for field in ("money", "diamonds", "level", "total_xp", "farm_size", "username"):
+        if getattr(before, field) != getattr(after, field):
+            diff[field] = getattr(after, field)
+
+    old_farm, new_farm = before.farm, after.farm
+    cells = {}
+    for index in range(len(new_farm)):
+        old_print = old_farm.fingerprint(index) if index < len(old_farm) else None
+        if old_print == new_farm.fingerprint(index):
+            continue
+        cells[index + 1] = None if new_farm.is_empty(index) else new_farm.plant_view(index, now)
+    if cells:
+        diff["cells"] = cells
+
+    inventory = {}
+    for section in ("seeds", "harvest"):
+        old_items = getattr(before.inventory, section)
+        new_items = getattr(after.inventory, section)
+        changed = {key: new_items.get(key, 0) for key in old_items.keys() | new_items.keys()
+                   if old_items.get(key, 0) != new_items.get(key, 0)}
+        if changed:
+            inventory[section] = changed
+    if inventory:
+        diff["inventory"] = inventory
+
+    unlocked = {name: at for name, at in after.achievements.items() if name not in before.achievements}
+    if unlocked:
+        diff["achievements"] = unlocked
+    return diff
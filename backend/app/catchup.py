@@ -0,0 +1,235 @@
+"""Догоняющий расчет ферм за время отсутствия игроков.
+
+Стадии роста вычисляются лениво (app/growth.py), но у прошедшего времени
+есть и последствия, которые надо записать: созревший урожай вянет через
+WITHER_AFTER, а игроки с открытым автосбором получают его в инвентарь.
+Они считаются одним векторным проходом NumPy по массивам FarmGrid - для
+одной фермы при входе игрока и для склеенных ферм целой пачки игроков в
+ночной задаче (python -m app.catchup). Она же удаляет ответы по ключам
+идемпотентности старше IDEMPOTENCY_TTL.
+"""
+import argparse
+import asyncio
+import logging
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import select
+
+from app import achievements, actions, growth, levels, revisions
+from app.crud import bulk
+from app.crud.player import load_game_states
+from app.crops import crops
+from app.farm_grid import FERTILIZED, WATERED, WITHERED
+from app.models import Player
+from app.schemas import GameState
+from app.shards import shard_map
+from app.state_cache import IDEMPOTENCY_TTL, write_behind
+
+logger = logging.getLogger(__name__)
+
+AUTO_HARVEST = "auto_harvest"
+
+# Время роста по id культуры; пустая клетка (id 0) не созревает никогда
+GROWTH_TIME = np.array([crops.by_id[crop_id].growth_time if crop_id in crops.by_id else np.inf
+                        for crop_id in range(max(crops.by_id) + 1)])
+
+
+class CatchUp(NamedTuple):
+    """Что изменилось на ферме игрока"""
+    harvested: Dict[str, int]
+    withered: int
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.harvested) or self.withered > 0
+
+
+def effective_growth(t, planted_at, watered_at, fertilized_at, bonus, has_water, has_fertilizer):
+    """growth.effective_growth для массивов клеток; t - число или массив"""
+    grown = bonus + np.maximum(t - planted_at, 0.0)
+    watered = np.maximum(np.minimum(watered_at + growth.WATER_DURATION, t) - np.maximum(watered_at, planted_at), 0.0)
+    fertilized = np.maximum(t - np.maximum(fertilized_at, planted_at), 0.0)
+    return (grown
+            + np.where(has_water, (growth.WATER_SPEEDUP - 1.0) * watered, 0.0)
+            + np.where(has_fertilizer, (growth.FERTILIZER_SPEEDUP - 1.0) * fertilized, 0.0))
+
+
+def ripe_times(planted_at, watered_at, fertilized_at, bonus, has_water, has_fertilizer, growth_time):
+    """Момент созревания каждой клетки, для созревших - фактический.
+
+    Рост кусочно-линеен по времени с изломами в начале и конце полива и
+    в момент удобрения: находим отрезок, на котором он доходит до
+    growth_time, и решаем линейное уравнение на нем.
+    """
+    breakpoints = np.sort(np.stack([
+        planted_at,
+        np.where(has_water, np.maximum(watered_at, planted_at), planted_at),
+        np.where(has_water, np.maximum(watered_at + growth.WATER_DURATION, planted_at), planted_at),
+        np.where(has_fertilizer, np.maximum(fertilized_at, planted_at), planted_at),
+    ], axis=1), axis=1)
+    column = (slice(None), None)
+    grown = effective_growth(breakpoints, planted_at[column], watered_at[column], fertilized_at[column],
+                             bonus[column], has_water[column], has_fertilizer[column])
+    segment = np.maximum(np.count_nonzero(grown <= growth_time[column], axis=1) - 1, 0)
+    rows = np.arange(len(segment))
+    start, done = breakpoints[rows, segment], grown[rows, segment]
+    speed = (1.0
+             + np.where(has_water & (watered_at <= start) & (start < watered_at + growth.WATER_DURATION),
+                        growth.WATER_SPEEDUP - 1.0, 0.0)
+             + np.where(has_fertilizer & (fertilized_at <= start), growth.FERTILIZER_SPEEDUP - 1.0, 0.0))
+    return np.where(bonus >= growth_time, planted_at, start + (growth_time - done) / speed)
+
+
+def _column(states: Sequence[GameState], name: str, dtype) -> np.ndarray:
+    """Склеить столбец FarmGrid всех ферм в один массив"""
+    return np.concatenate([np.frombuffer(getattr(state.farm, name), dtype=dtype) for state in states])
+
+
+def catch_up_states(states: Sequence[GameState], now: Optional[float] = None) -> List[CatchUp]:
+    """Применить увядание и автосбор ко всем фермам одним проходом"""
+    if now is None:
+        now = time.time()
+    if not states:
+        return []
+
+    sizes = np.array([len(state.farm) for state in states])
+    offsets = np.concatenate(([0], np.cumsum(sizes)))
+    starts = offsets.tolist()
+    crop = _column(states, "crop", np.uint16)
+    flags = _column(states, "flags", np.uint8)
+    planted_at = _column(states, "planted_at", np.float64)
+    watered_at = _column(states, "watered_at", np.float64)
+    fertilized_at = _column(states, "fertilized_at", np.float64)
+    bonus = _column(states, "growth_bonus", np.float64)
+    has_water = (flags & WATERED) != 0
+    has_fertilizer = (flags & FERTILIZED) != 0
+    auto = np.repeat([AUTO_HARVEST in levels.FEATURES_BY_LEVEL[state.level] for state in states], sizes)
+    growth_time = GROWTH_TIME[crop]
+
+    with np.errstate(invalid="ignore"):
+        ripe = ((crop > 0) & ((flags & WITHERED) == 0)
+                & (effective_growth(now, planted_at, watered_at, fertilized_at, bonus,
+                                    has_water, has_fertilizer) >= growth_time))
+        collect = ripe & auto
+        wither = np.zeros_like(ripe)
+        # Время созревания нужно только тем, кто может завянуть
+        candidates = np.nonzero(ripe & ~auto)[0]
+        if len(candidates):
+            ripe_at = ripe_times(planted_at[candidates], watered_at[candidates], fertilized_at[candidates],
+                                 bonus[candidates], has_water[candidates], has_fertilizer[candidates],
+                                 growth_time[candidates])
+            wither[candidates] = ripe_at + growth.WITHER_AFTER <= now
+
+    harvested: List[Dict[str, int]] = [{} for _ in states]
+    withered_cells = np.nonzero(wither)[0]
+    withered_owners = np.searchsorted(offsets, withered_cells, side="right") - 1
+    for cell, owner in zip(withered_cells.tolist(), withered_owners.tolist()):
+        states[owner].farm.flags[cell - starts[owner]] |= WITHERED
+
+    collected_cells = np.nonzero(collect)[0]
+    collected_owners = np.searchsorted(offsets, collected_cells, side="right") - 1
+    for cell, owner in zip(collected_cells.tolist(), collected_owners.tolist()):
+        name = crops.by_id[int(crop[cell])].name
+        harvested[owner][name] = harvested[owner].get(name, 0) + 1
+        states[owner].farm.clear(cell - starts[owner])
+
+    withered = np.bincount(withered_owners, minlength=len(states))
+    results = []
+    for state, collected, count in zip(states, harvested, withered.tolist()):
+        if collected:
+            harvest_items = state.inventory.harvest
+            for name, amount in collected.items():
+                harvest_items[name] = harvest_items.get(name, 0) + amount
+                achievements.record(state, "harvest", amount, name, now)
+            actions.grant_xp(state, actions.HARVEST_XP * sum(collected.values()))
+        results.append(CatchUp(collected, count))
+    return results
+
+
+def catch_up(state: GameState, now: Optional[float] = None) -> CatchUp:
+    """Догоняющий расчет одной фермы (при входе игрока)"""
+    if not any(state.farm.crop):
+        return CatchUp({}, 0)
+    return catch_up_states([state], now)[0]
+
+
+async def run_nightly(chunk_size: int = 5000, idle: float = 3600.0, now: Optional[float] = None) -> int:
+    """Догнать фермы всех игроков, неактивных дольше idle секунд.
+
+    Шарды обходятся по очереди. Игроки читаются пачками по chunk_size по
+    возрастанию id, каждая пачка считается одним проходом и записывается
+    одной транзакцией. Активные игроки пропускаются: их состояние в кэше
+    сервера, и они догоняются при входе. Каждый игрок пишется условно по
+    прочитанной ревизии, измененный за это время сервером пропускается;
+    при отложенной записи (state_cache.write_behind) запускать только при
+    остановленном сервисе. Возвращает число измененных ферм.
+    """
+    if now is None:
+        now = time.time()
+    changed_total = 0
+    for shard in shard_map:
+        last_id = 0
+        while True:
+            async with shard.session() as db:
+                rows = (await db.execute(
+                    select(Player.id, Player.last_active)
+                    .where(Player.id > last_id, Player.farm_grid.isnot(None), Player.last_active < now - idle)
+                    .order_by(Player.id)
+                    .limit(chunk_size)
+                )).all()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                states = list((await load_game_states(db, [player_id for player_id, _ in rows])).values())
+
+            loaded = {}
+            for state in states:
+                revisions.track(state)
+                loaded[state.user_id] = state.revision
+            changed = [state for state, result in zip(states, catch_up_states(states, now)) if result.changed]
+            written = 0
+            if changed:
+                # Догоняющий расчет не делает игрока активным
+                last_active = dict(rows)
+                async with shard.engine.begin() as conn:
+                    for state in changed:
+                        revisions.commit(state)
+                        # Игрока изменили после чтения: он уже догнан при входе, пропускаем
+                        if await bulk.cas_write_state(conn, state, loaded[state.user_id], now=now,
+                                                      last_active=last_active[state.user_id]):
+                            written += 1
+            changed_total += written
+            logger.info(f"Catch-up: shard {shard.index}, {len(states)} farms up to id {last_id}, "
+                        f"{written} changed, {len(changed) - written} changed meanwhile")
+        async with shard.engine.begin() as conn:
+            expired = await bulk.delete_expired_idempotency_keys(conn, now - IDEMPOTENCY_TTL)
+        logger.info(f"Catch-up: shard {shard.index}, {expired} expired idempotency keys deleted")
+    return changed_total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Ночной догоняющий расчет ферм")
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--idle", type=float, default=3600.0, help="пропускать игроков, активных за это время (сек)")
+    parser.add_argument("--service-stopped", action="store_true",
+                        help="сервис остановлен (обязательно при STATE_WRITE_MODE=behind)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if write_behind() and not args.service_stopped:
+        parser.error("STATE_WRITE_MODE=behind: the server cache would overwrite this job's writes; "
+                     "stop the service and pass --service-stopped")
+
+    async def run():
+        try:
+            changed = await run_nightly(args.chunk_size, args.idle)
+            logger.info(f"Catch-up finished: {changed} farms changed")
+        finally:
+            await shard_map.dispose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
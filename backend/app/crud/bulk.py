@@ -0,0 +1,163 @@
+"""Пакетная запись игровых состояний одним upsert на таблицу"""
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app import revisions
+from app.levels import level_info
+from app.achievements import engine as achievement_engine
+from app.models import Achievement, IdempotencyKey, Inventory, Player, PlayerLevel
+from app.schemas import GameState
+
+
+def dialect_insert(conn: AsyncConnection, table):
+    """INSERT с поддержкой ON CONFLICT для текущего диалекта"""
+    if conn.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
+
+
+async def _upsert(conn: AsyncConnection, table, rows: List[Dict], keys: Sequence[str], update: Sequence[str]) -> None:
+    """Многострочный INSERT ... ON CONFLICT DO UPDATE"""
+    if not rows:
+        return
+    stmt = dialect_insert(conn, table).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={name: stmt.excluded[name] for name in update},
+    )
+    await conn.execute(stmt)
+
+
+def game_state_rows(states: Sequence[GameState], now: Optional[float] = None) -> Dict[str, List[Dict]]:
+    """Разложить состояния игроков на строки таблиц.
+
+    Ферма пишется одним blob в строку игрока, а не строкой на клетку.
+    """
+    if now is None:
+        now = time.time()
+
+    players, levels, inventories, unlocked = [], [], [], []
+    for state in states:
+        players.append({
+            "id": state.user_id,
+            "username": state.username,
+            "coins": state.money,
+            "diamonds": state.diamonds,
+            "created_at": now,
+            "last_active": now,
+            "revision": state.revision,
+            "farm_grid": state.farm.to_bytes(),
+            "stats": dict(state.stats),
+        })
+        info = level_info(state.total_xp)
+        levels.append({
+            "player_id": state.user_id,
+            "current_level": info.current_level,
+            "current_xp": info.current_xp,
+            "total_xp": info.total_xp,
+            "created_at": now,
+            "updated_at": now,
+        })
+        inventories.append({
+            "player_id": state.user_id,
+            "seeds": dict(state.inventory.seeds),
+            "harvest": dict(state.inventory.harvest),
+        })
+        # Записанные раньше достижения не меняются: пишем только новые
+        for name in revisions.unsaved_achievements(state):
+            rule = achievement_engine.rules.get(name)
+            unlocked.append({
+                "player_id": state.user_id,
+                "name": name,
+                "description": rule.description if rule else name,
+                "unlocked_at": state.achievements[name],
+                "reward": dict(rule.reward) if rule else None,
+            })
+    return {"players": players, "player_levels": levels, "inventories": inventories, "achievements": unlocked}
+
+
+async def insert_achievements(conn: AsyncConnection, rows: List[Dict]) -> None:
+    """Открытые достижения одним INSERT; уже записанные пропускаются.
+
+    Строка ссылается на player_levels.id, поэтому пишется после upsert уровней.
+    """
+    if not rows:
+        return
+    level_ids = dict((await conn.execute(
+        select(PlayerLevel.player_id, PlayerLevel.id)
+        .where(PlayerLevel.player_id.in_({row["player_id"] for row in rows}))
+    )).all())
+    values = [
+        {"player_level_id": level_ids[row["player_id"]], **{k: v for k, v in row.items() if k != "player_id"}}
+        for row in rows if row["player_id"] in level_ids
+    ]
+    stmt = dialect_insert(conn, Achievement.__table__).values(values)
+    await conn.execute(stmt.on_conflict_do_nothing(index_elements=["player_level_id", "name"]))
+
+
+async def upsert_game_states(conn: AsyncConnection, rows: Dict[str, List[Dict]]) -> None:
+    """Записать подготовленные строки: по одному upsert на таблицу"""
+    await _upsert(conn, Player.__table__, rows["players"], ["id"],
+                  ["username", "coins", "diamonds", "last_active", "revision", "farm_grid", "stats"])
+    await _upsert(conn, PlayerLevel.__table__, rows["player_levels"], ["player_id"],
+                  ["current_level", "current_xp", "total_xp", "updated_at"])
+    await _upsert(conn, Inventory.__table__, rows["inventories"], ["player_id"], ["seeds", "harvest"])
+    await insert_achievements(conn, rows["achievements"])
+    # Ответы по ключам идемпотентности при отложенной записи; повтор ключа в пакете - последний ответ
+    keys = {(row["player_id"], row["key"]): row for row in rows.get("idempotency_keys", ())}
+    await _upsert(conn, IdempotencyKey.__table__, list(keys.values()), ["player_id", "key"], ["response", "created_at"])
+
+
+async def cas_write_state(conn: AsyncConnection, state: GameState, expected_revision: Optional[int],
+                          idempotency_key: Optional[str] = None, response: Any = None,
+                          now: Optional[float] = None, last_active: Optional[float] = None) -> bool:
+    """Записать состояние, только если ревизия игрока в базе равна expected_revision.
+
+    Строка игрока - версия всей записи: условный UPDATE ... WHERE revision =
+    expected_revision не затирает изменения другого воркера, а при
+    expected_revision = None игрок вставляется, только если его еще нет.
+    False - конфликт, ничего не записано. Ответ на запрос с ключом
+    идемпотентности пишется в той же транзакции. last_active задают
+    фоновые задачи, чтобы не делать игрока активным (по умолчанию now).
+    """
+    if now is None:
+        now = time.time()
+    rows = game_state_rows([state], now)
+    player = rows["players"][0]
+    if last_active is not None:
+        player["last_active"] = last_active
+    if expected_revision is None:
+        stmt = dialect_insert(conn, Player.__table__).values(player).on_conflict_do_nothing(index_elements=["id"])
+    else:
+        stmt = (
+            update(Player.__table__)
+            .where(Player.id == state.user_id, func.coalesce(Player.revision, 0) == expected_revision)
+            .values({name: value for name, value in player.items() if name not in ("id", "created_at")})
+        )
+    result = await conn.execute(stmt)
+    if result.rowcount != 1:
+        return False
+
+    await _upsert(conn, PlayerLevel.__table__, rows["player_levels"], ["player_id"],
+                  ["current_level", "current_xp", "total_xp", "updated_at"])
+    await _upsert(conn, Inventory.__table__, rows["inventories"], ["player_id"], ["seeds", "harvest"])
+    await insert_achievements(conn, rows["achievements"])
+    if idempotency_key is not None:
+        await _upsert(conn, IdempotencyKey.__table__, [{
+            "player_id": state.user_id,
+            "key": idempotency_key,
+            "response": response,
+            "created_at": now,
+        }], ["player_id", "key"], ["response", "created_at"])
+    return True
+
+
+async def delete_expired_idempotency_keys(conn: AsyncConnection, before: float) -> int:
+    """Удалить ответы по ключам идемпотентности, записанные раньше before"""
+    result = await conn.execute(delete(IdempotencyKey.__table__).where(IdempotencyKey.created_at < before))
+    return result.rowcount
@@ -0,0 +1,21 @@
+from typing import List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Player, PlayerLevel
+
+
+async def get_all_player_xp(db: AsyncSession, since: Optional[float] = None) -> List[Tuple[int, int, Optional[str]]]:
+    """(player_id, total_xp, username) всех игроков для заполнения рейтинга.
+
+    С since - только игроков, записанных не раньше since.
+    """
+    query = (
+        select(PlayerLevel.player_id, PlayerLevel.total_xp, Player.username)
+        .join(Player, Player.id == PlayerLevel.player_id)
+    )
+    if since is not None:
+        query = query.where(PlayerLevel.updated_at >= since)
+    result = await db.execute(query)
+    return [tuple(row) for row in result]
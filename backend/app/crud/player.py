@@ -1,29 +1,121 @@
-def create_player(db: Session, player_id: int):
-    """Создать нового игрока с начальными значениями"""
-    db_player = get_player(db, player_id)
-    if db_player:
-        return db_player
-
-    new_player = Player(
-        id=player_id,
-        coins=100,  # Начальные 100 монет
-        diamonds=0,
-        experience=0,
-        level=1,  # Начальный 1 уровень
-        created_at=datetime.utcnow()
-    )
-
-    db.add(new_player)
-    db.commit()
-    db.refresh(new_player)
-
-    # Создаем начальный инвентарь
-    db_inventory = Inventory(
-        player_id=player_id,
-        seeds={},
-        harvest={}
-    )
-    db.add(db_inventory)
-    db.commit()
-
-    return new_player
\ No newline at end of file
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.achievements import initial_stats
+from app.farm_grid import WATERED, FarmGrid
+from app.levels import level_for_xp
+from app.models import Achievement, FarmCell, IdempotencyKey, Inventory, Player, PlayerLevel
+from app.schemas import FARM_SIZE, GameState, Inventory as InventorySchema
+
+
+async def get_revision(db: AsyncSession, player_id: int) -> Optional[int]:
+    """Ревизия игрока в базе, None - игрока нет"""
+    return (await db.execute(
+        select(func.coalesce(Player.revision, 0)).where(Player.id == player_id)
+    )).scalar_one_or_none()
+
+
+async def get_idempotent_response(db: AsyncSession, player_id: int, key: str, since: float) -> Optional[Tuple]:
+    """Сохраненный ответ на запрос с ключом идемпотентности, не старше since"""
+    row = (await db.execute(
+        select(IdempotencyKey.response)
+        .where(IdempotencyKey.player_id == player_id, IdempotencyKey.key == key, IdempotencyKey.created_at >= since)
+    )).first()
+    return tuple(row) if row is not None else None
+
+
+# Клетки игроков, записанные до появления players.farm_grid
+_LEGACY_CELLS = select(
+    FarmCell.player_id, FarmCell.x, FarmCell.y, FarmCell.plant_type, FarmCell.planted_at,
+    FarmCell.watered_at, FarmCell.fertilized_at, FarmCell.growth_bonus,
+).where(FarmCell.plant_type.isnot(None))
+
+
+def grid_from_cells(rows: Iterable[Tuple], size: int = FARM_SIZE) -> FarmGrid:
+    """Собрать FarmGrid из строк _LEGACY_CELLS"""
+    farm = FarmGrid(size)
+    for _, x, y, crop, planted_at, watered_at, fertilized_at, bonus in rows:
+        try:
+            index = farm.index(x, y)
+            farm.plant(index, crop, planted_at or 0.0)
+        except (IndexError, ValueError):
+            continue
+        if watered_at is not None:
+            farm.watered_at[index] = watered_at
+            farm.flags[index] |= WATERED
+        if fertilized_at is not None:
+            farm.fertilize(index, fertilized_at)
+        farm.growth_bonus[index] = bonus or 0.0
+    return farm
+
+
+async def load_game_state(db: AsyncSession, player_id: int) -> Optional[GameState]:
+    """Собрать GameState игрока из таблиц players, inventories и farm_cells"""
+    return (await load_game_states(db, [player_id])).get(player_id)
+
+
+async def load_game_states(db: AsyncSession, player_ids: Sequence[int]) -> Dict[int, GameState]:
+    """Состояния нескольких игроков: по одному запросу на таблицу"""
+    players = (await db.scalars(select(Player).where(Player.id.in_(player_ids)))).all()
+    if not players:
+        return {}
+    ids = [player.id for player in players]
+    inventories = {
+        inventory.player_id: inventory
+        for inventory in await db.scalars(select(Inventory).where(Inventory.player_id.in_(ids)))
+    }
+    total_xp = dict((await db.execute(
+        select(PlayerLevel.player_id, PlayerLevel.total_xp).where(PlayerLevel.player_id.in_(ids))
+    )).all())
+    unlocked: Dict[int, Dict[str, float]] = {}
+    for player_id, name, unlocked_at in await db.execute(
+        select(PlayerLevel.player_id, Achievement.name, Achievement.unlocked_at)
+        .join(PlayerLevel, PlayerLevel.id == Achievement.player_level_id)
+        .where(PlayerLevel.player_id.in_(ids))
+    ):
+        unlocked.setdefault(player_id, {})[name] = unlocked_at or 0.0
+    legacy_cells: Dict[int, List[Tuple]] = {}
+    legacy = [player.id for player in players if player.farm_grid is None]
+    if legacy:
+        for row in await db.execute(_LEGACY_CELLS.where(FarmCell.player_id.in_(legacy))):
+            legacy_cells.setdefault(row[0], []).append(row)
+
+    states = {}
+    for db_player in players:
+        if db_player.farm_grid is not None:
+            farm = FarmGrid.from_bytes(db_player.farm_grid)
+        else:
+            farm = grid_from_cells(legacy_cells.get(db_player.id, ()))
+        state = GameState(user_id=db_player.id, username=db_player.username,
+                          money=db_player.coins, diamonds=db_player.diamonds,
+                          farm=farm, revision=db_player.revision or 0)
+        if db_player.id in total_xp:
+            state.total_xp = total_xp[db_player.id]
+            state.level = level_for_xp(state.total_xp)
+        inventory = inventories.get(db_player.id)
+        if inventory is not None:
+            state.inventory = InventorySchema(seeds=inventory.seeds or {}, harvest=inventory.harvest or {})
+        state.achievements = unlocked.get(db_player.id, {})
+        state.stats = db_player.stats if db_player.stats is not None else initial_stats(state)
+        states[db_player.id] = state
+    return states
+
+
+async def get_farm_grids(db: AsyncSession) -> List[Tuple[int, FarmGrid]]:
+    """Фермы всех игроков для восстановления планировщика созревания"""
+    result = await db.execute(select(Player.id, Player.farm_grid))
+    farms, legacy = [], []
+    for player_id, blob in result:
+        if blob is not None:
+            farms.append((player_id, FarmGrid.from_bytes(blob)))
+        else:
+            legacy.append(player_id)
+    if legacy:
+        rows = await db.execute(_LEGACY_CELLS.where(FarmCell.player_id.in_(legacy)).order_by(FarmCell.player_id))
+        by_player = {}
+        for row in rows:
+            by_player.setdefault(row[0], []).append(row)
+        farms.extend((player_id, grid_from_cells(cells)) for player_id, cells in by_player.items())
+    return farms
@@ -0,0 +1,81 @@
+"""Асинхронное подключение к базе данных"""
+import asyncio
+import os
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base
+
+
+def normalize_url(database_url: str) -> str:
+    # Render отдает postgres://, SQLAlchemy ожидает postgresql://
+    if database_url.startswith("postgres://"):
+        database_url = database_url.replace("postgres://", "postgresql://", 1)
+    return database_url
+
+
+def get_database_url() -> str:
+    """URL базы из DATABASE_URL, по умолчанию локальный SQLite"""
+    return normalize_url(os.getenv("DATABASE_URL", "sqlite:///./farmers.db"))
+
+
+def get_async_url(database_url: str) -> str:
+    """Подставить асинхронный драйвер: aiosqlite локально, asyncpg в продакшене"""
+    if database_url.startswith("sqlite://"):
+        return database_url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    if database_url.startswith("postgresql://"):
+        return database_url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    return database_url
+
+
+def engine_options(database_url: str) -> dict:
+    """Параметры пула соединений для диалекта"""
+    if database_url.startswith("sqlite"):
+        # SQLite - один файл, пул из одного соединения без накладных расходов
+        return {"connect_args": {"check_same_thread": False}}
+    return {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "20")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "10")),
+        # Render и прокси рвут простаивающие соединения
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": True,
+    }
+
+
+def make_engine(database_url: str) -> AsyncEngine:
+    return create_async_engine(get_async_url(database_url), **engine_options(database_url))
+
+
+def make_sessionmaker(target: AsyncEngine) -> async_sessionmaker:
+    return async_sessionmaker(target, expire_on_commit=False, autoflush=False)
+
+
+DATABASE_URL = get_database_url()
+
+engine = make_engine(DATABASE_URL)
+SessionLocal = make_sessionmaker(engine)
+
+Base = declarative_base()
+
+
+async def warm_pool(target: AsyncEngine = engine,
+                    connections: int = int(os.getenv("DB_WARM_CONNECTIONS", "2"))) -> None:
+    """Открыть несколько соединений заранее, чтобы первые запросы их не ждали"""
+    if target.dialect.name == "sqlite":
+        return
+
+    async def ping() -> None:
+        async with target.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    # Параллельно, иначе пул раз за разом отдаст одно и то же соединение
+    await asyncio.gather(*(ping() for _ in range(connections)))
+
+
+async def init_db(target: AsyncEngine = engine) -> None:
+    """Создать таблицы, если их еще нет (для локального SQLite)"""
+    from app import models  # noqa: F401 - регистрируем модели в metadata
+
+    async with target.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
@@ -0,0 +1,254 @@
+"""Компактное представление фермы в массивах фиксированной ширины.
+
+Клетка (x, y) - индекс y * size + x во всех массивах, id растения -
+индекс + 1. Вместо списка pydantic-объектов и строки farm_cells на
+каждую клетку ферма хранится в нескольких array.array и целиком
+сериализуется в один бинарный blob.
+"""
+import struct
+import sys
+import time
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app import growth
+from app.crops import crops
+
+# Биты flags
+WATERED = 1
+FERTILIZED = 2
+WITHERED = 4
+
+_MAGIC = b"FG"
+_VERSION = 1
+_HEADER = struct.Struct("<2sBH")
+
+# (имя массива, typecode) в порядке записи в blob
+_COLUMNS = (
+    ("crop", "H"),
+    ("stage", "B"),
+    ("flags", "B"),
+    ("planted_at", "d"),
+    ("watered_at", "d"),
+    ("fertilized_at", "d"),
+    ("growth_bonus", "d"),
+)
+
+
+def crop_id(name: str) -> int:
+    """Постоянный id культуры из каталога; 0 в массиве crop - пустая клетка"""
+    crop = crops.get(name)
+    if crop is None:
+        raise ValueError(f"Unknown crop {name}")
+    return crop.id
+
+
+class FarmGrid:
+    """Ферма size x size в параллельных массивах"""
+
+    __slots__ = ("size",) + tuple(name for name, _ in _COLUMNS)
+
+    def __init__(self, size: int):
+        self.size = size
+        cells = size * size
+        for name, typecode in _COLUMNS:
+            setattr(self, name, array(typecode, bytes(array(typecode).itemsize * cells)))
+
+    def __len__(self) -> int:
+        return self.size * self.size
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, FarmGrid):
+            return NotImplemented
+        return self.size == other.size and all(
+            getattr(self, name) == getattr(other, name) for name, _ in _COLUMNS)
+
+    def __copy__(self) -> "FarmGrid":
+        clone = FarmGrid.__new__(FarmGrid)
+        clone.size = self.size
+        for name, _ in _COLUMNS:
+            setattr(clone, name, getattr(self, name)[:])
+        return clone
+
+    def __deepcopy__(self, memo) -> "FarmGrid":
+        return self.__copy__()
+
+    copy = __copy__
+
+    # Доступ к клеткам
+
+    def index(self, x: int, y: int) -> int:
+        if not (0 <= x < self.size and 0 <= y < self.size):
+            raise IndexError("Cell is out of farm")
+        return y * self.size + x
+
+    def position(self, index: int) -> Tuple[int, int]:
+        return index % self.size, index // self.size
+
+    def is_empty(self, index: int) -> bool:
+        return self.crop[index] == 0
+
+    def crop_name(self, index: int) -> Optional[str]:
+        crop = self.crop[index]
+        return crops.by_id[crop].name if crop else None
+
+    def occupied(self) -> Iterator[int]:
+        """Индексы засаженных клеток"""
+        crop = self.crop
+        return (index for index in range(len(crop)) if crop[index])
+
+    def free(self) -> Iterator[int]:
+        crop = self.crop
+        return (index for index in range(len(crop)) if not crop[index])
+
+    def is_withered(self, index: int) -> bool:
+        return bool(self.flags[index] & WITHERED)
+
+    def watered_time(self, index: int) -> Optional[float]:
+        return self.watered_at[index] if self.flags[index] & WATERED else None
+
+    def fertilized_time(self, index: int) -> Optional[float]:
+        return self.fertilized_at[index] if self.flags[index] & FERTILIZED else None
+
+    def compute(self, index: int, now: Optional[float] = None) -> growth.GrowthState:
+        """Стадия клетки на момент now (см. app/growth.py)"""
+        return growth.compute_growth(
+            self.crop_name(index), self.planted_at[index], now,
+            watered_at=self.watered_time(index),
+            fertilized_at=self.fertilized_time(index),
+            growth_bonus=self.growth_bonus[index],
+        )
+
+    def next_stage_at(self, index: int, now: Optional[float] = None) -> Optional[float]:
+        return growth.next_stage_at(
+            self.crop_name(index), self.planted_at[index], now,
+            watered_at=self.watered_time(index),
+            fertilized_at=self.fertilized_time(index),
+            growth_bonus=self.growth_bonus[index],
+        )
+
+    def fingerprint(self, index: int) -> Tuple:
+        """Хранимые поля клетки; стадия выводится из них и не входит"""
+        return (self.crop[index], self.flags[index], self.planted_at[index], self.watered_at[index],
+                self.fertilized_at[index], self.growth_bonus[index])
+
+    # Изменения
+
+    def plant(self, index: int, crop: str, now: float) -> None:
+        self.crop[index] = crop_id(crop)
+        self.stage[index] = 0
+        self.flags[index] = 0
+        self.planted_at[index] = now
+        self.watered_at[index] = 0.0
+        self.fertilized_at[index] = 0.0
+        self.growth_bonus[index] = 0.0
+
+    def clear(self, index: int) -> None:
+        for name, _ in _COLUMNS:
+            getattr(self, name)[index] = 0
+
+    def water(self, index: int, now: float) -> None:
+        watered_at, self.growth_bonus[index] = growth.water(
+            self.planted_at[index], now, self.watered_time(index), self.growth_bonus[index])
+        self.watered_at[index] = watered_at
+        self.flags[index] |= WATERED
+
+    def fertilize(self, index: int, now: float) -> bool:
+        if self.flags[index] & FERTILIZED:
+            return False
+        self.fertilized_at[index] = now
+        self.flags[index] |= FERTILIZED
+        return True
+
+    # Операции над всей фермой
+
+    def refresh(self, now: Optional[float] = None) -> List[int]:
+        """Обновить кэшированные стадии, вернуть клетки, где стадия сменилась"""
+        if now is None:
+            now = time.time()
+        changed = []
+        for index in self.occupied():
+            stage = self.compute(index, now).stage
+            if stage != self.stage[index]:
+                self.stage[index] = stage
+                changed.append(index)
+        return changed
+
+    def water_all(self, now: Optional[float] = None) -> List[int]:
+        """Полить все несозревшие растения, вернуть политые клетки"""
+        if now is None:
+            now = time.time()
+        watered = [index for index in self.occupied() if self.compute(index, now).stage < growth.MAX_STAGE]
+        for index in watered:
+            self.water(index, now)
+        return watered
+
+    def ripe_cells(self, now: Optional[float] = None) -> List[int]:
+        """Созревшие и не завядшие клетки"""
+        if now is None:
+            now = time.time()
+        return [index for index in self.occupied()
+                if not self.is_withered(index) and self.compute(index, now).stage >= growth.MAX_STAGE]
+
+    def harvest_ripe(self, now: Optional[float] = None) -> Dict[str, int]:
+        """Собрать все созревшие растения, вернуть {культура: количество}"""
+        harvested: Dict[str, int] = {}
+        for index in self.ripe_cells(now):
+            name = self.crop_name(index)
+            harvested[name] = harvested.get(name, 0) + 1
+            self.clear(index)
+        return harvested
+
+    # Сериализация в blob
+
+    def to_bytes(self) -> bytes:
+        parts = [_HEADER.pack(_MAGIC, _VERSION, self.size)]
+        for name, _ in _COLUMNS:
+            column = getattr(self, name)
+            if sys.byteorder != "little":
+                column = array(column.typecode, column)
+                column.byteswap()
+            parts.append(column.tobytes())
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "FarmGrid":
+        magic, version, size = _HEADER.unpack_from(data)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("Not a farm grid blob")
+        grid = cls.__new__(cls)
+        grid.size = size
+        offset = _HEADER.size
+        cells = size * size
+        for name, typecode in _COLUMNS:
+            column = array(typecode)
+            length = column.itemsize * cells
+            column.frombytes(data[offset:offset + length])
+            if sys.byteorder != "little":
+                column.byteswap()
+            setattr(grid, name, column)
+            offset += length
+        return grid
+
+    # Представление для API
+
+    def plant_view(self, index: int, now: Optional[float] = None) -> dict:
+        """Клетка в формате Plant из app/schemas.py"""
+        computed = self.compute(index, now)
+        name = self.crop_name(index)
+        x, y = self.position(index)
+        return {
+            "id": index + 1,
+            "name": name,
+            "growth_stage": computed.stage,
+            "price": crops.by_id[self.crop[index]].sell_price,
+            "x": x,
+            "y": y,
+            "planted_at": self.planted_at[index],
+            "watered_at": self.watered_time(index),
+            "fertilized_at": self.fertilized_time(index),
+            "growth_bonus": self.growth_bonus[index],
+            "progress": computed.progress,
+            "ripe_at": computed.ripe_at,
+            "is_withered": self.is_withered(index),
+        }
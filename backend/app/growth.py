@@ -0,0 +1,147 @@
+"""Ленивый движок роста растений.
+
+Стадия растения нигде не хранится как источник истины: она вычисляется
+при чтении из времени посадки, времени последнего полива и удобрения.
+Поэтому фоновый тик, переписывающий все грядки, не нужен, а стоимость
+чтения пропорциональна количеству прочитанных клеток.
+"""
+import time
+from bisect import bisect_right
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from app.crops import crops
+
+# Стадии роста: 0 - семя, 1 - росток, 2 - растет, 3 - созрело
+MAX_STAGE = 3
+STAGE_NAMES = ("seed", "sprout", "growing", "ripe")
+
+# Полив ускоряет рост на время действия, удобрение - до сбора урожая
+WATER_DURATION = 600.0
+WATER_SPEEDUP = 1.5
+FERTILIZER_SPEEDUP = 1.25
+
+# Несобранный урожай вянет через сутки после созревания
+WITHER_AFTER = 24 * 3600.0
+
+
+class GrowthCurve(NamedTuple):
+    """Кривая роста культуры"""
+    growth_time: float
+    # Доля от growth_time, с которой начинается стадия 1, 2, 3
+    thresholds: Tuple[float, ...] = (0.25, 0.6, 1.0)
+
+
+DEFAULT_CURVE = GrowthCurve(growth_time=300.0)
+
+# Кривые роста из каталога культур (shared/constants/crops.json)
+CROP_CURVES: Dict[str, GrowthCurve] = {
+    crop.name: GrowthCurve(growth_time=crop.growth_time, thresholds=crop.thresholds) for crop in crops
+}
+
+
+class GrowthState(NamedTuple):
+    """Вычисленное состояние клетки на момент now"""
+    stage: int
+    progress: float
+    ripe_at: float
+
+
+def get_curve(crop: str) -> GrowthCurve:
+    """Кривая роста по названию культуры"""
+    return CROP_CURVES.get(crop.lower(), DEFAULT_CURVE)
+
+
+def _overlap(start: float, end: float, lo: float, hi: float) -> float:
+    """Длина пересечения отрезков [start, end] и [lo, hi]"""
+    return max(0.0, min(end, hi) - max(start, lo))
+
+
+def effective_growth(planted_at: float, now: float,
+                     watered_at: Optional[float] = None,
+                     fertilized_at: Optional[float] = None,
+                     growth_bonus: float = 0.0) -> float:
+    """Эффективное время роста в секундах с учетом полива и удобрения"""
+    if now <= planted_at:
+        return growth_bonus
+
+    grown = now - planted_at + growth_bonus
+    if watered_at is not None:
+        grown += (WATER_SPEEDUP - 1.0) * _overlap(
+            watered_at, watered_at + WATER_DURATION, planted_at, now)
+    if fertilized_at is not None:
+        grown += (FERTILIZER_SPEEDUP - 1.0) * _overlap(
+            fertilized_at, now, planted_at, now)
+    return grown
+
+
+def _reach_at(target: float, planted_at: float, now: float, grown: float,
+              watered_at: Optional[float], fertilized_at: Optional[float]) -> float:
+    """Момент, когда рост дойдет до target секунд при неизменных поливе и удобрении"""
+    remaining = target - grown
+    if remaining <= 0:
+        return now
+
+    # Оставшийся рост проходим кусками, внутри которых скорость постоянна
+    t = max(now, planted_at)
+    fert_speed = FERTILIZER_SPEEDUP - 1.0 if fertilized_at is not None else 0.0
+    breakpoints = [bp for bp in (
+        watered_at + WATER_DURATION if watered_at is not None else None,
+        fertilized_at,
+    ) if bp is not None and bp > t]
+
+    for bp in sorted(breakpoints) + [float("inf")]:
+        speed = 1.0
+        if watered_at is not None and watered_at <= t < watered_at + WATER_DURATION:
+            speed += WATER_SPEEDUP - 1.0
+        if fertilized_at is not None and fertilized_at <= t:
+            speed += fert_speed
+        span = bp - t
+        if span * speed >= remaining:
+            return t + remaining / speed
+        remaining -= span * speed
+        t = bp
+    return t
+
+
+def compute_growth(crop: str, planted_at: float, now: Optional[float] = None,
+                   watered_at: Optional[float] = None,
+                   fertilized_at: Optional[float] = None,
+                   growth_bonus: float = 0.0) -> GrowthState:
+    """Вычислить стадию, прогресс и время созревания клетки"""
+    if now is None:
+        now = time.time()
+    curve = get_curve(crop)
+    grown = effective_growth(planted_at, now, watered_at, fertilized_at, growth_bonus)
+    progress = min(grown / curve.growth_time, 1.0) if curve.growth_time > 0 else 1.0
+    stage = min(bisect_right(curve.thresholds, progress), MAX_STAGE)
+    ripe_at = _reach_at(curve.growth_time, planted_at, now, grown, watered_at, fertilized_at)
+    return GrowthState(stage=stage, progress=round(progress, 4), ripe_at=ripe_at)
+
+
+def next_stage_at(crop: str, planted_at: float, now: Optional[float] = None,
+                  watered_at: Optional[float] = None,
+                  fertilized_at: Optional[float] = None,
+                  growth_bonus: float = 0.0) -> Optional[float]:
+    """Момент перехода на следующую стадию или None, если растение созрело"""
+    if now is None:
+        now = time.time()
+    curve = get_curve(crop)
+    grown = effective_growth(planted_at, now, watered_at, fertilized_at, growth_bonus)
+    stage = min(bisect_right(curve.thresholds, grown / curve.growth_time), MAX_STAGE)
+    if stage >= MAX_STAGE:
+        return None
+    target = curve.thresholds[stage] * curve.growth_time
+    return _reach_at(target, planted_at, now, grown, watered_at, fertilized_at)
+
+
+def water(planted_at: float, now: float, watered_at: Optional[float],
+          growth_bonus: float = 0.0) -> Tuple[float, float]:
+    """Полить клетку: вернуть новые (watered_at, growth_bonus).
+
+    Неиспользованный остаток прошлого полива сгорает, а уже
+    накопленное ускорение переносится в growth_bonus.
+    """
+    if watered_at is not None:
+        growth_bonus += (WATER_SPEEDUP - 1.0) * _overlap(
+            watered_at, watered_at + WATER_DURATION, planted_at, now)
+    return now, growth_bonus
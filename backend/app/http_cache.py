@@ -0,0 +1,34 @@
+"""Условные GET-запросы: ETag и ответ 304 без сериализации тела"""
+import zlib
+from typing import Any, Callable
+
+from fastapi import Request, Response
+
+from app import metrics
+
+
+def make_etag(*parts: Any) -> str:
+    """Слабый ETag из частей, одинаковый во всех воркерах"""
+    return 'W/"%08x"' % zlib.crc32(repr(parts).encode())
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Совпадает ли ETag с If-None-Match клиента"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in [tag.strip() for tag in header.split(",")]
+
+
+def conditional(request: Request, response: Response, etag: str,
+                build: Callable[[], Any], max_age: int = 0) -> Any:
+    """Вернуть 304, если клиент уже знает эту версию, иначе тело от build()"""
+    headers = {"ETag": etag, "Cache-Control": f"max-age={max_age}"}
+    matched = etag_matches(request, etag)
+    metrics.cache_lookup("etag", matched)
+    if matched:
+        return Response(status_code=304, headers=headers)
+    body = build()
+    # Готовый Response отдается как есть, заголовки надо положить в него самого
+    (body if isinstance(body, Response) else response).headers.update(headers)
+    return body
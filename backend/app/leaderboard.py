@@ -0,0 +1,198 @@
+"""Таблица лидеров, поддерживаемая инкрементально.
+
+Игроки лежат в индексируемом skip list, упорядоченном по убыванию
+total_xp. Каждое изменение опыта - удаление и вставка за O(log n),
+а топ-N, место игрока и окно вокруг него отвечаются без сортировки
+и без ORDER BY по всей таблице player_levels.
+"""
+import random
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.levels import level_for_xp
+
+MAX_HEIGHT = 32
+
+# Ключ сортировки: больше опыта - выше, при равенстве - меньший id
+Key = Tuple[int, int]
+
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key: Optional[Key], height: int):
+        self.key = key
+        self.next: List[Optional["_Node"]] = [None] * height
+        # width[i] - сколько элементов перепрыгивает ссылка next[i]
+        self.width: List[int] = [1] * height
+
+
+class IndexedSkipList:
+    """Упорядоченное множество ключей с доступом по рангу за O(log n)"""
+
+    def __init__(self, seed: Optional[int] = None):
+        self._head = _Node(None, MAX_HEIGHT)
+        self._height = 1
+        self._size = 0
+        self._random = random.Random(seed)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _random_height(self) -> int:
+        height = 1
+        while height < MAX_HEIGHT and self._random.random() < 0.5:
+            height += 1
+        return height
+
+    def _find(self, key: Key) -> Tuple[List[_Node], List[int]]:
+        """Предшественники key на каждом уровне и их позиции"""
+        update = [self._head] * MAX_HEIGHT
+        positions = [0] * MAX_HEIGHT
+        node, position = self._head, 0
+        for level in range(self._height - 1, -1, -1):
+            while node.next[level] is not None and node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+            update[level] = node
+            positions[level] = position
+        return update, positions
+
+    def insert(self, key: Key) -> None:
+        update, positions = self._find(key)
+        height = self._random_height()
+        if height > self._height:
+            for level in range(self._height, height):
+                update[level] = self._head
+                positions[level] = 0
+                self._head.width[level] = self._size + 1
+            self._height = height
+
+        node = _Node(key, height)
+        position = positions[0] + 1
+        for level in range(height):
+            prev = update[level]
+            node.next[level] = prev.next[level]
+            prev.next[level] = node
+            skipped = position - positions[level]
+            node.width[level] = prev.width[level] - skipped + 1
+            prev.width[level] = skipped
+        for level in range(height, self._height):
+            update[level].width[level] += 1
+        self._size += 1
+
+    def remove(self, key: Key) -> bool:
+        update, _ = self._find(key)
+        node = update[0].next[0]
+        if node is None or node.key != key:
+            return False
+        for level in range(self._height):
+            prev = update[level]
+            if prev.next[level] is node:
+                prev.width[level] += node.width[level] - 1
+                prev.next[level] = node.next[level]
+            else:
+                prev.width[level] -= 1
+        while self._height > 1 and self._head.next[self._height - 1] is None:
+            self._height -= 1
+        self._size -= 1
+        return True
+
+    def rank(self, key: Key) -> Optional[int]:
+        """Позиция key с нуля или None"""
+        update, positions = self._find(key)
+        node = update[0].next[0]
+        if node is None or node.key != key:
+            return None
+        return positions[0]
+
+    def _node_at(self, index: int) -> _Node:
+        node, remaining = self._head, index + 1
+        for level in range(self._height - 1, -1, -1):
+            while node.next[level] is not None and node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        return node
+
+    def slice(self, start: int, stop: int) -> Iterator[Key]:
+        """Ключи с позициями [start, stop): O(log n + k)"""
+        start, stop = max(start, 0), min(stop, self._size)
+        if start >= stop:
+            return
+        node = self._node_at(start)
+        for _ in range(stop - start):
+            yield node.key
+            node = node.next[0]
+
+
+class Leaderboard:
+    """Рейтинг игроков по total_xp"""
+
+    def __init__(self):
+        self._ranking = IndexedSkipList()
+        self._xp: Dict[int, int] = {}
+        self._usernames: Dict[int, Optional[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._ranking)
+
+    def __contains__(self, player_id: int) -> bool:
+        return player_id in self._xp
+
+    @staticmethod
+    def _key(player_id: int, total_xp: int) -> Key:
+        return -total_xp, player_id
+
+    def update(self, player_id: int, total_xp: int, username: Optional[str] = None) -> None:
+        """Обновить опыт игрока за O(log n)"""
+        if username is not None:
+            self._usernames[player_id] = username
+        old_xp = self._xp.get(player_id)
+        if old_xp == total_xp:
+            return
+        if old_xp is not None:
+            self._ranking.remove(self._key(player_id, old_xp))
+        self._ranking.insert(self._key(player_id, total_xp))
+        self._xp[player_id] = total_xp
+
+    def remove(self, player_id: int) -> None:
+        old_xp = self._xp.pop(player_id, None)
+        if old_xp is not None:
+            self._ranking.remove(self._key(player_id, old_xp))
+        self._usernames.pop(player_id, None)
+
+    def rank(self, player_id: int) -> Optional[int]:
+        """Место игрока, начиная с 1"""
+        total_xp = self._xp.get(player_id)
+        if total_xp is None:
+            return None
+        return self._ranking.rank(self._key(player_id, total_xp)) + 1
+
+    def _rows(self, start: int, stop: int) -> List[dict]:
+        # Окно у вершины рейтинга начинается с первого места
+        start = max(start, 0)
+        rows = []
+        for offset, (neg_xp, player_id) in enumerate(self._ranking.slice(start, stop)):
+            total_xp = -neg_xp
+            rows.append({
+                "rank": start + offset + 1,
+                "user_id": player_id,
+                "username": self._usernames.get(player_id) or f"Фермер {player_id}",
+                "level": level_for_xp(total_xp),
+                "total_xp": total_xp,
+            })
+        return rows
+
+    def top(self, limit: int = 10, offset: int = 0) -> List[dict]:
+        """Страница рейтинга"""
+        return self._rows(offset, offset + limit)
+
+    def around(self, player_id: int, radius: int = 2) -> List[dict]:
+        """Окно рейтинга вокруг игрока"""
+        rank = self.rank(player_id)
+        if rank is None:
+            return []
+        return self._rows(rank - 1 - radius, rank + radius)
+
+
+# Один рейтинг на процесс, заполняется при старте и обновляется при начислении опыта
+leaderboard = Leaderboard()
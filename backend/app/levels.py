@@ -0,0 +1,142 @@
+"""Таблица уровней и наград, построенная один раз при импорте.
+
+CUMULATIVE_XP[i] - общий опыт, с которого начинается уровень i + 1.
+Уровень по общему опыту ищется бинарным поиском, а награды за любой
+диапазон уровней - разностью префиксных сумм, поэтому крупные
+начисления опыта не перебирают уровни по одному.
+"""
+from bisect import bisect_right
+from itertools import accumulate
+from typing import Dict, List, NamedTuple, Tuple
+
+MAX_LEVEL = 100
+BASE_LEVEL_XP = 100
+LEVEL_XP_EXPONENT = 1.5
+
+REWARD_TYPES = ("coins", "diamonds", "seeds")
+
+# Функции, открывающиеся на уровне
+UNLOCKED_FEATURES: Dict[int, str] = {
+    2: "shop",
+    3: "fertilizer",
+    5: "leaderboard",
+    7: "auto_harvest",
+    10: "farm_expansion",
+}
+
+
+def _level_span(level: int) -> int:
+    """Опыт, нужный чтобы пройти уровень level"""
+    return int(round(BASE_LEVEL_XP * level ** LEVEL_XP_EXPONENT))
+
+
+def _level_reward(level: int) -> Tuple[int, int, int]:
+    """Награда (coins, diamonds, seeds) за достижение уровня level"""
+    coins = 50 * level
+    diamonds = 1 if level % 5 == 0 else 0
+    seeds = 3 if level % 2 == 0 else 0
+    return coins, diamonds, seeds
+
+
+# Длина каждого уровня; у последнего уровня длины нет
+LEVEL_SPANS: Tuple[int, ...] = tuple(_level_span(level) for level in range(1, MAX_LEVEL))
+CUMULATIVE_XP: Tuple[int, ...] = (0,) + tuple(accumulate(LEVEL_SPANS))
+
+# LEVEL_REWARDS[level] - награда за достижение level, для level 1 награды нет
+LEVEL_REWARDS: Tuple[Dict[str, int], ...] = tuple(
+    {} if level < 2 else {
+        name: value for name, value in zip(REWARD_TYPES, _level_reward(level)) if value
+    }
+    for level in range(MAX_LEVEL + 1)
+)
+
+# Префиксные суммы наград по каждому типу: REWARD_PREFIX[t][level]
+REWARD_PREFIX: Dict[str, Tuple[int, ...]] = {
+    name: tuple(accumulate(rewards.get(name, 0) for rewards in LEVEL_REWARDS))
+    for name in REWARD_TYPES
+}
+
+FEATURES_BY_LEVEL: Tuple[Tuple[str, ...], ...] = tuple(
+    tuple(feature for unlock_level, feature in sorted(UNLOCKED_FEATURES.items()) if unlock_level <= level)
+    for level in range(MAX_LEVEL + 1)
+)
+
+
+class LevelInfo(NamedTuple):
+    """Производные поля уровня для API и бота"""
+    current_level: int
+    current_xp: int
+    total_xp: int
+    xp_to_next_level: int
+    next_level_xp: int
+    progress_percentage: float
+    next_level_rewards: Dict[str, int]
+    unlocked_features: Tuple[str, ...]
+
+
+class XpGain(NamedTuple):
+    """Результат начисления опыта"""
+    old_level: int
+    new_level: int
+    total_xp: int
+    rewards: Dict[str, int]
+
+    @property
+    def level_up(self) -> bool:
+        return self.new_level > self.old_level
+
+
+def level_for_xp(total_xp: int) -> int:
+    """Уровень по общему опыту за O(log n)"""
+    if total_xp <= 0:
+        return 1
+    return min(bisect_right(CUMULATIVE_XP, total_xp), MAX_LEVEL)
+
+
+def rewards_between(old_level: int, new_level: int) -> Dict[str, int]:
+    """Суммарные награды за уровни old_level+1..new_level за O(1) на тип"""
+    if new_level <= old_level:
+        return {}
+    totals = {
+        name: prefix[new_level] - prefix[old_level]
+        for name, prefix in REWARD_PREFIX.items()
+    }
+    return {name: value for name, value in totals.items() if value}
+
+
+def level_info(total_xp: int) -> LevelInfo:
+    """Уровень, опыт внутри уровня и прогресс до следующего"""
+    total_xp = max(total_xp, 0)
+    level = level_for_xp(total_xp)
+    current_xp = total_xp - CUMULATIVE_XP[level - 1]
+
+    if level >= MAX_LEVEL:
+        return LevelInfo(level, current_xp, total_xp, 0, 0, 100.0, {}, FEATURES_BY_LEVEL[level])
+
+    span = LEVEL_SPANS[level - 1]
+    return LevelInfo(
+        current_level=level,
+        current_xp=current_xp,
+        total_xp=total_xp,
+        xp_to_next_level=span,
+        next_level_xp=span - current_xp,
+        progress_percentage=round(current_xp * 100.0 / span, 1),
+        next_level_rewards=LEVEL_REWARDS[level + 1],
+        unlocked_features=FEATURES_BY_LEVEL[level],
+    )
+
+
+def add_xp(total_xp: int, xp: int) -> XpGain:
+    """Начислить опыт, перескакивая сразу через несколько уровней"""
+    old_level = level_for_xp(total_xp)
+    new_total = total_xp + max(xp, 0)
+    new_level = level_for_xp(new_total)
+    return XpGain(old_level, new_level, new_total, rewards_between(old_level, new_level))
+
+
+def curve_table() -> List[Dict[str, int]]:
+    """Таблица уровней для клиентов"""
+    return [
+        {"level": level, "total_xp": CUMULATIVE_XP[level - 1], **LEVEL_REWARDS[level]}
+        for level in range(1, MAX_LEVEL + 1)
+    ]
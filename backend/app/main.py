@@ -1,49 +1,260 @@
-from fastapi import FastAPI, HTTPException
+from app.startup import report as startup_report
+
+import asyncio
+import importlib
+import json
+import logging
+import time
+
+from fastapi import FastAPI, Header, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional
+from typing import Any, Callable, List, Optional, Tuple
 import os
 
+startup_report.mark("import fastapi")
+
+from app import actions, levels, metrics, ratelimit, revisions, static_tables
+from app.actions import ActionError
+from app.crops import crops
+from app.crud import bulk
+from app.crud.levels import get_all_player_xp
+from app.crud.player import get_farm_grids, get_idempotent_response, get_revision, load_game_state
+from app.database import init_db, warm_pool
+from app.http_cache import conditional, make_etag
+from app.leaderboard import leaderboard
+from app.realtime import hub
+from app.ripening import entries_from_grids, scheduler as ripening
+from app.schemas import ActionBatch, AddXpRequest, GameState
+from app.shards import Shard, count_players, mask_url, shard_map
+from app.state_cache import ConflictError, PlayerNotFound, WriteThrough, cache_from_env
+
+startup_report.mark("import app")
+
+logger = logging.getLogger(__name__)
+
 # Создаем приложение
 app = FastAPI(title="Farmers Dream API", version="1.0.0")
+# Маршруты засекают сериализацию ответа; задается до объявления маршрутов
+app.router.route_class = metrics.TimedRoute
+
+# Частота запросов по игрокам и склейка одинаковых чтений; внутри CORS, чтобы 429 читался из WebApp
+rate_limit_backend = ratelimit.backend_from_env()
+app.add_middleware(ratelimit.RateLimitMiddleware, limits=ratelimit.limits_from_env(), backend=rate_limit_backend,
+                   max_concurrent=int(os.getenv("MAX_CONCURRENT_REQUESTS", "256")),
+                   coalesce=os.getenv("REQUEST_COALESCING", "1") != "0",
+                   internal_token=os.getenv("INTERNAL_API_TOKEN") or None)
 
-# Настройка CORS - разрешаем все для теста
+# CORS: CORS_ORIGINS через запятую, по умолчанию все
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # В продакшене заменить на конкретные домены
+    allow_origins=[origin.strip() for origin in os.getenv("CORS_ORIGINS", "*").split(",") if origin.strip()],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
+# Метрики по маршрутам: задержка, запросы к базе, сериализация
+for shard in shard_map:
+    metrics.instrument_engine(shard.engine)
+slow_profiler = metrics.profiler_from_env()
+app.add_middleware(metrics.MetricsMiddleware, router=app.router, profiler=slow_profiler,
+                   profile_token=os.getenv("INTERNAL_API_TOKEN") or None)
+
+
+async def load_state(user_id: int) -> Optional[GameState]:
+    """Загрузить состояние игрока из его шарда"""
+    async with shard_map.for_player(user_id).session() as db:
+        return await load_game_state(db, user_id)
+
+
+async def write_states(states: List[GameState], idempotency_keys: List[dict]) -> None:
+    """Записать пакет состояний и ответов по ключам: одна транзакция на шард, шарды параллельно"""
+    keys = shard_map.group(idempotency_keys, key=lambda row: row["player_id"])
+
+    async def write(shard: Shard, group: List[GameState]) -> None:
+        rows = bulk.game_state_rows(group)
+        rows["idempotency_keys"] = keys.get(shard, [])
+        async with shard.engine.begin() as conn:
+            await bulk.upsert_game_states(conn, rows)
+
+    groups = shard_map.group(states, key=lambda state: state.user_id)
+    await asyncio.gather(*(write(shard, group) for shard, group in groups.items()))
+
+
+async def write_state(state: GameState, expected_revision: Optional[int],
+                      idempotency_key: Optional[str], response: Any) -> bool:
+    """Условная запись одного состояния (STATE_WRITE_MODE=through)"""
+    async with shard_map.for_player(state.user_id).engine.begin() as conn:
+        return await bulk.cas_write_state(conn, state, expected_revision, idempotency_key, response)
+
+
+async def stored_revision(user_id: int) -> Optional[int]:
+    async with shard_map.for_player(user_id).session() as db:
+        return await get_revision(db, user_id)
+
+
+async def recall_response(user_id: int, key: str, since: float) -> Optional[Tuple]:
+    async with shard_map.for_player(user_id).session() as db:
+        return await get_idempotent_response(db, user_id, key, since)
+
+
+async def player_xp(shard: Shard, since: Optional[float] = None) -> List[Tuple[int, int, Optional[str]]]:
+    async with shard.session() as db:
+        return await get_all_player_xp(db, since)
+
+
+async def farm_grids(shard: Shard) -> list:
+    async with shard.session() as db:
+        return await get_farm_grids(db)
+
+
+# Кэш горячих игроков: отложенная запись в базу или сквозная для нескольких воркеров
+state_cache = cache_from_env(load_state, write_states, WriteThrough(write_state, stored_revision, recall_response))
+
+
+def on_state_commit(user_id: int, game_state: GameState, old_revision: int) -> None:
+    """Разослать изменения новой ревизии, переставить таймеры созревания и обновить рейтинг"""
+    changes = revisions.changes_since(game_state, old_revision) or {}
+    hub.notify_state(user_id, {"type": "state", "revision": game_state.revision, "changes": changes},
+                     game_state)
+    if "cells" in changes:
+        ripening.schedule_state(user_id, game_state)
+    if "total_xp" in changes:
+        leaderboard.update(user_id, game_state.total_xp, game_state.username)
+
 
-# Модели данных
-class Plant(BaseModel):
-    id: int
-    name: str
-    growth_stage: int = 0
-    price: int
+state_cache.on_commit = on_state_commit
 
+metrics.register("state_cache_lookups_total", "Player state cache lookups by result",
+                 lambda: {("hit",): state_cache.hits, ("miss",): state_cache.misses},
+                 kind="counter", label_names=("result",))
+metrics.register("state_cache_conflicts_total", "Write-through revision conflicts",
+                 lambda: {(): state_cache.conflicts}, kind="counter")
+metrics.register("state_cache_players", "Players held in the state cache", lambda: {(): len(state_cache)})
+metrics.register("state_cache_dirty_players", "Players waiting for write-behind flush",
+                 lambda: {(): state_cache.dirty_count})
+metrics.register("leaderboard_players", "Players in the in-memory leaderboard", lambda: {(): len(leaderboard)})
+metrics.register("ripening_scheduled_cells", "Cells in the ripening heap", lambda: {(): len(ripening)})
+metrics.register("ripening_pending_notifications", "Ripe notifications not yet claimed by the bot",
+                 lambda: {(): ripening.pending_notifications})
+metrics.register("realtime_connections", "Open WebSocket/SSE subscriptions", lambda: {(): hub.connections()})
 
-class GameState(BaseModel):
-    user_id: int
-    money: int = 100
-    level: int = 1
-    plants: List[Plant] = []
+
+async def get_state_or_404(user_id: int) -> GameState:
+    game_state = await state_cache.get(user_id)
+    if game_state is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return game_state
+
+
+def action_error(e: ActionError) -> HTTPException:
+    return HTTPException(status_code=e.status_code, detail=e.message)
+
+
+async def run_action(user_id: int, operation: Callable[[GameState], Any],
+                     idempotency_key: Optional[str] = None,
+                     create: Optional[Callable[[], GameState]] = None) -> Any:
+    """Выполнить изменение состояния через кэш: все или ничего.
+
+    Повтор запроса с тем же заголовком Idempotency-Key возвращает первый
+    ответ, не меняя состояние. Ответ operation должен сериализоваться в JSON.
+    """
+    try:
+        return await state_cache.apply(user_id, operation, create=create, idempotency_key=idempotency_key)
+    except ActionError as e:
+        raise action_error(e)
+    except PlayerNotFound:
+        raise HTTPException(status_code=404, detail="User not found")
+    except ConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+# Ответы справочников из артефакта сборки (python -m app.static_tables)
+with startup_report.phase("static tables"):
+    STATIC_TABLES = static_tables.load_tables()
+
+_warm_up_task: Optional[asyncio.Task] = None
+_leaderboard_task: Optional[asyncio.Task] = None
+
+
+async def refresh_leaderboard(interval: float) -> None:
+    """Подтягивать в рейтинг опыт, начисленный другими воркерами.
+
+    Рейтинг в каждом воркере свой и сам обновляется только своими записями,
+    поэтому раз в interval секунд читаем игроков, записанных с прошлого раза
+    (с запасом на транзакции, которые еще шли).
+    """
+    since = time.time()
+    while True:
+        await asyncio.sleep(interval)
+        started = time.time()
+        try:
+            for rows in await shard_map.fan_out(lambda shard: player_xp(shard, since - interval)):
+                for player_id, total_xp, username in rows:
+                    leaderboard.update(player_id, total_xp, username)
+            since = started
+        except Exception:
+            logger.exception("Leaderboard refresh failed")
 
 
-# "База данных" в памяти для теста
-fake_db = {
-    1: GameState(
-        user_id=1,
-        money=100,
-        level=1,
-        plants=[
-            Plant(id=1, name="Carrot", growth_stage=1, price=10),
-            Plant(id=2, name="Tomato", growth_stage=0, price=20)
-        ]
-    )
-}
+async def warm_up(restore_ripening: bool) -> None:
+    """Подсистемы, без которых сервис уже отвечает: строятся после начала приема запросов"""
+    try:
+        # Рейтинг строится один раз, дальше обновляется при начислении опыта. Игроки,
+        # чей опыт уже изменился после старта, в нем есть, и данные базы для них старее
+        with startup_report.phase("leaderboard"):
+            for rows in await shard_map.fan_out(player_xp):
+                for player_id, total_xp, username in rows:
+                    if player_id not in leaderboard:
+                        leaderboard.update(player_id, total_xp, username)
+        if restore_ripening:
+            # Игроков в кэше уже запланировал on_state_commit по свежему состоянию
+            with startup_report.phase("ripening from db"):
+                farms = [(player_id, farm) for grids in await shard_map.fan_out(farm_grids)
+                         for player_id, farm in grids if state_cache.peek(player_id) is None]
+                ripening.schedule_entries(entries_from_grids(farms))
+        with startup_report.phase("db pool"):
+            await shard_map.fan_out(lambda shard: warm_pool(shard.engine))
+        # NumPy нужен только догоняющему расчету: импортируем его вне запросов
+        with startup_report.phase("import catchup"):
+            await asyncio.to_thread(importlib.import_module, "app.catchup")
+    except Exception:
+        logger.exception("Startup warm-up failed")
+    finally:
+        startup_report.finish()
+
+
+@app.on_event("startup")
+async def startup():
+    global _warm_up_task, _leaderboard_task
+    with startup_report.phase("init db"):
+        await shard_map.fan_out(lambda shard: init_db(shard.engine))
+    # Куча созревания: из сохраненного файла, при его отсутствии - из ферм в базе (в фоне)
+    with startup_report.phase("ripening file"):
+        loaded = ripening.load()
+    state_cache.start()
+    ripening.start()
+    await hub.start(state_cache.get)
+    restore_ripening = ripening.enabled and not loaded
+    _warm_up_task = asyncio.get_running_loop().create_task(warm_up(restore_ripening))
+    # По умолчанию только при нескольких воркерах: один воркер видит все начисления сам
+    refresh = float(os.getenv("LEADERBOARD_REFRESH", "10" if int(os.getenv("WEB_CONCURRENCY", "1")) > 1 else "0"))
+    if refresh > 0:
+        _leaderboard_task = asyncio.get_running_loop().create_task(refresh_leaderboard(refresh))
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    if _warm_up_task is not None and not _warm_up_task.done():
+        _warm_up_task.cancel()
+    if _leaderboard_task is not None:
+        _leaderboard_task.cancel()
+    await hub.close()
+    await ripening.stop()
+    await state_cache.stop()
+    await rate_limit_backend.close()
+    await shard_map.dispose()
 
 
 # Маршруты API
@@ -54,56 +265,314 @@ async def root():
 
 @app.get("/api/")
 async def api_root():
-    return {"api": "v1", "endpoints": ["/api/game/{user_id}", "/api/health"]}
+    return {"api": "v1", "endpoints": ["/api/game/{user_id}", "/api/crops", "/api/health"]}
 
 
 @app.get("/api/health")
 async def health_check():
-    return {"status": "healthy", "service": "farmers-dream-api"}
+    """Отвечает сразу после старта; ready - готовы ли фоновые подсистемы"""
+    return {"status": "healthy", "service": "farmers-dream-api", "ready": startup_report.ready}
+
+
+@app.get("/api/startup")
+async def startup_info():
+    """Из чего сложилось время холодного старта"""
+    return startup_report.as_dict()
 
 
 @app.get("/api/game/{user_id}")
-async def get_game_state(user_id: int):
-    """Получить состояние игры для пользователя"""
-    if user_id not in fake_db:
-        # Создаем нового пользователя
-        fake_db[user_id] = GameState(user_id=user_id)
+async def get_game_state(user_id: int, since: Optional[int] = None):
+    """Получить состояние игры для пользователя.
+
+    С параметром since возвращаются только изменения после этой ревизии,
+    если сервер еще помнит их, иначе - полный снимок.
+    """
+    def catch_up(working: GameState) -> GameState:
+        # Увядание и автосбор за время отсутствия игрока; пустой ферме NumPy не нужен
+        if any(working.farm.crop):
+            from app import catchup
+            catchup.catch_up(working)
+        return working
 
-    return fake_db[user_id]
+    # Нового пользователя создаем здесь же
+    game_state = await run_action(user_id, catch_up, create=lambda: GameState(user_id=user_id))
+
+    if since is not None:
+        changes = revisions.changes_since(game_state, since)
+        if changes is not None:
+            return {"user_id": user_id, "revision": game_state.revision, "since": since,
+                    "delta": True, "changes": changes}
+    return game_state
 
 
 @app.post("/api/game/{user_id}/plant")
-async def plant_seed(user_id: int, plant_name: str):
+async def plant_seed(user_id: int, plant_name: str, x: Optional[int] = None, y: Optional[int] = None,
+                     idempotency_key: Optional[str] = Header(None)):
     """Посадить новое растение"""
-    if user_id not in fake_db:
-        raise HTTPException(status_code=404, detail="User not found")
+    def operation(game_state: GameState) -> dict:
+        new_plant = actions.plant(game_state, plant_name, x, y)
+        return {"message": f"Planted {plant_name}", "plant": new_plant.model_dump(), "money": game_state.money}
 
-    game_state = fake_db[user_id]
-    new_plant = Plant(
-        id=len(game_state.plants) + 1,
-        name=plant_name,
-        growth_stage=0,
-        price=10
-    )
-    game_state.plants.append(new_plant)
-    game_state.money -= 5  # Стоимость посадки
-
-    return {"message": f"Planted {plant_name}", "plant": new_plant, "money": game_state.money}
+    return await run_action(user_id, operation, idempotency_key)
 
 
 @app.put("/api/game/{user_id}/plant/{plant_id}/water")
-async def water_plant(user_id: int, plant_id: int):
+async def water_plant(user_id: int, plant_id: int, idempotency_key: Optional[str] = Header(None)):
     """Полить растение"""
-    if user_id not in fake_db:
-        raise HTTPException(status_code=404, detail="User not found")
+    def operation(game_state: GameState) -> dict:
+        plant = actions.water(game_state, plant_id)
+        return {"message": f"Plant {plant_id} watered", "growth_stage": plant.growth_stage,
+                "ripe_at": plant.ripe_at}
+
+    return await run_action(user_id, operation, idempotency_key)
+
+
+@app.put("/api/game/{user_id}/plant/{plant_id}/fertilize")
+async def fertilize_plant(user_id: int, plant_id: int, idempotency_key: Optional[str] = Header(None)):
+    """Удобрить растение"""
+    def operation(game_state: GameState) -> dict:
+        plant = actions.fertilize(game_state, plant_id)
+        return {"message": f"Plant {plant_id} fertilized", "growth_stage": plant.growth_stage,
+                "ripe_at": plant.ripe_at}
+
+    return await run_action(user_id, operation, idempotency_key)
+
+
+@app.put("/api/game/{user_id}/water-all")
+async def water_all(user_id: int, idempotency_key: Optional[str] = Header(None)):
+    """Полить все несозревшие растения"""
+    def operation(game_state: GameState) -> dict:
+        watered = actions.water_all(game_state)
+        return {"message": f"Watered {len(watered)} plants", "plant_ids": watered}
+
+    return await run_action(user_id, operation, idempotency_key)
+
+
+@app.post("/api/game/{user_id}/harvest-all")
+async def harvest_all(user_id: int, idempotency_key: Optional[str] = Header(None)):
+    """Собрать все созревшие растения"""
+    def operation(game_state: GameState) -> dict:
+        harvested, gain = actions.harvest_all(game_state)
+        return {"message": f"Harvested {sum(harvested.values())} plants", "harvested": harvested,
+                "inventory": game_state.inventory.model_dump(), "level_up": gain.level_up}
+
+    return await run_action(user_id, operation, idempotency_key)
+
+
+@app.post("/api/game/{user_id}/actions")
+async def apply_actions(user_id: int, batch: ActionBatch, idempotency_key: Optional[str] = Header(None)):
+    """Применить пакет действий атомарно и вернуть одно изменение состояния"""
+    def operation(game_state: GameState) -> dict:
+        # Одно время на весь пакет: и для действий, и для стадий в diff
+        now = time.time()
+        before = game_state.model_copy(deep=True)
+        results = actions.run_actions(game_state, batch.actions, now)
+        revisions.commit(game_state)
+        return {"results": results, "revision": game_state.revision,
+                "diff": actions.state_diff(before, game_state, now)}
+
+    # Весь пакет становится одной записью в базу
+    return await run_action(user_id, operation, idempotency_key)
+
+
+async def _subscribe(user_id: int):
+    """Подписка на события игрока и первое сообщение с текущей ревизией"""
+    subscription = hub.subscribe(user_id)
+    game_state = await state_cache.get(user_id)
+    if game_state is not None:
+        hub.schedule(user_id, game_state)
+    hello = {"type": "hello", "revision": game_state.revision if game_state is not None else 0}
+    return subscription, hello
+
+
+@app.websocket("/api/ws/{user_id}")
+async def game_updates_ws(websocket: WebSocket, user_id: int):
+    """Push-обновления состояния по WebSocket"""
+    await websocket.accept()
+    subscription, hello = await _subscribe(user_id)
+
+    async def pump():
+        await websocket.send_json(hello)
+        while True:
+            await websocket.send_json(await subscription.get())
+
+    sender = asyncio.create_task(pump())
+    try:
+        # Входящие сообщения не нужны, чтение только ловит отключение клиента
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        subscription.close()
+
+
+@app.get("/api/events/{user_id}")
+async def game_updates_sse(user_id: int, request: Request):
+    """Push-обновления состояния через Server-Sent Events (запасной канал)"""
+    subscription, hello = await _subscribe(user_id)
+
+    async def stream():
+        try:
+            yield f"event: hello\ndata: {json.dumps(hello)}\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(subscription.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Комментарий держит соединение открытым через прокси
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            subscription.close()
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+def check_internal_token(token: Optional[str]) -> None:
+    # Без INTERNAL_API_TOKEN внутренние маршруты закрыты
+    expected = os.getenv("INTERNAL_API_TOKEN")
+    if not expected or token != expected:
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+@app.post("/api/notifications/ripe/claim")
+async def claim_ripe_notifications(limit: int = 100, x_internal_token: Optional[str] = Header(None),
+                                   idempotency_key: Optional[str] = Header(None)):
+    """Забрать пакет уведомлений о созревшем урожае (для бота).
+
+    Повтор с тем же Idempotency-Key получает тот же пакет.
+    """
+    check_internal_token(x_internal_token)
+    return {"notifications": ripening.claim(max(1, min(limit, 1000)), idempotency_key)}
+
+
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def get_metrics(x_internal_token: Optional[str] = Header(None)):
+    """Метрики в текстовом формате Prometheus"""
+    check_internal_token(x_internal_token)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/metrics/profiles")
+async def get_profiles(x_internal_token: Optional[str] = Header(None)):
+    """Последние профили медленных запросов (PROFILE_SLOW_MS)"""
+    check_internal_token(x_internal_token)
+    if slow_profiler is None:
+        return {"enabled": False, "profiles": []}
+    return {"enabled": True, "threshold_ms": slow_profiler.threshold * 1000, "profiles": list(slow_profiler.profiles)}
+
+
+@app.get("/api/admin/shards")
+async def get_shards(x_internal_token: Optional[str] = Header(None)):
+    """Шарды базы игроков и число игроков в каждом"""
+    check_internal_token(x_internal_token)
+    counts = await shard_map.fan_out(count_players)
+    return {
+        "shards": [{"index": shard.index, "url": mask_url(shard.url), "players": count}
+                   for shard, count in zip(shard_map, counts)],
+        "total_players": sum(counts),
+    }
+
+
+def level_payload(game_state: GameState) -> dict:
+    """Производные поля уровня для фронтенда и бота"""
+    info = levels.level_info(game_state.total_xp)
+    return {
+        "user_id": game_state.user_id,
+        **info._asdict(),
+        "next_level_rewards": dict(info.next_level_rewards),
+        "unlocked_features": list(info.unlocked_features),
+        "unlocked_plants": [crop.name for crop in crops.unlocked(info.current_level)],
+    }
+
+
+@app.get("/api/crops")
+async def get_crops(request: Request, response: Response):
+    """Каталог культур: цены, время роста, уровень и редкость"""
+    table = STATIC_TABLES["crops"]
+    return conditional(request, response, table.etag, table.response, max_age=3600)
+
+
+@app.get("/api/plants/info")
+async def get_plants_info(request: Request, response: Response):
+    """Каталог культур (адрес, который запрашивает фронтенд)"""
+    return await get_crops(request, response)
+
+
+@app.get("/api/levels/info/{user_id}")
+async def get_level_info(user_id: int, request: Request, response: Response):
+    """Информация об уровне игрока"""
+    game_state = await get_state_or_404(user_id)
+    etag = make_etag("level", user_id, game_state.total_xp)
+    return conditional(request, response, etag, lambda: level_payload(game_state))
+
+
+@app.get("/api/levels/leaderboard")
+async def get_leaderboard(request: Request, response: Response, limit: int = 10, offset: int = 0):
+    """Таблица лидеров по общему опыту"""
+    limit = max(1, min(limit, 100))
+    rows = leaderboard.top(limit, max(offset, 0))
+    total = len(leaderboard)
+    # ETag зависит от содержимого страницы и числа игроков, а не от всего рейтинга
+    etag = make_etag("leaderboard", offset, total,
+                     [(row["user_id"], row["total_xp"], row["username"]) for row in rows])
+    return conditional(request, response, etag, lambda: {
+        "leaderboard": rows,
+        "total": total,
+        "limit": limit,
+        "offset": offset,
+    }, max_age=10)
+
+
+@app.get("/api/levels/leaderboard/{user_id}")
+async def get_leaderboard_position(user_id: int, radius: int = 2):
+    """Место игрока и соседи по рейтингу"""
+    rank = leaderboard.rank(user_id)
+    if rank is None:
+        raise HTTPException(status_code=404, detail="Player is not ranked")
+    return {
+        "user_id": user_id,
+        "rank": rank,
+        "total": len(leaderboard),
+        "leaderboard": leaderboard.around(user_id, max(0, min(radius, 25))),
+    }
+
+
+@app.get("/api/levels/curve")
+async def get_level_curve(request: Request, response: Response):
+    """Таблица опыта и наград по уровням"""
+    table = STATIC_TABLES["levels_curve"]
+    return conditional(request, response, table.etag, table.response, max_age=3600)
+
+
+@app.get("/api/levels/{user_id}")
+async def get_level(user_id: int, request: Request, response: Response):
+    """Информация об уровне игрока (формат фронтенда)"""
+    return await get_level_info(user_id, request, response)
+
+
+@app.post("/api/levels/add-xp")
+async def add_xp(request: AddXpRequest, idempotency_key: Optional[str] = Header(None)):
+    """Начислить опыт и выдать награды за все пройденные уровни"""
+    if request.xp < 0:
+        raise HTTPException(status_code=400, detail="XP must be positive")
 
-    game_state = fake_db[user_id]
-    for plant in game_state.plants:
-        if plant.id == plant_id:
-            plant.growth_stage = min(plant.growth_stage + 1, 3)  # Макс 3 стадии
-            return {"message": f"Plant {plant_id} watered", "growth_stage": plant.growth_stage}
+    def operation(game_state: GameState) -> dict:
+        gain = actions.grant_xp(game_state, request.xp)
+        return {
+            **level_payload(game_state),
+            "level_up": gain.level_up,
+            "old_level": gain.old_level,
+            "new_level": gain.new_level,
+            "rewards": dict(gain.rewards),
+            "reward_coins": gain.rewards.get("coins", 0),
+            "reward_diamonds": gain.rewards.get("diamonds", 0),
+        }
 
-    raise HTTPException(status_code=404, detail="Plant not found")
+    return await run_action(request.playerId, operation, idempotency_key)
 
 
 # Информация о сервере
@@ -0,0 +1,359 @@
+"""Метрики запросов в текстовом формате Prometheus.
+
+Middleware заводит на каждый HTTP-запрос RequestStats в contextvar.
+Хуки SQLAlchemy и сериализации ответа добавляют в него число запросов к
+базе, время в базе и время сериализации, а по завершении запроса все
+это попадает в гистограммы с меткой маршрута (шаблон пути, а не сам
+путь). Запросы к базе вне HTTP-запросов (сброс кэша, таймеры) считаются
+отдельно. Значения, которые и так считают другие модули (попадания в
+кэш состояний), снимаются функциями в момент чтения /api/metrics.
+
+Профилировщик медленных запросов (PROFILE_SLOW_MS) - поток, который раз
+в PROFILE_INTERVAL_MS снимает стек потока event loop, пока идет
+профилируемый запрос. Одновременно профилируется один запрос; другие
+корутины, выполняющиеся в это время, тоже попадут в выборку.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as _Counter, deque
+from contextvars import ContextVar
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from fastapi.routing import APIRoute
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Монотонный счетчик с метками"""
+
+    def __init__(self, name: str, help: str, label_names: Labels = ()):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels = (), value: float = 1.0) -> None:
+        self.values[labels] = self.values.get(labels, 0.0) + value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин"""
+
+    def __init__(self, name: str, help: str, label_names: Labels = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.buckets = buckets
+        # метки -> [счетчики корзин..., +Inf], сумма
+        self.values: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, labels: Labels, value: float) -> None:
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1][0] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.label_names + ("le",)
+        for labels, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{self.name}_bucket{_format_labels(names, labels + (le,))} {cumulative}")
+            base = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{base} {total[0]:g}")
+            lines.append(f"{self.name}_count{base} {cumulative}")
+        return lines
+
+
+class Collected:
+    """Метрика, значения которой возвращает функция в момент чтения"""
+
+    def __init__(self, name: str, help: str, kind: str, label_names: Labels,
+                 collect: Callable[[], Dict[Labels, float]]):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.label_names = label_names
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {value:g}")
+        return lines
+
+
+ROUTE = ("method", "route")
+
+REQUESTS = Counter("http_requests_total", "HTTP requests by route and status", ROUTE + ("status",))
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "HTTP request latency", ROUTE)
+DB_QUERIES = Histogram("http_request_db_queries", "DB queries per HTTP request", ROUTE, QUERY_BUCKETS)
+DB_SECONDS = Histogram("http_request_db_seconds", "Time in DB per HTTP request", ROUTE)
+SERIALIZE_SECONDS = Histogram("http_request_serialize_seconds", "Response serialization time per HTTP request",
+                              ROUTE)
+BACKGROUND_QUERIES = Counter("db_background_queries_total", "DB queries outside HTTP requests")
+BACKGROUND_DB_SECONDS = Counter("db_background_seconds_total", "Time in DB outside HTTP requests")
+CACHE_REQUESTS = Counter("cache_requests_total", "Cache lookups by cache and result", ("cache", "result"))
+
+_metrics: List = [REQUESTS, REQUEST_SECONDS, DB_QUERIES, DB_SECONDS, SERIALIZE_SECONDS,
+                  BACKGROUND_QUERIES, BACKGROUND_DB_SECONDS, CACHE_REQUESTS]
+
+
+def register(name: str, help: str, collect: Callable[[], Dict[Labels, float]],
+             kind: str = "gauge", label_names: Labels = ()) -> None:
+    """Добавить метрику, снимаемую функцией collect при чтении"""
+    _metrics.append(Collected(name, help, kind, label_names, collect))
+
+
+def cache_lookup(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.inc((cache, "hit" if hit else "miss"))
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds", "serialize_seconds", "endpoint_done")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serialize_seconds = 0.0
+        # perf_counter() в момент возврата эндпоинта, см. TimedRoute
+        self.endpoint_done: Optional[float] = None
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def instrument_engine(engine) -> None:
+    """Считать запросы и время в базе (engine - AsyncEngine или Engine)"""
+    from sqlalchemy import event
+
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["metrics_started"].pop()
+        stats = _current.get()
+        if stats is None:
+            BACKGROUND_QUERIES.inc()
+            BACKGROUND_DB_SECONDS.inc(value=elapsed)
+        else:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+
+
+class TimedRoute(APIRoute):
+    """APIRoute, засекающий сериализацию: от возврата эндпоинта до готового ответа.
+
+    Сюда входят проверка response_model, jsonable_encoder и json.dumps.
+    """
+
+    def get_route_handler(self):
+        call = self.dependant.call
+        # Обертка того же вида: FastAPI по ней решает, запускать ли эндпоинт в пуле потоков
+        if asyncio.iscoroutinefunction(call):
+            async def timed_call(**values):
+                try:
+                    return await call(**values)
+                finally:
+                    _mark_endpoint_done()
+        else:
+            def timed_call(**values):
+                try:
+                    return call(**values)
+                finally:
+                    _mark_endpoint_done()
+        self.dependant.call = timed_call
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            response = await handler(request)
+            stats = _current.get()
+            if stats is not None and stats.endpoint_done is not None:
+                stats.serialize_seconds += time.perf_counter() - stats.endpoint_done
+                stats.endpoint_done = None
+            return response
+
+        return timed_handler
+
+
+def _mark_endpoint_done() -> None:
+    stats = _current.get()
+    if stats is not None:
+        stats.endpoint_done = time.perf_counter()
+
+
+class SlowRequestProfiler:
+    """Выборочный профилировщик стека потока event loop"""
+
+    def __init__(self, threshold: float, interval: float = 0.005, keep: int = 20, depth: int = 40):
+        self.threshold = threshold
+        self.interval = interval
+        self.depth = depth
+        self.profiles: Deque[Dict] = deque(maxlen=keep)
+        self._samples: _Counter = _Counter()
+        self._active = threading.Event()
+        self._busy = False
+        self._thread: Optional[threading.Thread] = None
+        self._target = 0
+
+    def begin(self) -> bool:
+        """Начать выборку для текущего запроса; False - уже профилируется другой"""
+        if self._busy:
+            return False
+        self._busy = True
+        self._target = threading.get_ident()
+        self._samples = _Counter()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._sample, name="request-profiler", daemon=True)
+            self._thread.start()
+        self._active.set()
+        return True
+
+    def cancel(self) -> None:
+        self._active.clear()
+        self._busy = False
+
+    def end(self, method: str, route: str, elapsed: float, force: bool = False) -> None:
+        """Закончить выборку и сохранить профиль, если запрос медленный или force"""
+        self.cancel()
+        if elapsed < self.threshold and not force:
+            return
+        samples = self._samples
+        total = sum(samples.values())
+        top = [{"stack": list(stack), "samples": count} for stack, count in samples.most_common(10)]
+        self.profiles.append({"method": method, "route": route, "seconds": round(elapsed, 4),
+                              "at": time.time(), "samples": total, "top": top})
+        if top:
+            logger.warning(f"Slow request {method} {route}: {elapsed * 1000:.0f} ms, "
+                           f"hottest {top[0]['stack'][-1]} ({top[0]['samples']}/{total} samples)")
+
+    def _sample(self) -> None:
+        while True:
+            self._active.wait()
+            time.sleep(self.interval)
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None and len(stack) < self.depth:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            if stack and self._active.is_set():
+                self._samples[tuple(reversed(stack))] += 1
+
+
+def profiler_from_env() -> Optional[SlowRequestProfiler]:
+    threshold = float(os.getenv("PROFILE_SLOW_MS", "0"))
+    if threshold <= 0:
+        return None
+    return SlowRequestProfiler(threshold / 1000, float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000)
+
+
+class MetricsMiddleware:
+    """ASGI middleware: задержка, запросы к базе и сериализация по маршрутам"""
+
+    def __init__(self, app, router, profiler: Optional[SlowRequestProfiler] = None,
+                 profile_token: Optional[str] = None):
+        self.app = app
+        self.router = router
+        self.profiler = profiler
+        self.profile_token = profile_token
+        self._routes: Dict[Callable, str] = {}
+
+    def _route(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        path = self._routes.get(endpoint)
+        if path is None:
+            self._routes = {getattr(route, "endpoint", None): route.path for route in self.router.routes}
+            path = self._routes.get(endpoint, "unmatched")
+        return path
+
+    def _force_profile(self, scope) -> bool:
+        # Заголовок X-Profile: <INTERNAL_API_TOKEN> профилирует запрос независимо от порога
+        for name, value in scope.get("headers", ()):
+            if name == b"x-profile":
+                return self.profile_token is not None and value.decode() == self.profile_token
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        status = 500
+        streaming = False
+
+        async def send_wrapper(message):
+            nonlocal status, streaming
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                streaming = any(name == b"content-type" and value.startswith(b"text/event-stream")
+                                for name, value in message.get("headers", ()))
+                if streaming and profiling:
+                    # Поток событий держал бы профилировщик до отключения клиента
+                    profiler.cancel()
+            await send(message)
+
+        profiler = self.profiler
+        force = profiler is not None and self._force_profile(scope)
+        profiling = profiler is not None and profiler.begin()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _current.reset(token)
+            labels = (scope["method"], self._route(scope))
+            if profiling and not streaming:
+                profiler.end(labels[0], labels[1], elapsed, force)
+            REQUESTS.inc(labels + (str(status),))
+            # Длительность SSE-потока - время подписки, а не обработки
+            if not streaming:
+                REQUEST_SECONDS.observe(labels, elapsed)
+                DB_QUERIES.observe(labels, stats.queries)
+                DB_SECONDS.observe(labels, stats.db_seconds)
+                SERIALIZE_SECONDS.observe(labels, stats.serialize_seconds)
@@ -0,0 +1,85 @@
+"""ORM-модели, повторяющие таблицы из миграций Alembic"""
+from sqlalchemy import Boolean, Column, Float, ForeignKey, Integer, JSON, LargeBinary, String, UniqueConstraint
+
+from app.database import Base
+
+
+class Player(Base):
+    __tablename__ = "players"
+
+    id = Column(Integer, primary_key=True, index=True)
+    telegram_id = Column(Integer, unique=True, index=True, nullable=True)
+    username = Column(String, nullable=True)
+    coins = Column(Integer, nullable=False, default=1000)
+    diamonds = Column(Integer, nullable=False, default=5)
+    created_at = Column(Float, nullable=False)
+    last_active = Column(Float, nullable=False)
+    revision = Column(Integer, nullable=False, default=0, server_default="0")
+    # Ферма целиком (app/farm_grid.py); NULL - старый игрок с клетками в farm_cells
+    farm_grid = Column(LargeBinary, nullable=True)
+    # Счетчики событий для достижений (app/achievements.py)
+    stats = Column(JSON, nullable=True)
+
+
+class PlayerLevel(Base):
+    __tablename__ = "player_levels"
+
+    id = Column(Integer, primary_key=True, index=True)
+    player_id = Column(Integer, ForeignKey("players.id"), unique=True, index=True, nullable=False)
+    current_level = Column(Integer, nullable=False, default=1)
+    current_xp = Column(Integer, nullable=False, default=0)
+    total_xp = Column(Integer, nullable=False, default=0)
+    created_at = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False)
+
+
+class Inventory(Base):
+    __tablename__ = "inventories"
+
+    id = Column(Integer, primary_key=True, index=True)
+    player_id = Column(Integer, ForeignKey("players.id"), unique=True, index=True, nullable=False)
+    seeds = Column(JSON, nullable=True)
+    harvest = Column(JSON, nullable=True)
+
+
+class Achievement(Base):
+    __tablename__ = "achievements"
+    __table_args__ = (UniqueConstraint("player_level_id", "name", name="uq_player_achievement"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    player_level_id = Column(Integer, ForeignKey("player_levels.id"), index=True, nullable=False)
+    name = Column(String, nullable=False)
+    description = Column(String, nullable=False)
+    unlocked_at = Column(Float, nullable=True)
+    reward = Column(JSON, nullable=True)
+
+
+class FarmCell(Base):
+    __tablename__ = "farm_cells"
+    __table_args__ = (UniqueConstraint("player_id", "x", "y", name="uq_player_cell"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    player_id = Column(Integer, ForeignKey("players.id"), index=True, nullable=False)
+    x = Column(Integer, nullable=False)
+    y = Column(Integer, nullable=False)
+    plant_type = Column(String, nullable=True)
+    planted_at = Column(Float, nullable=True)
+    stage = Column(String, nullable=True)
+    is_watered = Column(Boolean, nullable=True)
+    has_fertilizer = Column(Boolean, nullable=True)
+    watered_at = Column(Float, nullable=True)
+    fertilized_at = Column(Float, nullable=True)
+    growth_bonus = Column(Float, nullable=False, default=0.0, server_default="0")
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (UniqueConstraint("player_id", "key", name="uq_player_idempotency_key"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    player_id = Column(Integer, ForeignKey("players.id"), index=True, nullable=False)
+    key = Column(String, nullable=False)
+    # Ответ на первый запрос с этим ключом, повторы получают его же
+    response = Column(JSON, nullable=True)
+    # Индекс для ночной очистки просроченных ключей
+    created_at = Column(Float, nullable=False, index=True)
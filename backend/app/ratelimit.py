@@ -0,0 +1,273 @@
+"""Ограничение частоты запросов и склейка одинаковых чтений.
+
+Каждый запрос к /api попадает в класс: action (изменения игрока), read
+(чтения игрока) или anonymous (без id игрока в пути, ключ - IP). Для
+пары (класс, игрок) ведется token bucket: rate токенов в секунду,
+не больше burst. Пустое ведро - 429 с Retry-After, через сколько
+появится токен. Запросы бота с X-Internal-Token не ограничиваются.
+
+Одинаковые GET одного игрока (путь, query, If-None-Match), пришедшие,
+пока первый еще выполняется, ждут его и получают копию ответа.
+
+Если в обработке больше MAX_CONCURRENT_REQUESTS запросов, новые сразу
+получают 429: очередь не растет, и задержка обработанных не страдает.
+
+Ведра хранятся в процессе. С RATE_LIMIT_REDIS_URL они общие для всех
+воркеров, как брокер в app/realtime.py (пакет redis - в requirements.txt);
+при ошибке Redis решает локальное ведро.
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+# Пути с id игрока: /api/game/{id}..., /api/levels/{id}, /api/levels/info/{id}, ...
+_PLAYER_PATH = re.compile(r"^/api/(?:game|events|ws|levels(?:/info|/leaderboard)?)/(\d+)(?:/|$)")
+# Служебные маршруты не ограничиваются и не сбрасываются при перегрузке
+EXEMPT_PREFIXES = ("/api/health", "/api/startup", "/api/metrics")
+# Долгие подписки не занимают место среди одновременно обрабатываемых запросов
+STREAM_PREFIXES = ("/api/events/",)
+
+_rejected: Dict[Tuple[str, ...], int] = {}
+_coalesced = [0]
+
+metrics.register("http_requests_rejected_total", "Requests rejected by rate limit or load shedding",
+                 lambda: dict(_rejected), kind="counter", label_names=("reason",))
+metrics.register("http_requests_coalesced_total", "GET requests served from an identical in-flight request",
+                 lambda: {(): _coalesced[0]}, kind="counter")
+
+
+class Limit(NamedTuple):
+    rate: float
+    burst: float
+
+
+DEFAULT_LIMITS = {
+    "action": Limit(10, 30),
+    "read": Limit(5, 20),
+    "anonymous": Limit(50, 100),
+}
+
+
+def parse_limit(text: str) -> Optional[Limit]:
+    """"rate/burst" -> Limit; "0" - без ограничения"""
+    rate, _, burst = text.partition("/")
+    if float(rate) <= 0:
+        return None
+    return Limit(float(rate), float(burst or rate))
+
+
+class LocalBackend:
+    """Ведра в памяти процесса; самые давние выселяются сверх max_keys"""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, limit: Limit, now: float) -> float:
+        """Взять токен; 0 - взят, иначе секунды до следующего токена"""
+        tokens, updated = self._buckets.pop(key, (limit.burst, now))
+        tokens = min(limit.burst, tokens + (now - updated) * limit.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / limit.rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+    async def close(self) -> None:
+        pass
+
+
+_TAKE_SCRIPT = """
+local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'at')
+local tokens = tonumber(state[1]) or burst
+local at = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - at) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'at', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisBackend:
+    """Общие для воркеров ведра: одно атомарное обращение к Redis на запрос"""
+
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        try:
+            import redis.asyncio as aioredis
+        except ImportError as e:
+            raise RuntimeError("RedisBackend requires the 'redis' package") from e
+        self.client = aioredis.from_url(url)
+        self.prefix = prefix
+        self.script = self.client.register_script(_TAKE_SCRIPT)
+        self.fallback = LocalBackend()
+
+    async def take(self, key: str, limit: Limit, now: float) -> float:
+        try:
+            return float(await self.script(keys=[self.prefix + key], args=[limit.rate, limit.burst, now]))
+        except Exception as e:
+            logger.warning(f"Rate limit backend failed ({e}), using local bucket")
+            return await self.fallback.take(key, limit, now)
+
+    async def close(self) -> None:
+        await self.client.close()
+
+
+def backend_from_env():
+    """RedisBackend при RATE_LIMIT_REDIS_URL, иначе LocalBackend"""
+    url = os.getenv("RATE_LIMIT_REDIS_URL")
+    return RedisBackend(url) if url else LocalBackend()
+
+
+def limits_from_env() -> Dict[str, Limit]:
+    """RATE_LIMIT_ACTION, RATE_LIMIT_READ, RATE_LIMIT_ANONYMOUS в виде rate/burst"""
+    limits = {}
+    for name, default in DEFAULT_LIMITS.items():
+        text = os.getenv(f"RATE_LIMIT_{name.upper()}")
+        limit = default if text is None else parse_limit(text)
+        if limit is not None:
+            limits[name] = limit
+    return limits
+
+
+def _header(scope, name: bytes) -> Optional[bytes]:
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value
+    return None
+
+
+def client_key(scope) -> Tuple[Optional[str], str]:
+    """(id игрока из пути или None, ключ ведра)"""
+    match = _PLAYER_PATH.match(scope["path"])
+    if match:
+        return match.group(1), "player:" + match.group(1)
+    forwarded = _header(scope, b"x-forwarded-for")
+    if forwarded:
+        # Последний адрес дописал прокси Render, предыдущие задает клиент
+        return None, "ip:" + forwarded.decode().rsplit(",", 1)[-1].strip()
+    client = scope.get("client")
+    return None, "ip:" + (client[0] if client else "unknown")
+
+
+class _Flight:
+    """Выполняющийся GET, ответ которого ждут такие же запросы"""
+
+    __slots__ = ("messages", "done", "failed", "endpoint")
+
+    def __init__(self):
+        self.messages: List[dict] = []
+        self.done = asyncio.Event()
+        self.failed = False
+        self.endpoint = None
+
+
+class RateLimitMiddleware:
+    """ASGI middleware: token bucket по игроку и классу маршрута, склейка GET, сброс нагрузки"""
+
+    def __init__(self, app, limits: Dict[str, Limit], backend=None, max_concurrent: int = 0,
+                 coalesce: bool = True, internal_token: Optional[str] = None):
+        self.app = app
+        self.limits = limits
+        self.backend = backend or LocalBackend()
+        self.max_concurrent = max_concurrent
+        self.coalesce = coalesce
+        self.internal_token = internal_token.encode() if internal_token else None
+        self.in_flight = 0
+        self._flights: Dict[Tuple, _Flight] = {}
+
+    async def _reject(self, send, reason: str, retry_after: float, detail: str) -> None:
+        _rejected[(reason,)] = _rejected.get((reason,), 0) + 1
+        body = json.dumps({"detail": detail}).encode()
+        await send({"type": "http.response.start", "status": 429, "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ]})
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if (scope["type"] != "http" or scope["method"] == "OPTIONS" or not path.startswith("/api/")
+                or path.startswith(EXEMPT_PREFIXES)):
+            await self.app(scope, receive, send)
+            return
+
+        trusted = self.internal_token is not None and _header(scope, b"x-internal-token") == self.internal_token
+        player, key = client_key(scope)
+        reading = scope["method"] in ("GET", "HEAD")
+        if not trusted:
+            route_class = "anonymous" if player is None else "read" if reading else "action"
+            limit = self.limits.get(route_class)
+            if limit is not None:
+                wait = await self.backend.take(f"{route_class}:{key}", limit, time.time())
+                if wait > 0:
+                    await self._reject(send, route_class, wait, "Too many requests")
+                    return
+
+        if self.coalesce and reading and player is not None and not path.startswith(STREAM_PREFIXES):
+            flight_key = (scope["method"], path, scope.get("query_string", b""), _header(scope, b"if-none-match"))
+            flight = self._flights.get(flight_key)
+            if flight is not None:
+                _coalesced[0] += 1
+                await flight.done.wait()
+                if not flight.failed:
+                    # Для метрик по маршрутам: этот запрос роутер не видел
+                    if flight.endpoint is not None:
+                        scope["endpoint"] = flight.endpoint
+                    for message in flight.messages:
+                        await send(message)
+                    return
+                # Первый запрос не дошел до конца ответа: выполняем свой
+            else:
+                await self._lead(flight_key, scope, receive, send)
+                return
+        await self._process(scope, receive, send, path)
+
+    async def _lead(self, flight_key: Tuple, scope, receive, send) -> None:
+        flight = self._flights[flight_key] = _Flight()
+
+        async def send_wrapper(message):
+            flight.messages.append(message)
+            await send(message)
+
+        try:
+            await self._process(scope, receive, send_wrapper, scope["path"])
+            last = flight.messages[-1] if flight.messages else {}
+            flight.failed = last.get("type") != "http.response.body" or last.get("more_body", False)
+        except BaseException:
+            flight.failed = True
+            raise
+        finally:
+            flight.endpoint = scope.get("endpoint")
+            del self._flights[flight_key]
+            flight.done.set()
+
+    async def _process(self, scope, receive, send, path: str) -> None:
+        if path.startswith(STREAM_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+        if self.max_concurrent and self.in_flight >= self.max_concurrent:
+            await self._reject(send, "overload", 1, "Server is busy")
+            return
+        self.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
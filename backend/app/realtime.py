@@ -0,0 +1,224 @@
+"""Push-обновления состояния через WebSocket и SSE.
+
+Hub держит подписки подключенных клиентов этого процесса. События
+публикуются через брокер: LocalBroker доставляет их в том же процессе
+(разработка и тесты), RedisBroker - во все воркеры через Redis pub/sub.
+Для подключенных игроков hub ставит по одному таймеру на ближайшую
+смену стадии роста, поэтому созревание приходит без опроса и без
+обхода всех ферм.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from app import growth
+from app.schemas import GameState
+
+logger = logging.getLogger(__name__)
+
+Deliver = Callable[[int, dict], None]
+StateGetter = Callable[[int], Awaitable[Optional[GameState]]]
+
+# Запас после расчетного момента смены стадии на погрешность float
+STAGE_TIMER_SLACK = 0.05
+
+
+class LocalBroker:
+    """Брокер внутри процесса"""
+
+    def __init__(self):
+        self._deliver: Optional[Deliver] = None
+
+    async def start(self, deliver: Deliver) -> None:
+        self._deliver = deliver
+
+    async def publish(self, user_id: int, event: dict) -> None:
+        if self._deliver is not None:
+            self._deliver(user_id, event)
+
+    async def close(self) -> None:
+        self._deliver = None
+
+
+class RedisBroker:
+    """Брокер поверх Redis pub/sub для нескольких воркеров"""
+
+    channel = "farmers-dream:events"
+
+    def __init__(self, url: str):
+        try:
+            import redis.asyncio as aioredis
+        except ImportError as e:
+            raise RuntimeError("RedisBroker requires the 'redis' package") from e
+        self._redis = aioredis.from_url(url)
+        self._pubsub = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, deliver: Deliver) -> None:
+        self._pubsub = self._redis.pubsub()
+        await self._pubsub.subscribe(self.channel)
+        self._task = asyncio.get_running_loop().create_task(self._listen(deliver))
+
+    async def _listen(self, deliver: Deliver) -> None:
+        async for message in self._pubsub.listen():
+            if message.get("type") != "message":
+                continue
+            try:
+                payload = json.loads(message["data"])
+                deliver(payload["user_id"], payload["event"])
+            except Exception as e:
+                logger.error(f"Bad realtime message: {e}")
+
+    async def publish(self, user_id: int, event: dict) -> None:
+        await self._redis.publish(self.channel, json.dumps({"user_id": user_id, "event": event}))
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+        if self._pubsub is not None:
+            await self._pubsub.close()
+        await self._redis.close()
+
+
+def broker_from_env():
+    """RedisBroker при REALTIME_REDIS_URL, иначе LocalBroker"""
+    url = os.getenv("REALTIME_REDIS_URL")
+    return RedisBroker(url) if url else LocalBroker()
+
+
+def next_stage_time(state: GameState, now: float) -> Optional[float]:
+    """Ближайший момент смены стадии среди растений игрока"""
+    farm = state.farm
+    times = [farm.next_stage_at(index, now) for index in farm.occupied()]
+    times = [t for t in times if t is not None]
+    return min(times) if times else None
+
+
+class Subscription:
+    """Очередь событий одного подключения"""
+
+    def __init__(self, hub: "Hub", user_id: int, maxsize: int):
+        self.hub = hub
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+
+    def put(self, event: dict) -> None:
+        # Медленный клиент теряет самые старые события, а не тормозит остальных
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self) -> dict:
+        return await self.queue.get()
+
+    def close(self) -> None:
+        self.hub.unsubscribe(self)
+
+
+class Hub:
+    """Подписки клиентов процесса и таймеры смены стадий"""
+
+    def __init__(self, broker=None, queue_size: int = 100):
+        self.broker = broker if broker is not None else LocalBroker()
+        self.queue_size = queue_size
+        self._subscribers: Dict[int, Set[Subscription]] = {}
+        self._timers: Dict[int, asyncio.TimerHandle] = {}
+        # Ссылки на фоновые задачи: без них цикл может собрать задачу недовыполненной
+        self._tasks: Set[asyncio.Task] = set()
+        self._get_state: Optional[StateGetter] = None
+
+    async def start(self, get_state: StateGetter) -> None:
+        self._get_state = get_state
+        await self.broker.start(self._deliver)
+
+    async def close(self) -> None:
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        for task in list(self._tasks):
+            task.cancel()
+        await self.broker.close()
+
+    def connections(self, user_id: Optional[int] = None) -> int:
+        if user_id is not None:
+            return len(self._subscribers.get(user_id, ()))
+        return sum(len(subs) for subs in self._subscribers.values())
+
+    def subscribe(self, user_id: int) -> Subscription:
+        subscription = Subscription(self, user_id, self.queue_size)
+        self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subs = self._subscribers.get(subscription.user_id)
+        if subs is None:
+            return
+        subs.discard(subscription)
+        if not subs:
+            del self._subscribers[subscription.user_id]
+            timer = self._timers.pop(subscription.user_id, None)
+            if timer is not None:
+                timer.cancel()
+
+    def _deliver(self, user_id: int, event: dict) -> None:
+        for subscription in list(self._subscribers.get(user_id, ())):
+            subscription.put(event)
+
+    async def publish(self, user_id: int, event: dict) -> None:
+        await self.broker.publish(user_id, event)
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Realtime task failed: {task.exception()!r}")
+
+    def notify_state(self, user_id: int, event: dict, state: GameState) -> None:
+        """Сообщить об изменении состояния и переставить таймер стадии"""
+        self._spawn(self.publish(user_id, event))
+        self.schedule(user_id, state)
+
+    def schedule(self, user_id: int, state: GameState) -> None:
+        """Поставить таймер на ближайшую смену стадии подключенного игрока"""
+        timer = self._timers.pop(user_id, None)
+        if timer is not None:
+            timer.cancel()
+        if user_id not in self._subscribers:
+            return
+
+        now = time.time()
+        at = next_stage_time(state, now)
+        if at is None:
+            return
+        delay = max(at - now, 0.0) + STAGE_TIMER_SLACK
+        self._timers[user_id] = asyncio.get_running_loop().call_later(
+            delay, lambda: self._spawn(self._stage_due(user_id)))
+
+    async def _stage_due(self, user_id: int) -> None:
+        self._timers.pop(user_id, None)
+        if user_id not in self._subscribers or self._get_state is None:
+            return
+        state = await self._get_state(user_id)
+        if state is None:
+            return
+
+        # Стадии в farm.stage - последние разосланные, сравниваем с текущими
+        farm = state.farm
+        cells: List[dict] = [
+            {"id": index + 1, "growth_stage": farm.stage[index], "ripe": farm.stage[index] >= growth.MAX_STAGE}
+            for index in farm.refresh(time.time())
+        ]
+        if cells:
+            await self.publish(user_id, {"type": "stage", "revision": state.revision, "cells": cells})
+        self.schedule(user_id, state)
+
+
+# Один hub на процесс
+hub = Hub(broker_from_env())
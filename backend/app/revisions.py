@@ -0,0 +1,117 @@
+"""Ревизии игрового состояния для ответов "изменения с ревизии N".
+
+Для каждого поля, клетки и ключа инвентаря хранится номер ревизии, в
+которой оно менялось последний раз, и компактный отпечаток значения.
+При фиксации изменений сравниваются только отпечатки, а ответ на
+"since N" строится из ключей с ревизией больше N и текущих значений.
+Полный снимок нужен, только если N старше, чем помнит сервер.
+"""
+from typing import Any, Dict, Hashable, List, Optional
+
+from app.schemas import GameState
+
+# Дальше этого разрыва дешевле отдать полный снимок
+MAX_DELTA_GAP = 1000
+
+SCALAR_FIELDS = ("money", "diamonds", "level", "total_xp", "farm_size", "username")
+
+_MISSING = object()
+
+
+class StateVersions:
+    """Ревизии ключей одного игрока с момента загрузки в память"""
+
+    __slots__ = ("base", "saved", "prints", "revs")
+
+    def __init__(self, base: int):
+        # Изменения до base неизвестны: с него начинаются ответы-дельты
+        self.base = base
+        # Ревизия, записанная в базу: ключи с ревизией больше нее еще не записаны
+        self.saved = base
+        self.prints: Dict[Hashable, Any] = {}
+        self.revs: Dict[Hashable, int] = {}
+
+
+def _fingerprints(state: GameState) -> Dict[Hashable, Any]:
+    prints: Dict[Hashable, Any] = {("field", name): getattr(state, name) for name in SCALAR_FIELDS}
+    farm = state.farm
+    for index in farm.occupied():
+        prints[("cell", index + 1)] = farm.fingerprint(index)
+    for section in ("seeds", "harvest"):
+        for key, count in getattr(state.inventory, section).items():
+            prints[(section, key)] = count
+    for name, unlocked_at in state.achievements.items():
+        prints[("achievement", name)] = unlocked_at
+    return prints
+
+
+def _versions(state: GameState) -> StateVersions:
+    versions = state._versions
+    if versions is None:
+        versions = StateVersions(state.revision)
+        versions.prints = _fingerprints(state)
+        state._versions = versions
+    return versions
+
+
+def track(state: GameState) -> None:
+    """Начать отслеживание состояния, загруженного из базы"""
+    _versions(state)
+
+
+def commit(state: GameState) -> int:
+    """Зафиксировать изменения: поднять ревизию, если что-то поменялось"""
+    versions = _versions(state)
+    prints = _fingerprints(state)
+    changed = [key for key, value in prints.items() if versions.prints.get(key, _MISSING) != value]
+    # Исчезнувшие ключи (собранная клетка, проданный урожай) - тоже изменения
+    changed += versions.prints.keys() - prints.keys()
+    if not changed:
+        return state.revision
+
+    state.revision += 1
+    for key in changed:
+        versions.revs[key] = state.revision
+    versions.prints = prints
+    return state.revision
+
+
+def changes_since(state: GameState, since: int) -> Optional[Dict[str, Any]]:
+    """Изменения после ревизии since или None, если нужен полный снимок"""
+    versions = _versions(state)
+    if since < versions.base or since > state.revision or state.revision - since > MAX_DELTA_GAP:
+        return None
+
+    changes: Dict[str, Any] = {}
+    farm = state.farm
+    for key, rev in versions.revs.items():
+        if rev <= since:
+            continue
+        kind, name = key
+        if kind == "field":
+            changes[name] = getattr(state, name)
+        elif kind == "cell":
+            index = name - 1
+            view = None if index >= len(farm) or farm.is_empty(index) else farm.plant_view(index)
+            changes.setdefault("cells", {})[name] = view
+        elif kind == "achievement":
+            changes.setdefault("achievements", {})[name] = state.achievements.get(name)
+        else:
+            items = getattr(state.inventory, kind)
+            changes.setdefault("inventory", {}).setdefault(kind, {})[name] = items.get(name, 0)
+    return changes
+
+
+def unsaved_achievements(state: GameState) -> List[str]:
+    """Достижения, открытые после последней записи (без отслеживания - все)"""
+    versions = state._versions
+    if versions is None:
+        return list(state.achievements)
+    return [name for name in state.achievements if versions.revs.get(("achievement", name), 0) > versions.saved]
+
+
+def mark_saved(state: GameState, revision: int) -> None:
+    """Отметить, что ревизия revision записана в базу"""
+    versions = state._versions
+    if versions is not None and revision > versions.saved:
+        versions.saved = revision
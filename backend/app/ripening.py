@@ -0,0 +1,256 @@
+"""Планировщик уведомлений о созревании урожая.
+
+Каждая засаженная клетка лежит в куче по расчетному времени созревания.
+Изменение состояния игрока (посадка, полив, сбор) переставляет только
+его клетки; устаревшие записи кучи отбрасываются при извлечении. Цикл
+спит до ближайшего созревания, складывает созревшее в очередь
+уведомлений, сгруппированную по игрокам, а бот забирает ее пакетами.
+Куча сохраняется в файл и восстанавливается при перезапуске.
+
+Куча и очередь живут в процессе, поэтому планировщик работает только
+при одном воркере: с WEB_CONCURRENCY > 1 каждый воркер видел бы лишь свои
+изменения и слал бы боту те же уведомления. Тогда он выключен.
+"""
+import asyncio
+import heapq
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from app import growth
+from app.farm_grid import FarmGrid
+from app.schemas import GameState
+
+logger = logging.getLogger(__name__)
+
+CellKey = Tuple[int, int]
+
+
+class RipeEntry(NamedTuple):
+    ripe_at: float
+    user_id: int
+    plant_id: int
+    planted_at: float
+    crop: str
+
+
+class RipeningScheduler:
+    """Куча клеток по времени созревания с ленивым удалением"""
+
+    def __init__(self, path: Optional[str] = None,
+                 max_sleep: float = 30.0,
+                 save_interval: float = 60.0,
+                 outbox_limit: int = 100000,
+                 claim_keys: int = 100,
+                 enabled: bool = True):
+        self.path = path
+        self.enabled = enabled
+        self.max_sleep = max_sleep
+        self.save_interval = save_interval
+        self.outbox_limit = outbox_limit
+        self.claim_keys = claim_keys
+
+        self._heap: List[RipeEntry] = []
+        # Актуальная запись каждой клетки; все прочие в куче устарели
+        self._current: Dict[CellKey, RipeEntry] = {}
+        self._by_user: Dict[int, Set[int]] = {}
+        # user_id -> {культура: количество}, в порядке созревания
+        self._outbox: "OrderedDict[int, Dict[str, int]]" = OrderedDict()
+        # Ключ идемпотентности -> выданный пакет: повтор claim не теряет уведомления
+        self._claims: "OrderedDict[str, List[dict]]" = OrderedDict()
+        self._changed = asyncio.Event()
+        self._dirty = False
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._current)
+
+    @property
+    def pending_notifications(self) -> int:
+        return len(self._outbox)
+
+    def _push(self, entry: RipeEntry) -> None:
+        key = (entry.user_id, entry.plant_id)
+        if self._current.get(key) == entry:
+            return
+        self._current[key] = entry
+        self._by_user.setdefault(entry.user_id, set()).add(entry.plant_id)
+        heapq.heappush(self._heap, entry)
+        self._dirty = True
+
+    def _drop(self, user_id: int, plant_id: int) -> None:
+        if self._current.pop((user_id, plant_id), None) is not None:
+            self._dirty = True
+        plants = self._by_user.get(user_id)
+        if plants is not None:
+            plants.discard(plant_id)
+            if not plants:
+                del self._by_user[user_id]
+
+    def schedule_state(self, user_id: int, state: GameState, now: Optional[float] = None) -> None:
+        """Переставить клетки игрока после изменения его состояния"""
+        if not self.enabled:
+            return
+        if now is None:
+            now = time.time()
+        farm = state.farm
+        present = set()
+        for index in farm.occupied():
+            plant_id = index + 1
+            present.add(plant_id)
+            computed = farm.compute(index, now)
+            if computed.stage >= growth.MAX_STAGE:
+                # Уже созревшие клетки уведомления не ждут
+                self._drop(user_id, plant_id)
+                continue
+            self._push(RipeEntry(computed.ripe_at, user_id, plant_id, farm.planted_at[index], farm.crop_name(index)))
+        for plant_id in self._by_user.get(user_id, set()) - present:
+            self._drop(user_id, plant_id)
+        self._changed.set()
+
+    def schedule_entries(self, entries: Iterable[RipeEntry]) -> None:
+        if not self.enabled:
+            return
+        for entry in entries:
+            self._push(entry)
+        self._changed.set()
+
+    def pop_due(self, now: Optional[float] = None) -> int:
+        """Перенести созревшие клетки в очередь уведомлений, вернуть их число"""
+        if now is None:
+            now = time.time()
+        fired = 0
+        while self._heap and self._heap[0].ripe_at <= now:
+            entry = heapq.heappop(self._heap)
+            key = (entry.user_id, entry.plant_id)
+            if self._current.get(key) != entry:
+                continue
+            self._drop(entry.user_id, entry.plant_id)
+            crops = self._outbox.setdefault(entry.user_id, {})
+            crops[entry.crop] = crops.get(entry.crop, 0) + 1
+            fired += 1
+        while len(self._outbox) > self.outbox_limit:
+            self._outbox.popitem(last=False)
+        # Куча не должна расти из устаревших записей бесконечно
+        if len(self._heap) > 2 * len(self._current) + 1024:
+            self._heap = list(self._current.values())
+            heapq.heapify(self._heap)
+        return fired
+
+    def claim(self, limit: int = 100, key: Optional[str] = None) -> List[dict]:
+        """Забрать до limit уведомлений (по одному на игрока).
+
+        Повтор с тем же key возвращает тот же пакет, а не следующий.
+        """
+        if key is not None and key in self._claims:
+            return self._claims[key]
+        batch = []
+        while self._outbox and len(batch) < limit:
+            user_id, crops = self._outbox.popitem(last=False)
+            batch.append({"user_id": user_id, "crops": crops})
+        if key is not None:
+            self._claims[key] = batch
+            while len(self._claims) > self.claim_keys:
+                self._claims.popitem(last=False)
+        return batch
+
+    def next_due(self) -> Optional[float]:
+        while self._heap:
+            entry = self._heap[0]
+            if self._current.get((entry.user_id, entry.plant_id)) == entry:
+                return entry.ripe_at
+            heapq.heappop(self._heap)
+        return None
+
+    # Сохранение и восстановление
+
+    def save(self) -> None:
+        if not self.path or not self.enabled:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump([list(entry) for entry in self._current.values()], f)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+    def load(self) -> bool:
+        """Восстановить кучу из файла; False, если файла нет"""
+        if not self.path or not self.enabled or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path) as f:
+                entries = [RipeEntry(*row) for row in json.load(f)]
+        except (OSError, ValueError, TypeError) as e:
+            logger.error(f"Can't restore ripening schedule: {e}")
+            return False
+        self.schedule_entries(entries)
+        self._dirty = False
+        return True
+
+    async def _run(self) -> None:
+        last_save = time.monotonic()
+        while not self._stopping:
+            now = time.time()
+            self.pop_due(now)
+            next_due = self.next_due()
+            sleep = self.max_sleep if next_due is None else min(max(next_due - now, 0.0), self.max_sleep)
+            self._changed.clear()
+            # stop() мог выставить флаг до clear(): тогда его set() уже стерт
+            if self._stopping:
+                break
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=sleep)
+            except asyncio.TimeoutError:
+                pass
+            if self._dirty and time.monotonic() - last_save >= self.save_interval:
+                try:
+                    self.save()
+                except OSError as e:
+                    logger.error(f"Can't save ripening schedule: {e}")
+                last_save = time.monotonic()
+
+    def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._changed = asyncio.Event()
+            self._stopping = False
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        # Без cancel(): в 3.11 wait_for теряет отмену, если событие выставлено в том же такте
+        if self._task is not None:
+            self._stopping = True
+            self._changed.set()
+            await self._task
+            self._task = None
+        try:
+            self.save()
+        except OSError as e:
+            logger.error(f"Can't save ripening schedule: {e}")
+
+
+def entries_from_grids(farms: Iterable[Tuple[int, FarmGrid]], now: Optional[float] = None) -> Iterable[RipeEntry]:
+    """Записи кучи для ферм всех игроков (player_id, FarmGrid)"""
+    if now is None:
+        now = time.time()
+    for player_id, farm in farms:
+        for index in farm.occupied():
+            computed = farm.compute(index, now)
+            if computed.stage < growth.MAX_STAGE:
+                yield RipeEntry(computed.ripe_at, player_id, index + 1, farm.planted_at[index], farm.crop_name(index))
+
+
+def scheduler_from_env() -> RipeningScheduler:
+    """Планировщик с файлом из RIPENING_STATE_PATH; при нескольких воркерах выключен"""
+    enabled = int(os.getenv("WEB_CONCURRENCY", "1")) <= 1
+    if not enabled:
+        logger.warning("Ripening notifications disabled: with WEB_CONCURRENCY > 1 every worker "
+                       "would keep its own schedule and notify the same players")
+    return RipeningScheduler(path=os.getenv("RIPENING_STATE_PATH", "./ripening.json"), enabled=enabled)
+
+
+# Один планировщик на процесс
+scheduler = scheduler_from_env()
@@ -0,0 +1,84 @@
+"""Pydantic-модели игрового состояния"""
+import os
+import time
+from typing import Any, Dict, List, Literal, Optional
+
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr, computed_field
+
+from app.farm_grid import FarmGrid
+
+# Сторона квадратной фермы по умолчанию
+FARM_SIZE = int(os.getenv("STARTING_FARM_SIZE", "3"))
+
+
+class Plant(BaseModel):
+    id: int
+    name: str
+    growth_stage: int = 0
+    price: int
+    x: int = 0
+    y: int = 0
+    # Источник истины для роста - временные метки, стадия вычисляется при чтении
+    planted_at: float = 0.0
+    watered_at: Optional[float] = None
+    fertilized_at: Optional[float] = None
+    growth_bonus: float = 0.0
+    progress: float = 0.0
+    ripe_at: Optional[float] = None
+    # Созревшее и несобранное вовремя, см. app/catchup.py
+    is_withered: bool = False
+
+
+class Inventory(BaseModel):
+    seeds: Dict[str, int] = {}
+    harvest: Dict[str, int] = {}
+
+
+class GameState(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    user_id: int
+    username: Optional[str] = None
+    money: int = 100
+    diamonds: int = 0
+    level: int = 1
+    total_xp: int = 0
+    # Ферма хранится в массивах (app/farm_grid.py), в ответы идет списком plants
+    farm: FarmGrid = Field(default_factory=lambda: FarmGrid(FARM_SIZE), exclude=True)
+    inventory: Inventory = Inventory()
+    # Открытые достижения: имя -> время открытия; счетчики для них, см. app/achievements.py
+    achievements: Dict[str, float] = {}
+    stats: Dict[str, int] = Field(default_factory=dict, exclude=True)
+    # Растет при каждом изменении, см. app/revisions.py
+    revision: int = 0
+    _versions: Any = PrivateAttr(default=None)
+
+    @computed_field
+    @property
+    def farm_size(self) -> int:
+        return self.farm.size
+
+    @computed_field
+    @property
+    def plants(self) -> List[Plant]:
+        """Засаженные клетки со стадией на момент сериализации"""
+        now = time.time()
+        return [Plant(**self.farm.plant_view(index, now)) for index in self.farm.occupied()]
+
+
+class AddXpRequest(BaseModel):
+    playerId: int
+    xp: int
+
+
+class GameAction(BaseModel):
+    type: Literal["plant", "water", "fertilize", "harvest", "buy", "sell", "water_all", "harvest_all"]
+    plant_id: Optional[int] = None
+    plant_name: Optional[str] = None
+    x: Optional[int] = None
+    y: Optional[int] = None
+    quantity: int = 1
+
+
+class ActionBatch(BaseModel):
+    actions: List[GameAction] = Field(..., min_length=1, max_length=100)
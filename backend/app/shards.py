@@ -0,0 +1,269 @@
+"""Разбиение игроков по нескольким базам.
+
+Игрок живет целиком в одной базе: строка players и все строки, которые на
+нее ссылаются. Базу выбирает jump consistent hash от id игрока (он же
+telegram id) по списку DATABASE_SHARDS. Без этой переменной шард один -
+DATABASE_URL, и поведение прежнее.
+
+Новые базы добавляются только в конец списка: тогда jump hash переносит
+на них примерно 1/N игроков и не перемешивает остальных. Переезд делает
+rebalance, схему всех шардов обновляет upgrade:
+
+    python -m app.shards upgrade
+    python -m app.shards rebalance --from sqlite:///./farmers.db
+"""
+import argparse
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, TypeVar
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from app import database
+from app.database import Base, make_engine, make_sessionmaker, normalize_url
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+_MASK64 = (1 << 64) - 1
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """Jump consistent hash (Lamping, Veach): номер корзины 0..buckets-1"""
+    key &= _MASK64
+    bucket, jump = -1, 0
+    while jump < buckets:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & _MASK64
+        jump = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def shard_urls() -> List[str]:
+    """Синхронные URL шардов из DATABASE_SHARDS (через запятую) или DATABASE_URL"""
+    urls = [normalize_url(url.strip()) for url in os.getenv("DATABASE_SHARDS", "").split(",") if url.strip()]
+    return urls or [database.DATABASE_URL]
+
+
+def mask_url(url: str) -> str:
+    return make_url(url).render_as_string(hide_password=True)
+
+
+class Shard:
+    """Одна база: движок и фабрика сессий"""
+
+    def __init__(self, index: int, url: str, engine: Optional[AsyncEngine] = None):
+        self.index = index
+        self.url = url
+        if engine is None:
+            self.engine = make_engine(url)
+            self.session = make_sessionmaker(self.engine)
+        else:
+            self.engine = engine
+            self.session = database.SessionLocal
+
+    def __repr__(self) -> str:
+        return f"Shard({self.index}, {mask_url(self.url)!r})"
+
+
+class ShardMap:
+    """Какой игрок в какой базе и запросы сразу ко всем базам"""
+
+    def __init__(self, urls: Sequence[str]):
+        if not urls:
+            raise ValueError("At least one shard URL is required")
+        # База из DATABASE_URL уже открыта модулем database: ее движок не дублируем
+        self.shards = [Shard(index, url, database.engine if url == database.DATABASE_URL else None)
+                       for index, url in enumerate(urls)]
+
+    def __len__(self) -> int:
+        return len(self.shards)
+
+    def __iter__(self) -> Iterator[Shard]:
+        return iter(self.shards)
+
+    def index(self, player_id: int) -> int:
+        return jump_hash(player_id, len(self.shards))
+
+    def for_player(self, player_id: int) -> Shard:
+        return self.shards[self.index(player_id)]
+
+    def group(self, items: Iterable[T], key: Callable[[T], int] = lambda item: item) -> Dict[Shard, List[T]]:
+        """Разложить игроков (или их данные, key дает id) по шардам"""
+        groups: Dict[Shard, List[T]] = {}
+        for item in items:
+            groups.setdefault(self.for_player(key(item)), []).append(item)
+        return groups
+
+    async def fan_out(self, fn: Callable[[Shard], Awaitable[R]]) -> List[R]:
+        """Выполнить fn на всех шардах параллельно; результаты в порядке шардов"""
+        return list(await asyncio.gather(*(fn(shard) for shard in self.shards)))
+
+    async def dispose(self) -> None:
+        await asyncio.gather(*(shard.engine.dispose() for shard in self.shards))
+
+
+shard_map = ShardMap(shard_urls())
+
+
+async def count_players(shard: Shard) -> int:
+    from app.models import Player
+
+    async with shard.session() as db:
+        return (await db.execute(select(func.count()).select_from(Player))).scalar_one()
+
+
+# ===== Переезд игроков между шардами =====
+
+def _player_tables():
+    """players, таблицы со ссылкой на players.id и таблицы со ссылкой на их id.
+
+    Для каждой дочерней таблицы: (таблица, колонка с id игрока); для внучатых:
+    (таблица, колонка-ссылка, родительская таблица). Суррогатные id дочерних
+    строк в другой базе выдаются заново, ссылки внуков на них пересчитываются.
+    """
+    from app import models  # noqa: F401 - регистрируем модели в metadata
+
+    players = Base.metadata.tables["players"]
+    children, grandchildren = [], []
+    for table in Base.metadata.sorted_tables:
+        for fk in table.foreign_keys:
+            if fk.column is players.c.id:
+                children.append((table, fk.parent))
+    for table in Base.metadata.sorted_tables:
+        for fk in table.foreign_keys:
+            for parent, _ in children:
+                if fk.column.table is parent:
+                    grandchildren.append((table, fk.parent, parent))
+    return players, children, grandchildren
+
+
+async def _delete_players(conn: AsyncConnection, player_ids: Sequence[int]) -> None:
+    players, children, grandchildren = _player_tables()
+    for table, column, parent in grandchildren:
+        owner = next(col for t, col in children if t is parent)
+        parent_ids = select(parent.c.id).where(owner.in_(player_ids))
+        await conn.execute(delete(table).where(column.in_(parent_ids)))
+    for table, column in children:
+        await conn.execute(delete(table).where(column.in_(player_ids)))
+    await conn.execute(delete(players).where(players.c.id.in_(player_ids)))
+
+
+async def _copy_players(source: AsyncConnection, target: AsyncConnection, player_ids: Sequence[int]) -> None:
+    players, children, grandchildren = _player_tables()
+    rows = (await source.execute(select(players).where(players.c.id.in_(player_ids)))).mappings().all()
+    if not rows:
+        return
+    await target.execute(insert(players), [dict(row) for row in rows])
+    for table, column in children:
+        nested = [(g, col) for g, col, parent in grandchildren if parent is table]
+        rows = (await source.execute(select(table).where(column.in_(player_ids)))).mappings().all()
+        if not nested:
+            if rows:
+                await target.execute(insert(table), [{k: v for k, v in row.items() if k != "id"} for row in rows])
+            continue
+        # Строки с внуками вставляем по одной, чтобы узнать новый id
+        new_ids = {}
+        for row in rows:
+            result = await target.execute(insert(table).values({k: v for k, v in row.items() if k != "id"}))
+            new_ids[row["id"]] = result.inserted_primary_key[0]
+        for grandchild, ref in nested:
+            if not new_ids:
+                break
+            rows = (await source.execute(select(grandchild).where(ref.in_(list(new_ids))))).mappings().all()
+            if rows:
+                await target.execute(insert(grandchild), [
+                    {**{k: v for k, v in row.items() if k != "id"}, ref.name: new_ids[row[ref.name]]}
+                    for row in rows
+                ])
+
+
+async def rebalance(old_urls: Sequence[str], chunk_size: int = 500, dry_run: bool = False) -> int:
+    """Перенести игроков со старой раскладки old_urls на текущую.
+
+    Запускать при остановленном сервисе и после upgrade всех шардов. Игрок
+    сначала целиком пишется в новую базу (его прежние строки там удаляются,
+    поэтому прерванный перенос можно повторить), затем удаляется из старой.
+    Возвращает число перенесенных игроков.
+    """
+    from app.models import Player
+
+    by_url = {shard.url: shard for shard in shard_map}
+    sources = [by_url.get(url) or Shard(-1, url) for url in map(normalize_url, old_urls)]
+    moved = 0
+    for source in sources:
+        last_id = 0
+        while True:
+            async with source.engine.connect() as conn:
+                ids = (await conn.execute(
+                    select(Player.id).where(Player.id > last_id).order_by(Player.id).limit(chunk_size)
+                )).scalars().all()
+            if not ids:
+                break
+            last_id = ids[-1]
+            for target, group in shard_map.group(ids).items():
+                if target.url == source.url:
+                    continue
+                moved += len(group)
+                logger.info(f"{len(group)} players {mask_url(source.url)} -> {mask_url(target.url)}")
+                if dry_run:
+                    continue
+                async with source.engine.connect() as src, target.engine.begin() as dst:
+                    await _delete_players(dst, group)
+                    await _copy_players(src, dst, group)
+                async with source.engine.begin() as src:
+                    await _delete_players(src, group)
+        if source.index < 0:
+            await source.engine.dispose()
+    return moved
+
+
+def upgrade(revision: str = "head") -> None:
+    """alembic upgrade на каждом шарде (URL передается в env.py через -x url=...)"""
+    from alembic.config import main as alembic_main
+
+    ini = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic.ini")
+    for shard in shard_map:
+        logger.info(f"Upgrading {shard!r} to {revision}")
+        alembic_main(["-c", ini, "-x", f"url={shard.url}", "upgrade", revision])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Шарды базы игроков")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="шарды и число игроков в каждом")
+    up = commands.add_parser("upgrade", help="миграции alembic на всех шардах")
+    up.add_argument("revision", nargs="?", default="head")
+    move = commands.add_parser("rebalance", help="перенести игроков после изменения DATABASE_SHARDS")
+    move.add_argument("--from", dest="old_urls", required=True, help="прежний DATABASE_SHARDS (через запятую)")
+    move.add_argument("--chunk-size", type=int, default=500)
+    move.add_argument("--dry-run", action="store_true", help="только посчитать, кого переносить")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "upgrade":
+        upgrade(args.revision)
+        return
+
+    async def run():
+        try:
+            if args.command == "list":
+                for shard, count in zip(shard_map, await shard_map.fan_out(count_players)):
+                    print(f"{shard.index}\t{mask_url(shard.url)}\t{count} players")
+            else:
+                old_urls = [url.strip() for url in args.old_urls.split(",") if url.strip()]
+                moved = await rebalance(old_urls, args.chunk_size, args.dry_run)
+                logger.info(f"Rebalance finished: {moved} players {'to move' if args.dry_run else 'moved'}")
+        finally:
+            await shard_map.dispose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Отчет о холодном старте.
+
+На бесплатном плане сервис засыпает, и первый запрос после простоя ждет
+запуска процесса. Отчет показывает, куда уходит это время: импорты по
+группам (отметки mark в app.main), обязательная инициализация до приема
+запросов и фоновый прогрев после него. Модуль импортируется первым и
+не тянет ничего, кроме стандартной библиотеки.
+"""
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _process_age() -> Optional[float]:
+    """Сколько секунд назад запущен процесс (только Linux)"""
+    try:
+        with open("/proc/self/stat") as f:
+            # Имя процесса в скобках может содержать пробелы
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupReport:
+    """Этапы старта с длительностями"""
+
+    def __init__(self):
+        self.created = time.perf_counter()
+        # Время от запуска интерпретатора до импорта этого модуля
+        self.before_app = _process_age()
+        self.phases: List[Dict] = []
+        self.ready = False
+        self._last_mark = self.created
+
+    def mark(self, name: str) -> None:
+        """Закрыть этап, длившийся с предыдущей отметки (для групп импортов)"""
+        now = time.perf_counter()
+        self.phases.append({"name": name, "seconds": round(now - self._last_mark, 4), "status": "done"})
+        self._last_mark = now
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        entry = {"name": name, "seconds": None, "status": "running"}
+        self.phases.append(entry)
+        try:
+            yield
+        except BaseException:
+            entry["status"] = "failed"
+            raise
+        else:
+            entry["status"] = "done"
+        finally:
+            entry["seconds"] = round(time.perf_counter() - started, 4)
+            self._last_mark = time.perf_counter()
+
+    def finish(self) -> None:
+        """Все фоновые подсистемы готовы"""
+        self.ready = True
+        total = time.perf_counter() - self.created
+        parts = ", ".join(f"{p['name']} {p['seconds'] * 1000:.0f} ms" for p in self.phases if p["seconds"] is not None)
+        before = f" (+{self.before_app:.2f}s before app import)" if self.before_app is not None else ""
+        logger.info(f"Startup finished in {total:.2f}s{before}: {parts}")
+
+    def as_dict(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "before_app_seconds": None if self.before_app is None else round(self.before_app, 3),
+            "since_app_import_seconds": round(time.perf_counter() - self.created, 3),
+            "phases": self.phases,
+        }
+
+
+report = StartupReport()
@@ -0,0 +1,337 @@
+"""Кэш горячих игровых состояний с отложенной записью в базу.
+
+Запросы читают и меняют GameState в памяти и только помечают игрока
+грязным. Фоновая задача раз в flush_interval секунд (или раньше, когда
+грязных игроков набралось flush_batch) сбрасывает их в базу одним
+пакетом, так что серия поливов одного игрока стоит одну запись.
+
+Отложенная запись (STATE_WRITE_MODE=behind) годится только для одного
+процесса. По умолчанию (through) изменения пишутся сразу условным UPDATE
+по ревизии игрока: воркер, чья копия устарела, перечитывает состояние и
+повторяет действие, так что блокировки не нужны. Повтор запроса с тем же
+ключом идемпотентности получает первый ответ и ничего не меняет; ответы
+хранятся в базе в обоих режимах, при отложенной записи - в пакете вместе
+с состоянием игрока.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from app import revisions
+from app.schemas import GameState
+
+logger = logging.getLogger(__name__)
+
+Loader = Callable[[int], Awaitable[Optional[GameState]]]
+# (состояния, строки idempotency_keys) - пишутся одной транзакцией
+Writer = Callable[[List[GameState], List[Dict]], Awaitable[None]]
+# (user_id, ключ, не старше) -> (response,) или None
+Recall = Callable[[int, str, float], Awaitable[Optional[Tuple]]]
+# (user_id, state, предыдущая ревизия) - вызывается, когда ревизия выросла
+CommitHook = Callable[[int, GameState, int], None]
+# Меняет переданную копию состояния и возвращает ответ (JSON-совместимый)
+Operation = Callable[[GameState], Any]
+
+# Сколько помнить ответы на запросы с ключом идемпотентности
+IDEMPOTENCY_TTL = 24 * 3600.0
+
+
+class WriteThrough(NamedTuple):
+    """Сквозная запись для нескольких воркеров"""
+    # (state, ожидаемая ревизия в базе или None для нового игрока, ключ, ответ) -> записано ли
+    write: Callable[[GameState, Optional[int], Optional[str], Any], Awaitable[bool]]
+    # Текущая ревизия игрока в базе (None - игрока нет)
+    revision: Callable[[int], Awaitable[Optional[int]]]
+    # Сохраненный ответ по ключу идемпотентности: (response,) или None
+    recall: Recall
+
+
+class PlayerNotFound(KeyError):
+    """apply() для игрока, которого нет, без функции создания"""
+
+
+class ConflictError(Exception):
+    """Изменение не удалось записать из-за параллельных записей других воркеров"""
+
+
+class PlayerStateCache:
+    """LRU-кэш GameState с отслеживанием изменений и пакетным сбросом"""
+
+    def __init__(self, loader: Loader, writer: Writer,
+                 max_size: int = 10000,
+                 flush_interval: float = 1.0,
+                 flush_batch: int = 500,
+                 write_through: Optional[WriteThrough] = None,
+                 max_retries: int = 5,
+                 idempotency_size: int = 10000,
+                 recall: Optional[Recall] = None):
+        self._loader = loader
+        self._writer = writer
+        self.write_through = write_through
+        self._recall_stored = recall or (write_through.recall if write_through is not None else None)
+        self.max_retries = max_retries
+        self.idempotency_size = idempotency_size
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+
+        self._states: "OrderedDict[int, GameState]" = OrderedDict()
+        self._dirty: Dict[int, GameState] = {}
+        self._loading: Dict[int, asyncio.Future] = {}
+        # (user_id, ключ) -> (время, ответ)
+        self._responses: "OrderedDict[Tuple[int, str], Tuple[float, Any]]" = OrderedDict()
+        # Ответы по ключам, ждущие записи вместе с грязным игроком (отложенная запись)
+        self._dirty_keys: Dict[int, List[Dict]] = {}
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.on_commit: Optional[CommitHook] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.conflicts = 0
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    @property
+    def dirty_count(self) -> int:
+        return len(self._dirty)
+
+    async def get(self, user_id: int) -> Optional[GameState]:
+        """Состояние игрока из кэша, при промахе - через loader"""
+        state = self._states.get(user_id)
+        if state is not None and self.write_through is not None:
+            # Игрока мог изменить другой воркер: сверяем ревизию с базой
+            revision = await self.write_through.revision(user_id)
+            # Пока ждали базу, параллельный запрос мог поставить в кэш новую копию
+            state = self._states.get(user_id)
+            if state is not None and revision != state.revision:
+                self._evict(user_id)
+                state = None
+        if state is not None:
+            self._states.move_to_end(user_id)
+            self.hits += 1
+            return state
+
+        # Выселенный, но еще не записанный игрок берется из грязных
+        state = self._dirty.get(user_id)
+        if state is None:
+            self.misses += 1
+            pending = self._loading.get(user_id)
+            if pending is not None:
+                return await asyncio.shield(pending)
+
+            future = asyncio.get_running_loop().create_future()
+            self._loading[user_id] = future
+            try:
+                state = await self._loader(user_id)
+            except BaseException as exc:
+                future.set_exception(exc)
+                # Исключение уже передано ожидающим, не логируем его повторно
+                future.exception()
+                raise
+            else:
+                future.set_result(state)
+            finally:
+                del self._loading[user_id]
+            if state is None:
+                return None
+            revisions.track(state)
+
+        self._put(user_id, state)
+        return state
+
+    def peek(self, user_id: int) -> Optional[GameState]:
+        """Состояние без загрузки и без обновления порядка LRU"""
+        return self._states.get(user_id) or self._dirty.get(user_id)
+
+    def _put(self, user_id: int, state: GameState) -> None:
+        self._states[user_id] = state
+        self._states.move_to_end(user_id)
+        # Грязные записи остаются в _dirty до сброса, поэтому выселение их не теряет
+        while len(self._states) > self.max_size:
+            self._states.popitem(last=False)
+
+    def _install(self, user_id: int, state: GameState, old_revision: int) -> None:
+        self._put(user_id, state)
+        if self.on_commit is not None and state.revision != old_revision:
+            self.on_commit(user_id, state, old_revision)
+
+    def _evict(self, user_id: int) -> None:
+        self._states.pop(user_id, None)
+
+    def _remember(self, user_id: int, key: Optional[str], response: Any) -> None:
+        if key is None:
+            return
+        self._responses[(user_id, key)] = (time.time(), response)
+        self._responses.move_to_end((user_id, key))
+        while len(self._responses) > self.idempotency_size:
+            self._responses.popitem(last=False)
+
+    async def recall(self, user_id: int, key: Optional[str]) -> Optional[Tuple]:
+        """Ответ на уже выполненный запрос с этим ключом: (response,) или None"""
+        if key is None:
+            return None
+        since = time.time() - IDEMPOTENCY_TTL
+        remembered = self._responses.get((user_id, key))
+        if remembered is not None and remembered[0] >= since:
+            return (remembered[1],)
+        if self._recall_stored is not None:
+            return await self._recall_stored(user_id, key, since)
+        return None
+
+    async def apply(self, user_id: int, operation: Operation,
+                    create: Optional[Callable[[], GameState]] = None,
+                    idempotency_key: Optional[str] = None) -> Any:
+        """Применить operation к копии состояния игрока и зафиксировать ее.
+
+        Ошибка в operation ничего не меняет. Без игрока и без create
+        поднимается PlayerNotFound. При сквозной записи копия пишется условно по
+        ревизии; при конфликте состояние перечитывается, и operation
+        выполняется заново, после max_retries попыток - ConflictError.
+        """
+        for _ in range(self.max_retries):
+            recalled = await self.recall(user_id, idempotency_key)
+            if recalled is not None:
+                return recalled[0]
+
+            state = await self.get(user_id)
+            created = state is None
+            if created:
+                if create is None:
+                    raise PlayerNotFound(user_id)
+                state = create()
+                revisions.track(state)
+            working = state.model_copy(deep=True)
+            response = operation(working)
+            old_revision = state.revision
+            revisions.commit(working)
+
+            if working.revision == old_revision and not created:
+                # Ничего не изменилось, писать нечего
+                self._remember(user_id, idempotency_key, response)
+                return response
+            if self.write_through is None:
+                self._install(user_id, working, old_revision)
+                self._dirty[user_id] = working
+                if idempotency_key is not None:
+                    self._dirty_keys.setdefault(user_id, []).append({
+                        "player_id": user_id, "key": idempotency_key,
+                        "response": response, "created_at": time.time(),
+                    })
+                if len(self._dirty) >= self.flush_batch:
+                    self._wakeup.set()
+                self._remember(user_id, idempotency_key, response)
+                return response
+
+            # Ожидаем ревизию именно той копии, которую меняли: в кэше может быть уже другая
+            expected = None if created else old_revision
+            if await self.write_through.write(working, expected, idempotency_key, response):
+                revisions.mark_saved(working, working.revision)
+                self._install(user_id, working, old_revision)
+                self._remember(user_id, idempotency_key, response)
+                return response
+
+            self.conflicts += 1
+            self._evict(user_id)
+        raise ConflictError(f"Player {user_id} is being changed concurrently")
+
+    async def flush(self) -> int:
+        """Сбросить всех грязных игроков одним пакетом, вернуть их число"""
+        async with self._flush_lock:
+            if not self._dirty:
+                return 0
+
+            batch = self._dirty
+            self._dirty = {}
+            batch_keys = self._dirty_keys
+            self._dirty_keys = {}
+            # Снимок, чтобы изменения во время записи не смешались с пакетом
+            snapshot = [state.model_copy(deep=True) for state in batch.values()]
+            try:
+                await self._writer(snapshot, [row for rows in batch_keys.values() for row in rows])
+            except BaseException:
+                # Возвращаем непринятые изменения (и при отмене), более свежие пометки не трогаем
+                for user_id, state in batch.items():
+                    self._dirty.setdefault(user_id, state)
+                for user_id, rows in batch_keys.items():
+                    self._dirty_keys[user_id] = rows + self._dirty_keys.get(user_id, [])
+                raise
+            # Пока шла запись, игрок мог смениться новой копией: отмечаем и ее
+            for (user_id, state), written in zip(batch.items(), snapshot):
+                revisions.mark_saved(state, written.revision)
+                current = self.peek(user_id)
+                if current is not None:
+                    revisions.mark_saved(current, written.revision)
+            return len(snapshot)
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._stopping:
+                break
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"State flush failed: {e}")
+
+    def start(self) -> None:
+        """Запустить фоновый сброс"""
+        if self._task is None:
+            # Примитивы привязываются к циклу событий, создаем их в текущем
+            self._flush_lock = asyncio.Lock()
+            self._wakeup = asyncio.Event()
+            self._stopping = False
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Остановить фоновый сброс и записать оставшиеся изменения.
+
+        Цикл останавливается флагом, а не cancel(): идущий сброс дописывает
+        свой пакет, а wait_for в 3.11 может потерять отмену.
+        """
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+
+def write_behind() -> bool:
+    """Включена ли отложенная запись (STATE_WRITE_MODE=behind).
+
+    Тогда кэш сервера пишет игроков без проверки ревизии, и фоновые задачи
+    с базой можно запускать только при остановленном сервисе.
+    """
+    return os.getenv("STATE_WRITE_MODE", "through") == "behind"
+
+
+def cache_from_env(loader: Loader, writer: Writer,
+                   write_through: Optional[WriteThrough] = None) -> PlayerStateCache:
+    """Кэш с параметрами из переменных окружения.
+
+    По умолчанию сквозная запись через write_through; STATE_WRITE_MODE=behind
+    включает отложенную, только для одного процесса.
+    """
+    through = not write_behind()
+    if not through and int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+        logger.warning("STATE_WRITE_MODE=behind with several workers: their cached states will overwrite each other")
+    return PlayerStateCache(
+        loader,
+        writer,
+        max_size=int(os.getenv("STATE_CACHE_SIZE", "10000")),
+        flush_interval=float(os.getenv("STATE_FLUSH_INTERVAL", "1.0")),
+        flush_batch=int(os.getenv("STATE_FLUSH_BATCH", "500")),
+        write_through=write_through if through else None,
+        recall=write_through.recall if write_through is not None else None,
+    )
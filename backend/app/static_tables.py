@@ -0,0 +1,87 @@
+"""Готовые ответы неизменяемых справочников: каталог культур и таблица уровней.
+
+Тела и ETag считаются при сборке на Render (python -m app.static_tables)
+и лежат в одном JSON-файле STATIC_TABLES_PATH. При старте файл берется,
+только если его отпечаток совпадает с текущими crops.json и таблицей
+уровней, иначе ответы строятся заново в памяти. Так старт не сериализует
+справочники, а запросы к ним отдают готовые байты. Docker-образ
+собирает артефакт так же.
+"""
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, NamedTuple
+
+from fastapi import Response
+
+from app import levels
+from app.crops import crops
+from app.http_cache import make_etag
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_PATH = os.getenv(
+    "STATIC_TABLES_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "build", "static_tables.json"),
+)
+
+
+class StaticTable(NamedTuple):
+    body: bytes
+    etag: str
+
+    def response(self) -> Response:
+        return Response(self.body, media_type="application/json")
+
+
+def fingerprint() -> str:
+    """Отпечаток исходных данных: меняется вместе с каталогом или кривой уровней"""
+    source = repr((
+        [crop.as_dict() for crop in crops],
+        levels.CUMULATIVE_XP, levels.LEVEL_REWARDS, levels.FEATURES_BY_LEVEL,
+    ))
+    return hashlib.sha1(source.encode()).hexdigest()
+
+
+def _table(name: str, payload) -> StaticTable:
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode()
+    return StaticTable(body, make_etag(name, payload))
+
+
+def build_tables() -> Dict[str, StaticTable]:
+    return {
+        "crops": _table("crops", {"plants": [crop.as_dict() for crop in crops]}),
+        "levels_curve": _table("levels_curve", {"max_level": levels.MAX_LEVEL, "levels": levels.curve_table()}),
+    }
+
+
+def load_tables(path: str = ARTIFACT_PATH) -> Dict[str, StaticTable]:
+    """Таблицы из артефакта сборки или, если он устарел или его нет, построенные заново"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            artifact = json.load(f)
+        if artifact.get("fingerprint") == fingerprint():
+            return {name: StaticTable(table["body"].encode(), table["etag"])
+                    for name, table in artifact["tables"].items()}
+        logger.info(f"Static tables at {path} are stale, rebuilding in memory")
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Static tables at {path} are unreadable ({e}), rebuilding in memory")
+    return build_tables()
+
+
+def write_tables(path: str = ARTIFACT_PATH) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    artifact = {
+        "fingerprint": fingerprint(),
+        "tables": {name: {"body": table.body.decode(), "etag": table.etag} for name, table in build_tables().items()},
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(artifact, f, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    write_tables()
+    print(f"Static tables written to {ARTIFACT_PATH}")
@@ -0,0 +1,64 @@
+"""Сквозная запись кэша состояний при параллельных запросах одного воркера"""
+import asyncio
+from typing import Dict, List, Optional
+
+from app import actions
+from app.schemas import GameState
+from app.state_cache import PlayerStateCache, WriteThrough
+
+
+class FakeStore:
+    """База в памяти с условной записью по ревизии; каждое обращение уступает цикл"""
+
+    def __init__(self, *states: GameState):
+        self.rows: Dict[int, GameState] = {state.user_id: state.model_copy(deep=True) for state in states}
+        # Сколько тактов цикла отвечает очередной запрос ревизии (по умолчанию один)
+        self.revision_delays: List[int] = []
+
+    async def load(self, user_id: int) -> Optional[GameState]:
+        await asyncio.sleep(0)
+        row = self.rows.get(user_id)
+        return row.model_copy(deep=True) if row is not None else None
+
+    async def write(self, state: GameState, expected: Optional[int], key, response) -> bool:
+        await asyncio.sleep(0)
+        row = self.rows.get(state.user_id)
+        if (row.revision if row is not None else None) != expected:
+            return False
+        self.rows[state.user_id] = state.model_copy(deep=True)
+        return True
+
+    async def revision(self, user_id: int) -> Optional[int]:
+        for _ in range(self.revision_delays.pop(0) if self.revision_delays else 1):
+            await asyncio.sleep(0)
+        row = self.rows.get(user_id)
+        return row.revision if row is not None else None
+
+    async def recall(self, user_id: int, key: str, since: float):
+        return None
+
+    def cache(self) -> PlayerStateCache:
+        async def writer(states, keys):
+            raise AssertionError("write-behind is not used")
+
+        return PlayerStateCache(self.load, writer, write_through=WriteThrough(self.write, self.revision, self.recall))
+
+
+def test_concurrent_actions_are_not_lost():
+    store = FakeStore(GameState(user_id=1, money=100))
+
+    async def run():
+        cache = store.cache()
+        await cache.get(1)
+        # Игрок в кэше; второй запрос взял его копию, но получил ревизию из базы
+        # уже после того, как первый записал свое изменение
+        store.revision_delays = [1, 20]
+        return await asyncio.gather(*(
+            cache.apply(1, lambda state: actions.buy(state, "carrot")) for _ in range(2)
+        ))
+
+    costs = asyncio.run(run())
+    row = store.rows[1]
+    assert row.money == 100 - sum(costs)
+    assert row.inventory.seeds == {"carrot": 2}
+    assert row.revision == 2
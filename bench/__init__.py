@@ -0,0 +1,19 @@
+"""Нагрузочные замеры API и обработчиков бота.
+
+python -m bench.api - синтетические игроки против FastAPI-приложения
+(в процессе или через локальный uvicorn), python -m bench.bot - поток
+апдейтов Telegram через level_handlers с заглушкой бэкенда. Оба печатают
+p50/p95/p99, пропускную способность и число запросов к базе (к бэкенду)
+на запрос и сравнивают их с сохраненным baseline в bench/baselines.
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def add_path(*parts: str) -> None:
+    """Сделать импортируемым пакет из каталога репозитория (backend, telegram-bot)"""
+    path = os.path.join(ROOT, *parts)
+    if path not in sys.path:
+        sys.path.insert(0, path)
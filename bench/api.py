@@ -0,0 +1,229 @@
+"""Нагрузка на API синтетическими игроками.
+
+Каждый игрок - отдельная корутина: заходит в игру, затем выполняет
+--requests запросов, выбирая их по весам --mix. В режиме inprocess
+запросы идут через ASGI-транспорт прямо в приложение, и каждый SQL-запрос
+приписывается HTTP-запросу, в контексте которого он выполнен (фоновые
+сбросы кэша считаются отдельно). В режиме uvicorn приложение
+запускается отдельным процессом и нагружается по сети. База всегда
+временная SQLite: DATABASE_URL, шарды и Redis из окружения не используются.
+
+    python -m bench.api --players 50 --requests 40
+    python -m bench.api --mode uvicorn --save-baseline
+"""
+import argparse
+import asyncio
+import contextvars
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+from bench import ROOT, add_path, stats
+
+BACKEND = os.path.join(ROOT, "backend")
+
+DEFAULT_MIX = "get_state=40,plant=20,water=20,harvest=10,leaderboard=10"
+FIRST_PLAYER_ID = 9_000_000
+
+# Счетчик SQL-запросов текущего HTTP-запроса
+_queries: contextvars.ContextVar[Optional[List[int]]] = contextvars.ContextVar("bench_queries", default=None)
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for item in text.split(","):
+        op, _, weight = item.partition("=")
+        if op.strip() not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation {op}")
+        mix[op.strip()] = float(weight or 1)
+    return mix
+
+
+class Player:
+    """Синтетический игрок и id его растений"""
+
+    def __init__(self, user_id: int, rng: random.Random):
+        self.user_id = user_id
+        self.rng = rng
+        self.plants: List[int] = []
+
+
+async def get_state(client: httpx.AsyncClient, player: Player) -> httpx.Response:
+    return await client.get(f"/api/game/{player.user_id}")
+
+
+async def plant(client: httpx.AsyncClient, player: Player) -> httpx.Response:
+    response = await client.post(f"/api/game/{player.user_id}/plant", params={"plant_name": "carrot"})
+    if response.status_code == 200:
+        player.plants.append(response.json()["plant"]["id"])
+    return response
+
+
+async def water(client: httpx.AsyncClient, player: Player) -> httpx.Response:
+    if not player.plants:
+        return await client.put(f"/api/game/{player.user_id}/water-all")
+    return await client.put(f"/api/game/{player.user_id}/plant/{player.rng.choice(player.plants)}/water")
+
+
+async def harvest(client: httpx.AsyncClient, player: Player) -> httpx.Response:
+    response = await client.post(f"/api/game/{player.user_id}/harvest-all")
+    if response.status_code == 200 and response.json()["harvested"]:
+        # Какие клетки освободились, ответ не говорит - дальше поливаем все сразу
+        player.plants.clear()
+    return response
+
+
+async def leaderboard(client: httpx.AsyncClient, player: Player) -> httpx.Response:
+    return await client.get("/api/levels/leaderboard", params={"limit": 10})
+
+
+OPERATIONS = {
+    "get_state": get_state,
+    "plant": plant,
+    "water": water,
+    "harvest": harvest,
+    "leaderboard": leaderboard,
+}
+
+
+async def _timed(recorder: stats.Recorder, op: str, call) -> None:
+    counter = [0]
+    token = _queries.set(counter)
+    started = time.perf_counter()
+    try:
+        response = await call
+        status = response.status_code
+    except httpx.HTTPError:
+        status = 599
+    finally:
+        _queries.reset(token)
+    recorder.record(op, time.perf_counter() - started, status, counter[0] if recorder.count_queries else None)
+
+
+async def run_player(client: httpx.AsyncClient, player: Player, mix: Dict[str, float], requests: int,
+                     think: float, recorder: stats.Recorder) -> None:
+    ops, weights = list(mix), list(mix.values())
+    # Первый вход создает игрока
+    await _timed(recorder, "get_state", get_state(client, player))
+    for _ in range(requests):
+        op = player.rng.choices(ops, weights)[0]
+        await _timed(recorder, op, OPERATIONS[op](client, player))
+        if think:
+            await asyncio.sleep(player.rng.uniform(0, 2 * think))
+
+
+async def drive(client: httpx.AsyncClient, args: argparse.Namespace, recorder: stats.Recorder) -> float:
+    master = random.Random(args.seed)
+    players = [Player(FIRST_PLAYER_ID + i, random.Random(master.random())) for i in range(args.players)]
+    started = time.perf_counter()
+    await asyncio.gather(*[run_player(client, player, args.mix, args.requests, args.think / 1000, recorder)
+                           for player in players])
+    return time.perf_counter() - started
+
+
+def _isolated_env(workdir: str, args: argparse.Namespace) -> None:
+    """Отдельная база и файлы состояния, чтобы не трогать рабочие, даже если их адреса в окружении"""
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["RIPENING_STATE_PATH"] = os.path.join(workdir, "ripening.json")
+    for name in ("DATABASE_SHARDS", "REALTIME_REDIS_URL", "RATE_LIMIT_REDIS_URL"):
+        os.environ.pop(name, None)
+    # Режим записи и число воркеров меняют число запросов к базе: задаем явно
+    os.environ["STATE_WRITE_MODE"] = args.write_mode
+    os.environ["WEB_CONCURRENCY"] = str(args.workers if args.mode == "uvicorn" else 1)
+    # Синтетические игроки шлют запросы чаще живых: лимиты замерили бы сами себя
+    for name in ("RATE_LIMIT_ACTION", "RATE_LIMIT_READ", "RATE_LIMIT_ANONYMOUS", "MAX_CONCURRENT_REQUESTS"):
+        os.environ.setdefault(name, "0")
+
+
+async def run_inprocess(args: argparse.Namespace, recorder: stats.Recorder) -> float:
+    add_path("backend")
+    from sqlalchemy import event
+    from app import main
+
+    def count_query(*_):
+        counter = _queries.get()
+        if counter is not None:
+            counter[0] += 1
+        else:
+            recorder.background_queries += 1
+
+    for shard in main.shard_map:
+        event.listen(shard.engine.sync_engine, "before_cursor_execute", count_query)
+    recorder.count_queries = True
+    await main.startup()
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            elapsed = await drive(client, args, recorder)
+        await main.state_cache.flush()
+    finally:
+        await main.shutdown()
+    return elapsed
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run_uvicorn(args: argparse.Namespace, recorder: stats.Recorder) -> float:
+    port = args.port or _free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=BACKEND, env=os.environ.copy(),
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=30,
+                                     limits=httpx.Limits(max_connections=args.players)) as client:
+            deadline = time.monotonic() + 30
+            while True:
+                try:
+                    if (await client.get("/api/health")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if time.monotonic() > deadline or server.poll() is not None:
+                    raise RuntimeError("uvicorn did not start")
+                await asyncio.sleep(0.2)
+            return await drive(client, args, recorder)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Нагрузочный замер API")
+    parser.add_argument("--mode", choices=("inprocess", "uvicorn"), default="inprocess")
+    parser.add_argument("--players", type=int, default=50, help="одновременных игроков")
+    parser.add_argument("--requests", type=int, default=40, help="запросов на игрока")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"веса, {DEFAULT_MIX}")
+    parser.add_argument("--think", type=float, default=0.0, help="средняя пауза между запросами, мс")
+    parser.add_argument("--port", type=int, help="порт uvicorn (по умолчанию свободный)")
+    parser.add_argument("--workers", type=int, default=1, help="воркеров uvicorn")
+    parser.add_argument("--write-mode", choices=("through", "behind"), default="through",
+                        help="STATE_WRITE_MODE сервера")
+    stats.add_arguments(parser)
+    args = parser.parse_args()
+    if args.write_mode == "behind" and args.mode == "uvicorn" and args.workers > 1:
+        parser.error("--write-mode behind works only with a single worker")
+
+    recorder = stats.Recorder()
+    with tempfile.TemporaryDirectory() as workdir:
+        _isolated_env(workdir, args)
+        runner = run_inprocess if args.mode == "inprocess" else run_uvicorn
+        elapsed = asyncio.run(runner(args, recorder))
+    sys.exit(stats.finish(f"api-{args.mode}", recorder.summary(elapsed), args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""Нагрузка на обработчики уровней бота.
+
+Поток фейковых апдейтов (/level, кнопки "Лидеры" и "Назад") идет прямо в
+функции level_handlers, без Telegram. Бэкенд заменен заглушкой на
+httpx.MockTransport с настраиваемой задержкой, которая отвечает как
+настоящий API, включая 304 на If-None-Match. В колонке queries - число
+обращений к бэкенду на апдейт: так видно, сколько снимает кэш ответов.
+
+    python -m bench.bot --users 200 --updates 5000
+"""
+import argparse
+import asyncio
+import contextvars
+import hashlib
+import json
+import random
+import sys
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+from bench import add_path, stats
+
+DEFAULT_MIX = "level=60,leaderboard=25,back=15"
+
+# Счетчик обращений к бэкенду текущего апдейта
+_calls: contextvars.ContextVar[Optional[List[int]]] = contextvars.ContextVar("bench_calls", default=None)
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for item in text.split(","):
+        op, _, weight = item.partition("=")
+        if op.strip() not in ("level", "leaderboard", "back"):
+            raise argparse.ArgumentTypeError(f"Unknown update {op}")
+        mix[op.strip()] = float(weight or 1)
+    return mix
+
+
+class StubBackend:
+    """Ответы API уровней с задержкой latency секунд"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    def level_info(self, user_id: int) -> Dict:
+        total_xp = (user_id * 37) % 5000
+        return {
+            "user_id": user_id, "current_level": 1 + total_xp // 1000, "current_xp": total_xp % 1000,
+            "next_level_xp": 1000 - total_xp % 1000, "progress_percentage": (total_xp % 1000) / 10,
+            "total_xp": total_xp, "next_level_rewards": {"coins": 100}, "unlocked_features": [],
+        }
+
+    def leaderboard(self) -> Dict:
+        rows = [{"rank": rank, "user_id": rank, "username": f"farmer{rank}", "level": 10 - rank // 2,
+                 "total_xp": 10000 - rank * 100} for rank in range(1, 11)]
+        return {"leaderboard": rows, "total": 10, "limit": 10, "offset": 0}
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        counter = _calls.get()
+        if counter is not None:
+            counter[0] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        path = request.url.path
+        if path.startswith("/api/levels/info/"):
+            data = self.level_info(int(path.rsplit("/", 1)[1]))
+        elif path == "/api/levels/leaderboard":
+            data = self.leaderboard()
+        else:
+            return httpx.Response(404, json={"detail": "Not Found"})
+        etag = '"' + hashlib.md5(json.dumps(data, sort_keys=True).encode()).hexdigest()[:16] + '"'
+        if request.headers.get("If-None-Match") == etag:
+            return httpx.Response(304, headers={"ETag": etag})
+        return httpx.Response(200, json=data, headers={"ETag": etag})
+
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+
+
+class FakeMessage:
+    """Сообщение, на которое отвечает /level; ответы запоминаются"""
+
+    def __init__(self):
+        self.replies: List[str] = []
+
+    async def reply_html(self, text: str, **kwargs) -> None:
+        self.replies.append(text)
+
+    async def reply_text(self, text: str, **kwargs) -> None:
+        self.replies.append(text)
+
+
+class FakeQuery:
+    """Нажатие inline-кнопки"""
+
+    def __init__(self, data: str):
+        self.data = data
+        self.replies: List[str] = []
+
+    async def answer(self, *args, **kwargs) -> None:
+        pass
+
+    async def edit_message_text(self, text: str, **kwargs) -> None:
+        self.replies.append(text)
+
+
+class FakeUpdate:
+    """Те поля telegram.Update, которые читают обработчики"""
+
+    def __init__(self, user_id: int, message: Optional[FakeMessage] = None, query: Optional[FakeQuery] = None):
+        self.effective_user = FakeUser(user_id)
+        self.message = message
+        self.callback_query = query
+
+
+async def run(args: argparse.Namespace, recorder: stats.Recorder) -> float:
+    add_path("telegram-bot")
+    from bot.api_client import ApiClient
+    from bot.cache import ResponseCache
+    from bot.handlers import level_handlers
+
+    backend = StubBackend(args.backend_latency / 1000)
+    client = ApiClient(base_url="http://stub/api", retries=0, transport=httpx.MockTransport(backend.handle))
+    level_handlers.response_cache = ResponseCache(client, ttl=args.cache_ttl)
+    if args.cache_ttl <= 0:
+        # Без кэша: TTL обработчиков тоже обнуляем
+        level_handlers.LEVEL_TTL = level_handlers.LEADERBOARD_TTL = 0
+
+    handlers = {
+        "level": lambda user_id: (level_handlers.level_command, FakeUpdate(user_id, message=FakeMessage())),
+        "leaderboard": lambda user_id: (level_handlers.leaderboard_callback,
+                                        FakeUpdate(user_id, query=FakeQuery("leaderboard"))),
+        "back": lambda user_id: (level_handlers.back_to_level_callback,
+                                 FakeUpdate(user_id, query=FakeQuery("back_to_level"))),
+    }
+    rng = random.Random(args.seed)
+    ops, weights = list(args.mix), list(args.mix.values())
+    stream = [(op, rng.randrange(1, args.users + 1)) for op in rng.choices(ops, weights, k=args.updates)]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    recorder.count_queries = True
+
+    async def dispatch(op: str, user_id: int) -> None:
+        handler, update = handlers[op](user_id)
+        async with semaphore:
+            counter = [0]
+            token = _calls.set(counter)
+            started = time.perf_counter()
+            try:
+                await handler(update, None)
+            finally:
+                _calls.reset(token)
+            replies = (update.message or update.callback_query).replies
+            # Обработчики ловят ошибки сами и отвечают текстом с ❌ или ⚠️
+            failed = not replies or replies[-1].startswith(("❌", "⚠️"))
+            recorder.record(op, time.perf_counter() - started, 500 if failed else 200, counter[0])
+
+    started = time.perf_counter()
+    await asyncio.gather(*[dispatch(op, user_id) for op, user_id in stream])
+    elapsed = time.perf_counter() - started
+    await client.close()
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Нагрузочный замер обработчиков бота")
+    parser.add_argument("--users", type=int, default=200, help="разных пользователей в потоке")
+    parser.add_argument("--updates", type=int, default=5000, help="апдейтов всего")
+    parser.add_argument("--concurrency", type=int, default=100, help="апдейтов в обработке одновременно")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"веса, {DEFAULT_MIX}")
+    parser.add_argument("--backend-latency", type=float, default=20.0, help="задержка заглушки бэкенда, мс")
+    parser.add_argument("--cache-ttl", type=float, default=30.0, help="TTL кэша ответов бота, 0 - без кэша")
+    stats.add_arguments(parser)
+    args = parser.parse_args()
+
+    recorder = stats.Recorder()
+    elapsed = asyncio.run(run(args, recorder))
+    sys.exit(stats.finish("bot", recorder.summary(elapsed), args))
+
+
+if __name__ == "__main__":
+    main()
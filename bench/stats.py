@@ -0,0 +1,135 @@
+"""Сбор задержек, отчет и сравнение с baseline"""
+import argparse
+import json
+import math
+import os
+from collections import Counter
+from typing import Dict, List, Optional
+
+from bench import ROOT
+
+BASELINES_DIR = os.path.join(ROOT, "bench", "baselines")
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Перцентиль q (0..100) по ближайшему рангу"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Recorder:
+    """Задержки, статусы и число запросов к хранилищу по операциям"""
+
+    def __init__(self):
+        # Запросы к хранилищу считаются, только если их видно (приложение в процессе)
+        self.count_queries = False
+        # Запросы вне обработки запросов: фоновые сбросы, задачи по таймеру
+        self.background_queries = 0
+        self.latencies: Dict[str, List[float]] = {}
+        self.statuses: Dict[str, Counter] = {}
+        self.queries: Dict[str, List[int]] = {}
+
+    def record(self, op: str, seconds: float, status: int, queries: Optional[int] = None) -> None:
+        self.latencies.setdefault(op, []).append(seconds)
+        self.statuses.setdefault(op, Counter())[status] += 1
+        if queries is not None:
+            self.queries.setdefault(op, []).append(queries)
+
+    def summary(self, elapsed: float) -> Dict:
+        ops = {}
+        total = 0
+        errors = 0
+        for op, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            total += len(values)
+            statuses = self.statuses[op]
+            errors += sum(count for status, count in statuses.items() if status >= 500)
+            queries = self.queries.get(op)
+            ops[op] = {
+                "count": len(values),
+                "p50_ms": round(percentile(values, 50) * 1000, 3),
+                "p95_ms": round(percentile(values, 95) * 1000, 3),
+                "p99_ms": round(percentile(values, 99) * 1000, 3),
+                "queries_per_request": round(sum(queries) / len(queries), 3) if queries else None,
+                "statuses": {str(status): count for status, count in sorted(statuses.items())},
+            }
+        return {
+            "requests": total,
+            "errors": errors,
+            "elapsed_s": round(elapsed, 3),
+            "throughput_rps": round(total / elapsed, 1) if elapsed > 0 else 0.0,
+            "background_queries": self.background_queries if self.count_queries else None,
+            "ops": ops,
+        }
+
+
+def print_report(name: str, summary: Dict) -> None:
+    print(f"{name}: {summary['requests']} requests in {summary['elapsed_s']}s, "
+          f"{summary['throughput_rps']} req/s, {summary['errors']} errors")
+    if summary.get("background_queries") is not None:
+        print(f"  background queries: {summary['background_queries']}")
+    print(f"  {'op':<14}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>10}  statuses")
+    for op, row in summary["ops"].items():
+        queries = "-" if row["queries_per_request"] is None else f"{row['queries_per_request']:.2f}"
+        statuses = " ".join(f"{status}x{count}" for status, count in row["statuses"].items())
+        print(f"  {op:<14}{row['count']:>8}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}"
+              f"{row['p99_ms']:>10.2f}{queries:>10}  {statuses}")
+
+
+def compare(summary: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Регрессии относительно baseline: задержки и пропускная способность - с допуском,
+    число запросов к хранилищу детерминировано и не должно расти вовсе"""
+    problems = []
+    if summary["throughput_rps"] < baseline["throughput_rps"] * (1 - tolerance):
+        problems.append(f"throughput {summary['throughput_rps']} < {baseline['throughput_rps']} req/s")
+    if summary["errors"] > baseline.get("errors", 0):
+        problems.append(f"errors {summary['errors']} > {baseline.get('errors', 0)}")
+    for op, row in summary["ops"].items():
+        base = baseline["ops"].get(op)
+        if base is None:
+            continue
+        for field in ("p95_ms", "p99_ms"):
+            if row[field] > base[field] * (1 + tolerance):
+                problems.append(f"{op} {field} {row[field]} > {base[field]}")
+        if (row["queries_per_request"] is not None and base.get("queries_per_request") is not None
+                and row["queries_per_request"] > base["queries_per_request"] + 0.01):
+            problems.append(f"{op} queries/request {row['queries_per_request']} > {base['queries_per_request']}")
+    return problems
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Общие параметры отчета и baseline"""
+    parser.add_argument("--seed", type=int, default=1, help="seed генератора нагрузки")
+    parser.add_argument("--baseline", help="файл baseline (по умолчанию bench/baselines/<name>.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="записать результат как новый baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимое ухудшение задержек, доля")
+    parser.add_argument("--json", help="записать сводку в этот файл")
+
+
+def finish(name: str, summary: Dict, args: argparse.Namespace) -> int:
+    """Напечатать отчет, сравнить с baseline; код выхода 1 - регрессия"""
+    print_report(name, summary)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+    path = args.baseline or os.path.join(BASELINES_DIR, f"{name}.json")
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"Baseline saved to {path}")
+        return 0
+    if not os.path.exists(path):
+        print(f"No baseline at {path}, run with --save-baseline to create it")
+        return 0
+    with open(path) as f:
+        baseline = json.load(f)
+    problems = compare(summary, baseline, args.tolerance)
+    for problem in problems:
+        print(f"REGRESSION: {problem}")
+    if not problems:
+        print(f"No regressions against {path}")
+    return 1 if problems else 0
@@ -1 +1,118 @@
-# Empty Python file
+"""Каталог культур, общий для бэкенда и бота.
+
+Данные лежат в crops.json рядом с модулем (путь можно переопределить
+через CROPS_PATH) и читаются один раз при импорте в неизменяемые записи.
+Индексы строятся тогда же: по имени, по id, по редкости и по
+требуемому уровню - культуры, открытые на уровне N, это префикс
+списка, отсортированного по required_level.
+"""
+import json
+import os
+from bisect import bisect_right
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+CROPS_PATH = os.getenv("CROPS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "crops.json"))
+
+RARITIES = ("common", "uncommon", "rare", "epic")
+
+
+@dataclass(frozen=True, slots=True)
+class Crop:
+    # Постоянный id: хранится в сериализованных фермах вместо имени
+    id: int
+    name: str
+    title: str
+    seed_price: int
+    sell_price: int
+    growth_time: float
+    # Доля от growth_time, с которой начинается стадия 1, 2, 3
+    thresholds: Tuple[float, ...]
+    required_level: int
+    rarity: str
+    description: str = ""
+
+    def as_dict(self) -> Dict:
+        """Запись в формате PlantInfo фронтенда"""
+        return {
+            "type": self.name,
+            "title": self.title,
+            "seed_price": self.seed_price,
+            "sell_price": self.sell_price,
+            "growth_time": self.growth_time,
+            "required_level": self.required_level,
+            "rarity": self.rarity,
+            "description": self.description,
+        }
+
+
+class CropRegistry:
+    """Культуры, отсортированные по required_level, и индексы по ним"""
+
+    __slots__ = ("crops", "by_name", "by_id", "by_rarity", "_levels")
+
+    def __init__(self, crops: Iterable[Crop]):
+        self.crops: Tuple[Crop, ...] = tuple(sorted(crops, key=lambda crop: (crop.required_level, crop.id)))
+        by_name: Dict[str, Crop] = {}
+        by_id: Dict[int, Crop] = {}
+        by_rarity: Dict[str, List[Crop]] = {rarity: [] for rarity in RARITIES}
+        for crop in self.crops:
+            if crop.name in by_name or crop.id in by_id:
+                raise ValueError(f"Duplicate crop {crop.name} (id {crop.id})")
+            if crop.id <= 0:
+                raise ValueError(f"Crop {crop.name}: id must be positive")
+            if crop.rarity not in by_rarity:
+                raise ValueError(f"Crop {crop.name}: unknown rarity {crop.rarity}")
+            by_name[crop.name] = crop
+            by_id[crop.id] = crop
+            by_rarity[crop.rarity].append(crop)
+        self.by_name: Mapping[str, Crop] = MappingProxyType(by_name)
+        self.by_id: Mapping[int, Crop] = MappingProxyType(by_id)
+        self.by_rarity: Mapping[str, Tuple[Crop, ...]] = MappingProxyType(
+            {rarity: tuple(items) for rarity, items in by_rarity.items()})
+        self._levels = [crop.required_level for crop in self.crops]
+
+    def __len__(self) -> int:
+        return len(self.crops)
+
+    def __iter__(self) -> Iterator[Crop]:
+        return iter(self.crops)
+
+    def __contains__(self, name: str) -> bool:
+        return self.get(name) is not None
+
+    def get(self, name: str) -> Optional[Crop]:
+        return self.by_name.get(name.lower())
+
+    def unlocked(self, level: int) -> Tuple[Crop, ...]:
+        """Культуры, доступные на уровне level"""
+        return self.crops[:bisect_right(self._levels, level)]
+
+    def unlocked_at(self, level: int) -> Tuple[Crop, ...]:
+        """Культуры, которые открываются ровно на уровне level"""
+        return self.crops[bisect_right(self._levels, level - 1):bisect_right(self._levels, level)]
+
+
+def load_registry(path: str = CROPS_PATH) -> CropRegistry:
+    with open(path, encoding="utf-8") as f:
+        rows = json.load(f)
+    return CropRegistry(
+        Crop(
+            id=int(row["id"]),
+            name=row["type"].lower(),
+            title=row.get("title", row["type"]),
+            seed_price=int(row["seed_price"]),
+            sell_price=int(row["sell_price"]),
+            growth_time=float(row["growth_time"]),
+            thresholds=tuple(float(t) for t in row.get("thresholds", (0.25, 0.6, 1.0))),
+            required_level=int(row.get("required_level", 1)),
+            rarity=row.get("rarity", "common"),
+            description=row.get("description", ""),
+        )
+        for row in rows
+    )
+
+
+# Один каталог на процесс
+crops = load_registry()
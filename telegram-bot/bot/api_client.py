@@ -0,0 +1,108 @@
+# telegram-bot/bot/api_client.py
+"""Общий асинхронный клиент API бэкенда.
+
+Один httpx.AsyncClient на процесс держит keep-alive соединения, поэтому
+обработчики не открывают новое соединение на каждый запрос и не блокируют
+event loop бота. Повторы с экспоненциальной задержкой сглаживают сбои
+бэкенда, а семафор ограничивает число одновременных запросов.
+
+Повторяются только идемпотентные методы и запросы с заголовком
+Idempotency-Key. Прочие запросы повторяются, лишь когда бэкенд их точно
+не выполнял: соединение не установлено или ответ 429 (лимит запросов).
+"""
+import asyncio
+import logging
+import os
+import random
+from typing import Any, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+API_URL = os.getenv("API_URL", "http://localhost:8000").rstrip("/")
+API_BASE = f"{API_URL}/api"
+
+# Ответы, после которых имеет смысл повторить запрос
+RETRY_STATUSES = {429, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# Запрос не дошел до бэкенда: повторять можно любой
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class ApiClient:
+    """Пул соединений к API с таймаутами, повторами и лимитом параллельности"""
+
+    def __init__(self, base_url: str = API_BASE,
+                 timeout: float = float(os.getenv("API_TIMEOUT", "5")),
+                 max_connections: int = int(os.getenv("API_MAX_CONNECTIONS", "100")),
+                 max_keepalive: int = int(os.getenv("API_MAX_KEEPALIVE", "20")),
+                 retries: int = int(os.getenv("API_RETRIES", "2")),
+                 backoff: float = float(os.getenv("API_BACKOFF", "0.2")),
+                 concurrency: int = int(os.getenv("API_CONCURRENCY", "50")),
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.base_url = base_url
+        self.retries = retries
+        self.backoff = backoff
+        self._limits = httpx.Limits(max_connections=max_connections,
+                                    max_keepalive_connections=max_keepalive)
+        self._timeout = httpx.Timeout(timeout, connect=min(timeout, 3.0))
+        self._transport = transport
+        self._concurrency = concurrency
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self._timeout,
+                limits=self._limits,
+                transport=self._transport,
+            )
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+        return self._client
+
+    def _delay(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        if response is not None and "Retry-After" in response.headers:
+            try:
+                return float(response.headers["Retry-After"])
+            except ValueError:
+                pass
+        # Экспоненциальная задержка с джиттером, чтобы повторы не шли волной
+        return self.backoff * (2 ** attempt) * (0.5 + random.random())
+
+    async def request(self, method: str, path: str, **kwargs: Any) -> httpx.Response:
+        """Запрос к API с повторами при сетевых ошибках и 429/5xx, если повтор безопасен"""
+        client = self._get_client()
+        headers = kwargs.get("headers") or {}
+        safe = method.upper() in IDEMPOTENT_METHODS or any(name.lower() == "idempotency-key" for name in headers)
+        statuses = RETRY_STATUSES if safe else {429}
+        for attempt in range(self.retries + 1):
+            response = None
+            try:
+                async with self._semaphore:
+                    response = await client.request(method, path, **kwargs)
+                if response.status_code not in statuses or attempt == self.retries:
+                    return response
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                if attempt == self.retries or not (safe or isinstance(e, NOT_SENT_ERRORS)):
+                    raise
+                logger.warning(f"API {method} {path} failed ({e!r}), retrying")
+            await asyncio.sleep(self._delay(attempt, response))
+        raise RuntimeError("unreachable")
+
+    async def get(self, path: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("POST", path, **kwargs)
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# Общий клиент для всех обработчиков
+api_client = ApiClient()
@@ -0,0 +1,133 @@
+# telegram-bot/bot/cache.py
+"""Кэш ответов API в боте.
+
+Записи живут ttl секунд и вытесняются по LRU, когда их больше max_size.
+Одновременные одинаковые запросы ждут один общий вызов бэкенда, а
+устаревшая запись с ETag перепроверяется условным запросом: ответ 304
+продлевает ее без передачи тела. Запросы, меняющие состояние на
+бэкенде, идут через post() и сбрасывают записи затронутых путей.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, NamedTuple, Optional, Tuple
+
+import httpx
+
+from bot.api_client import ApiClient, api_client
+
+
+class CacheEntry(NamedTuple):
+    status: int
+    data: Any
+    etag: Optional[str]
+    expires_at: float
+
+
+class ResponseCache:
+    """TTL + LRU кэш JSON-ответов с объединением одинаковых запросов"""
+
+    def __init__(self, client: ApiClient = api_client,
+                 ttl: float = float(os.getenv("BOT_CACHE_TTL", "30")),
+                 max_size: int = int(os.getenv("BOT_CACHE_SIZE", "5000"))):
+        self.client = client
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # Растет при каждом сбросе: ответ, запрошенный до сброса, не сохраняется
+        self._generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+
+    @staticmethod
+    def _key(path: str, params: Optional[dict]) -> str:
+        if not params:
+            return path
+        return path + "?" + "&".join(f"{k}={v}" for k, v in sorted(params.items()))
+
+    def invalidate(self, path: str, params: Optional[dict] = None) -> None:
+        """Сбросить запись; без params - все записи пути с любыми параметрами"""
+        self._generation += 1
+        if params:
+            keys = [self._key(path, params)]
+        else:
+            keys = [key for key in {*self._entries, *self._inflight} if key == path or key.startswith(path + "?")]
+        for key in keys:
+            self._entries.pop(key, None)
+            # Следующий запрос не присоединяется к вызову, начатому до сброса
+            self._inflight.pop(key, None)
+
+    async def post(self, path: str, invalidates: Iterable[str] = (), **kwargs: Any) -> httpx.Response:
+        """POST к API, после которого записи путей invalidates устарели.
+
+        Сбрасываются и при ошибке: бэкенд мог успеть выполнить запрос.
+        """
+        try:
+            return await self.client.post(path, **kwargs)
+        finally:
+            for stale in invalidates:
+                self.invalidate(stale)
+
+    def _store(self, key: str, entry: CacheEntry) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def _fetch(self, key: str, path: str, params: Optional[dict],
+                     ttl: float, stale: Optional[CacheEntry]) -> Tuple[int, Any]:
+        headers = {"If-None-Match": stale.etag} if stale is not None and stale.etag else {}
+        generation = self._generation
+        response = await self.client.get(path, params=params, headers=headers)
+        current = generation == self._generation
+
+        if response.status_code == 304 and stale is not None:
+            self.revalidated += 1
+            if current:
+                self._store(key, stale._replace(expires_at=time.monotonic() + ttl))
+            return stale.status, stale.data
+
+        data = response.json() if response.status_code == 200 else None
+        if response.status_code == 200 and current:
+            self._store(key, CacheEntry(200, data, response.headers.get("ETag"), time.monotonic() + ttl))
+        return response.status_code, data
+
+    async def get_json(self, path: str, params: Optional[dict] = None,
+                       ttl: Optional[float] = None) -> Tuple[int, Any]:
+        """(status, json) из кэша или одним общим запросом к API"""
+        key = self._key(path, params)
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at > time.monotonic():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.status, entry.data
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.hits += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self._fetch(key, path, params, self.ttl if ttl is None else ttl, entry)
+        except BaseException as exc:
+            future.set_exception(exc)
+            # Ошибку получит вызывающий, ожидающие - через future
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+
+# Общий кэш ответов для обработчиков
+response_cache = ResponseCache()
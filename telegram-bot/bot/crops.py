@@ -0,0 +1,8 @@
+"""Каталог культур из shared/constants/crops.py.
+
+Каталог общий с бэкендом: shared ставится пакетом farmers-dream-shared
+(строка -e ../shared в requirements.txt).
+"""
+from shared.constants.crops import Crop, CropRegistry, crops
+
+__all__ = ["Crop", "CropRegistry", "crops"]
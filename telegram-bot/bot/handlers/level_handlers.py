@@ -2,46 +2,63 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, CommandHandler, CallbackQueryHandler
 import logging
-import requests
 from typing import Dict
 
+from bot.cache import response_cache
+from bot.crops import crops
+
+# Сколько секунд бот не перезапрашивает уровень и таблицу лидеров
+LEVEL_TTL = 15
+LEADERBOARD_TTL = 30
+
 logger = logging.getLogger(__name__)
 
 
+async def _level_view(user_id: int):
+    """Текст и кнопки информации об уровне или None, если API не ответил"""
+    status, data = await response_cache.get_json(f"/levels/info/{user_id}", ttl=LEVEL_TTL)
+    if status != 200:
+        return None
+
+    message = (
+        f"🏆 <b>Уровень {data['current_level']}</b>\n\n"
+        f"✨ XP: {data['current_xp']} / {data['current_xp'] + data['next_level_xp']}\n"
+        f"📊 Прогресс: {data['progress_percentage']}%\n"
+        f"⭐ Всего XP: {data['total_xp']}\n\n"
+    )
+
+    # Показываем награды следующего уровня
+    if data['next_level_rewards']:
+        message += "<b>Награды за следующий уровень:</b>\n"
+        for reward_type, value in data['next_level_rewards'].items():
+            icons = {"coins": "🪙", "diamonds": "💎", "seeds": "🌱"}
+            message += f"{icons.get(reward_type, '🎁')} {value}\n"
+
+    # Культуры: открытые сейчас и те, что откроются на следующем уровне
+    unlocked = crops.unlocked(data['current_level'])
+    message = message.rstrip("\n") + "\n\n🌱 <b>Культуры:</b> " + ", ".join(crop.title for crop in unlocked) + "\n"
+    upcoming = crops.unlocked_at(data['current_level'] + 1)
+    if upcoming:
+        message += "🔒 На следующем уровне: " + ", ".join(crop.title for crop in upcoming) + "\n"
+
+    # Кнопки
+    keyboard = [
+        [
+            InlineKeyboardButton("📈 Лидеры", callback_data="leaderboard"),
+            InlineKeyboardButton("🎮 В игру", callback_data="play_game")
+        ]
+    ]
+    return message, InlineKeyboardMarkup(keyboard)
+
+
 async def level_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /level - показать уровень игрока"""
     user = update.effective_user
 
     try:
-        # Запрос к API для получения информации об уровне
-        response = requests.get(f"{API_BASE}/levels/info/{user.id}")
-
-        if response.status_code == 200:
-            data = response.json()
-
-            message = (
-                f"🏆 <b>Уровень {data['current_level']}</b>\n\n"
-                f"✨ XP: {data['current_xp']} / {data['current_xp'] + data['next_level_xp']}\n"
-                f"📊 Прогресс: {data['progress_percentage']}%\n"
-                f"⭐ Всего XP: {data['total_xp']}\n\n"
-            )
-
-            # Показываем награды следующего уровня
-            if data['next_level_rewards']:
-                message += "<b>Награды за следующий уровень:</b>\n"
-                for reward_type, value in data['next_level_rewards'].items():
-                    icons = {"coins": "🪙", "diamonds": "💎", "seeds": "🌱"}
-                    message += f"{icons.get(reward_type, '🎁')} {value}\n"
-
-            # Кнопки
-            keyboard = [
-                [
-                    InlineKeyboardButton("📈 Лидеры", callback_data="leaderboard"),
-                    InlineKeyboardButton("🎮 В игру", callback_data="play_game")
-                ]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-
+        view = await _level_view(user.id)
+        if view is not None:
+            message, reply_markup = view
             await update.message.reply_html(message, reply_markup=reply_markup)
         else:
             await update.message.reply_text("❌ Не удалось загрузить информацию об уровне.")
@@ -57,10 +74,10 @@ async def leaderboard_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     await query.answer()
 
     try:
-        response = requests.get(f"{API_BASE}/levels/leaderboard?limit=10")
+        status, data = await response_cache.get_json(
+            "/levels/leaderboard", params={"limit": 10}, ttl=LEADERBOARD_TTL)
 
-        if response.status_code == 200:
-            data = response.json()
+        if status == 200:
             leaderboard = data.get('leaderboard', [])
 
             message = "🏆 <b>Топ фермеров</b>\n\n"
@@ -89,7 +106,18 @@ async def back_to_level_callback(update: Update, context: ContextTypes.DEFAULT_T
     """Вернуться к информации об уровне"""
     query = update.callback_query
     await query.answer()
-    await level_command(update, context)
+
+    try:
+        view = await _level_view(update.effective_user.id)
+        if view is not None:
+            message, reply_markup = view
+            await query.edit_message_text(message, parse_mode='HTML', reply_markup=reply_markup)
+        else:
+            await query.edit_message_text("❌ Не удалось загрузить информацию об уровне.")
+
+    except Exception as e:
+        logger.error(f"Error in back to level: {e}")
+        await query.edit_message_text("⚠️ Произошла ошибка.")
 
 
 def setup_handlers(application):
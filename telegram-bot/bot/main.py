@@ -1,7 +1,12 @@
 # telegram-bot/bot/main.py (дополнение)
 import logging
+import os
 from telegram.ext import Application
-from handlers import game_handlers, level_handlers  # Добавить level_handlers
+from bot.api_client import api_client
+from bot.notifications import HarvestNotifier
+from bot.handlers import game_handlers, level_handlers  # Добавить level_handlers
+
+BOT_TOKEN = os.getenv("BOT_TOKEN")
 
 # Настройка логирования
 logging.basicConfig(
@@ -10,9 +15,30 @@ logging.basicConfig(
 )
 
 
+async def start_notifier(application: Application):
+    """Запустить рассылку уведомлений о созревшем урожае"""
+    application.bot_data["harvest_notifier"] = HarvestNotifier(application)
+    application.bot_data["harvest_notifier"].start()
+
+
+async def close_api_client(application: Application):
+    """Остановить рассылку и закрыть пул соединений к API"""
+    notifier = application.bot_data.get("harvest_notifier")
+    if notifier is not None:
+        await notifier.stop()
+    await api_client.close()
+
+
 def main():
     """Запуск бота"""
-    application = Application.builder().token(BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(True)  # Обработчики не ждут друг друга
+        .post_init(start_notifier)
+        .post_shutdown(close_api_client)
+        .build()
+    )
 
     # Регистрация обработчиков
     game_handlers.setup_handlers(application)
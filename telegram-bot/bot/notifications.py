@@ -0,0 +1,122 @@
+# telegram-bot/bot/notifications.py
+"""Рассылка уведомлений "урожай созрел".
+
+Бэкенд копит созревшие клетки, сгруппированные по игрокам, а бот
+забирает их пакетами и отправляет с учетом лимитов Telegram: не больше
+одного сообщения в секунду в один чат и около 30 сообщений в секунду
+всего.
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import Dict
+
+from telegram.error import Forbidden, RetryAfter, TelegramError
+from telegram.ext import Application
+
+from bot.cache import response_cache
+from bot.crops import crops
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Глобальный лимит сообщений в секунду и минимальный интервал на чат"""
+
+    def __init__(self, per_second: float = 25.0, per_chat_interval: float = 1.0):
+        self.interval = 1.0 / per_second
+        self.per_chat_interval = per_chat_interval
+        self._next_global = 0.0
+        self._next_chat: Dict[int, float] = {}
+        self._lock = asyncio.Lock()
+
+    async def wait(self, chat_id: int) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            at = max(now, self._next_global, self._next_chat.get(chat_id, 0.0))
+            self._next_global = at + self.interval
+            self._next_chat[chat_id] = at + self.per_chat_interval
+            # Старые отметки чатов больше не ограничивают, не храним их
+            if len(self._next_chat) > 10000:
+                self._next_chat = {cid: t for cid, t in self._next_chat.items() if t > now}
+        if at > now:
+            await asyncio.sleep(at - now)
+
+
+def _title(name: str) -> str:
+    crop = crops.get(name)
+    return crop.title if crop is not None else name
+
+
+def harvest_message(harvested: Dict[str, int]) -> str:
+    lines = [f"• {_title(crop)}: {count}" for crop, count in harvested.items()]
+    return "🌾 <b>Урожай созрел!</b>\n\n" + "\n".join(lines) + "\n\nЗагляните на ферму, чтобы собрать его."
+
+
+class HarvestNotifier:
+    """Цикл: забрать пакет уведомлений у API и разослать их"""
+
+    def __init__(self, application: Application,
+                 batch_size: int = int(os.getenv("NOTIFY_BATCH_SIZE", "100")),
+                 poll_interval: float = float(os.getenv("NOTIFY_POLL_INTERVAL", "10")),
+                 limiter: RateLimiter = None):
+        self.application = application
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.limiter = limiter or RateLimiter()
+        self._task = None
+
+    async def _send(self, user_id: int, harvested: Dict[str, int]) -> None:
+        await self.limiter.wait(user_id)
+        try:
+            await self.application.bot.send_message(user_id, harvest_message(harvested), parse_mode="HTML")
+        except RetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+            await self.application.bot.send_message(user_id, harvest_message(harvested), parse_mode="HTML")
+        except Forbidden:
+            # Пользователь заблокировал бота - молча пропускаем
+            pass
+
+    async def run_once(self) -> int:
+        # Ключ на пакет: повтор после обрыва связи получит тот же пакет, а не следующий
+        headers = {"Idempotency-Key": uuid.uuid4().hex}
+        if os.getenv("INTERNAL_API_TOKEN"):
+            headers["X-Internal-Token"] = os.environ["INTERNAL_API_TOKEN"]
+        # Забранные уведомления меняют только очередь на бэкенде: кэшированных путей она не затрагивает
+        response = await response_cache.post("/notifications/ripe/claim", invalidates=(),
+                                              params={"limit": self.batch_size}, headers=headers)
+        if response.status_code != 200:
+            logger.warning(f"Ripe notifications claim failed: {response.status_code}")
+            return 0
+
+        notifications = response.json().get("notifications", [])
+        results = await asyncio.gather(
+            *[self._send(item["user_id"], item["crops"]) for item in notifications],
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, TelegramError):
+                logger.error(f"Harvest notification failed: {result}")
+        return len(notifications)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                sent = await self.run_once()
+            except Exception as e:
+                logger.error(f"Harvest notifier error: {e}")
+                sent = 0
+            # Полный пакет - скорее всего есть еще, забираем сразу
+            if sent < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None